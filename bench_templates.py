@@ -0,0 +1,39 @@
+"""Micro-benchmark: compiled, memoized template rendering vs. str.format.
+
+Run with `python bench_templates.py [iterations]`.
+"""
+import sys
+import timeit
+
+from ai_service import AICodeGenerator
+
+PARAMS = {"color": "ff0000"}
+
+
+def per_op(fn, iterations: int) -> float:
+    return min(timeit.repeat(fn, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def main(iterations: int = 20000):
+    generator = AICodeGenerator()
+    sources = AICodeGenerator._load_templates()
+    params = {**AICodeGenerator.TEMPLATE_DEFAULTS, **PARAMS}
+
+    print(f"{'template':28s} {'str.format':>12s} {'compiled':>12s} {'speedup':>8s}")
+    total_format = total_compiled = 0.0
+    for language, group in sources.items():
+        for name, source in group.items():
+            # Output must be identical to the str.format path before timing anything
+            assert generator.render_template(language, name, **PARAMS) == source.format(**params)
+            formatted = per_op(lambda: source.format(**params), iterations)
+            compiled = per_op(lambda: generator.render_template(language, name, **PARAMS), iterations)
+            total_format += formatted
+            total_compiled += compiled
+            print(f"{language + '/' + name:28s} {formatted:9.2f} us {compiled:9.2f} us {formatted / compiled:7.1f}x")
+    print(f"{'all templates':28s} {total_format:9.2f} us {total_compiled:9.2f} us "
+          f"{total_format / total_compiled:7.1f}x")
+    print(f"{'construct AICodeGenerator':28s} {per_op(AICodeGenerator, iterations):21.2f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,462 @@
+import base64
+import bisect
+import json
+import logging
+import math
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from caching import LRUCache
+from product_search import SemanticIndex, product_tokens
+
+logger = logging.getLogger(__name__)
+
+# === Use Case → Category Expansion ===
+CATEGORY_MAP = {
+    "robotics": ["microcontroller", "sensors"],
+    "iot": ["sensors", "boards"],
+    "ai": ["gpu", "computer"],
+    "gaming": ["computer", "graphics"],
+    "learning": ["kits", "tools"]
+}
+
+# category -> use cases that expand to it, indexed as extra search words
+CATEGORY_ALIASES: Dict[str, List[str]] = {}
+for _use_case, _categories in CATEGORY_MAP.items():
+    for _category in _categories:
+        CATEGORY_ALIASES.setdefault(_category, []).append(_use_case)
+
+# Free-text use case -> matched rows, reused across budgets and spec filters
+SEMANTIC_MEMO_BYTES = 8 * 1024 * 1024
+
+NGRAM = 3
+EMPTY = np.empty(0, dtype=np.int64)
+CHUNK_ROWS = 4096
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def normalize_specs(preferred_specs: Optional[Dict]) -> List[Tuple[str, str]]:
+    """Requested specs as (key, lowercased value) pairs"""
+    return [(k, str(v).lower()) for k, v in (preferred_specs or {}).items()]
+
+
+def product_id(product: Dict) -> str:
+    return str(product.get("id", ""))
+
+
+# Units are scaled to a common base per family: memory/storage in MB,
+# frequency in MHz. Unknown units keep their bare number.
+UNIT_SCALE = {
+    "kb": 1 / 1024, "mb": 1.0, "gb": 1024.0, "tb": 1024.0 ** 2,
+    "hz": 1e-6, "khz": 1e-3, "mhz": 1.0, "ghz": 1e3
+}
+BOOLEAN_VALUES = {"yes": 1.0, "true": 1.0, "no": 0.0, "false": 0.0}
+_NUMBER_RE = re.compile(r"^\s*([-+]?\d+(?:\.\d+)?)\s*([a-z]*)\s*\+?\s*$")
+
+
+def parse_spec_value(value: str) -> Optional[float]:
+    """Comparable number for spec strings like "4GB", "20+", "1.5 GHz" or "Yes" """
+    text = str(value).strip().lower()
+    if text in BOOLEAN_VALUES:
+        return BOOLEAN_VALUES[text]
+    match = _NUMBER_RE.match(text)
+    if not match:
+        return None
+    number, unit = match.groups()
+    return float(number) * UNIT_SCALE.get(unit, 1.0)
+
+
+def encode_cursor(price: float, pid: str) -> str:
+    """Opaque keyset cursor pointing just past (price, id)"""
+    raw = json.dumps([price, pid], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        price, pid = json.loads(raw)
+        return float(price), str(pid)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class SpecColumn:
+    """Dictionary-encoded spec column with a trigram index over its values"""
+
+    def __init__(self, size: int):
+        self.codes = np.full(size, -1, dtype=np.int32)
+        self.values: List[str] = []
+        self._lookup: Dict[str, int] = {}
+        self.ngrams: Dict[str, List[int]] = {}
+
+    @classmethod
+    def from_parts(cls, codes: np.ndarray, values: Sequence[str], ngrams,
+                   numbers: Optional[np.ndarray] = None) -> "SpecColumn":
+        """Column over prebuilt parts; `ngrams` only needs get(gram, default)"""
+        column = cls.__new__(cls)
+        column.codes = codes
+        column.values = values
+        column._lookup = {}
+        column.ngrams = ngrams
+        if numbers is None:
+            column._parse_numbers()
+        else:
+            column.numbers = numbers
+        return column
+
+    def _parse_numbers(self):
+        # Normalized number per dictionary value, NaN where none applies
+        parsed = (parse_spec_value(v) for v in self.values)
+        self.numbers = np.array([math.nan if n is None else n for n in parsed], dtype=np.float64)
+
+    def encode(self, value: str) -> int:
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self.values)
+            self.values.append(value)
+            for gram in _ngrams(value):
+                self.ngrams.setdefault(gram, []).append(code)
+        return code
+
+    def freeze(self):
+        self.ngrams = {g: np.array(c, dtype=np.int32) for g, c in self.ngrams.items()}
+        self.codes.flags.writeable = False
+        self._parse_numbers()
+
+    def number_at(self, row: int) -> Optional[float]:
+        code = self.codes[row]
+        if code < 0 or math.isnan(self.numbers[code]):
+            return None
+        return float(self.numbers[code])
+
+    def matching_codes(self, needle: str) -> np.ndarray:
+        """Codes of dictionary values containing needle as a substring"""
+        grams = _ngrams(needle)
+        if grams:
+            postings = sorted((self.ngrams.get(g, EMPTY) for g in grams), key=len)
+            candidates = postings[0]
+            for other in postings[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, other, assume_unique=True)
+        else:
+            # Needles shorter than a trigram are checked against every value
+            candidates = range(len(self.values))
+        return np.array([c for c in candidates if needle in self.values[c]], dtype=np.int32)
+
+
+class Catalog:
+    """Read-only columnar product catalog built once at load time"""
+
+    def __init__(self, products: Iterable[Dict], version: int = 0):
+        self.version = version
+        priced, unpriced = [], []
+        for product in products:
+            try:
+                price = float(product["price"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Invalid price format for product: {product.get('name')}")
+                unpriced.append(product)
+                continue
+            priced.append((price, product))
+
+        # Rows are laid out in (price, id) order, so a row's position doubles
+        # as its price rank, results never need resorting and (price, id)
+        # is a stable keyset for pagination.
+        priced.sort(key=lambda p: (p[0], product_id(p[1])))
+        self.prices = np.array([p[0] for p in priced], dtype=np.float64)
+        self.rows: Sequence[Dict] = [p[1] for p in priced]
+        size = len(self.rows)
+        # Every product, indexable rows first; id -> position in this list
+        self.products: Sequence[Dict] = self.rows + unpriced
+        self.id_index: Dict[str, int] = {}
+        for pos, product in enumerate(self.products):
+            self.id_index.setdefault(product_id(product), pos)
+
+        self.category_names: List[str] = []
+        category_lookup: Dict[str, int] = {}
+        self.categories = np.empty(size, dtype=np.int32)
+        self.spec_columns: Dict[str, SpecColumn] = {}
+
+        for pos, product in enumerate(self.rows):
+            category = str(product.get("category", "")).lower()
+            code = category_lookup.get(category)
+            if code is None:
+                code = category_lookup[category] = len(self.category_names)
+                self.category_names.append(category)
+            self.categories[pos] = code
+
+            for key, value in (product.get("specs") or {}).items():
+                column = self.spec_columns.get(key)
+                if column is None:
+                    column = self.spec_columns[key] = SpecColumn(size)
+                column.codes[pos] = column.encode(str(value).lower())
+
+        for column in self.spec_columns.values():
+            column.freeze()
+
+        # category -> row positions, ascending and therefore cheapest first
+        self.category_rows: Dict[str, np.ndarray] = {
+            name: np.flatnonzero(self.categories == code)
+            for name, code in category_lookup.items()
+        }
+        self.semantic = SemanticIndex.build(
+            product_tokens(product, CATEGORY_ALIASES.get(self.category_names[code], ()))
+            for product, code in zip(self.rows, self.categories.tolist())
+        )
+        self._finish()
+
+    @classmethod
+    def from_parts(cls, version: int, products: Sequence[Dict], rows: Sequence[Dict],
+                   prices: np.ndarray, categories: np.ndarray, category_names: List[str],
+                   category_rows: Dict[str, np.ndarray], spec_columns: Dict[str, "SpecColumn"],
+                   id_index, semantic: SemanticIndex) -> "Catalog":
+        """Assemble a catalog from prebuilt columns, e.g. a mapped segment"""
+        catalog = cls.__new__(cls)
+        catalog.version = version
+        catalog.products = products
+        catalog.id_index = id_index
+        catalog.rows = rows
+        catalog.prices = prices
+        catalog.categories = categories
+        catalog.category_names = category_names
+        catalog.category_rows = category_rows
+        catalog.spec_columns = spec_columns
+        catalog.semantic = semantic
+        catalog._finish()
+        return catalog
+
+    def _finish(self):
+        if self.prices.flags.writeable:
+            self.prices.flags.writeable = False
+            self.categories.flags.writeable = False
+
+        # use_case -> categories that actually exist in the catalog
+        self._use_case_categories = {
+            use_case: [c for c in categories if c in self.category_rows]
+            for use_case, categories in CATEGORY_MAP.items()
+        }
+        self._semantic_memo = LRUCache(SEMANTIC_MEMO_BYTES, sizeof=lambda rows: rows.nbytes + 64)
+
+    def categories_for(self, use_case: str) -> List[str]:
+        """Expand a use case into the indexed categories it covers"""
+        use_case = use_case.lower()
+        if use_case in self._use_case_categories:
+            return self._use_case_categories[use_case]
+        return [use_case] if use_case in self.category_rows else []
+
+    def semantic_rows(self, use_case: str) -> np.ndarray:
+        """Ascending row positions nearest to a free-text use case"""
+        key = " ".join(use_case.lower().split())
+        rows = self._semantic_memo.get(key)
+        if rows is LRUCache.MISSING:
+            rows = self.semantic.search(key)
+            self._semantic_memo.set(key, rows)
+        return rows
+
+    def candidate_runs(self, use_case: str) -> List[np.ndarray]:
+        """Ascending row runs a use case draws from: its categories, else a text search"""
+        categories = self.categories_for(use_case)
+        if categories:
+            return [self.category_rows[c] for c in categories]
+        return [self.semantic_rows(use_case)]
+
+    def match_rows(self, budget: float, use_case: str,
+                   wanted: List[Tuple[str, str]]) -> np.ndarray:
+        """Row positions matching budget, use case and normalized specs"""
+        cutoff = np.searchsorted(self.prices, budget, side="right")
+        runs = []
+        for positions in self.candidate_runs(use_case):
+            runs.append(positions[:np.searchsorted(positions, cutoff)])
+        if not runs:
+            return EMPTY
+        if len(runs) == 1:
+            rows = runs[0]
+        else:
+            # Merge category runs through a mask rather than a sort
+            mask = np.zeros(cutoff, dtype=bool)
+            for run in runs:
+                mask[run] = True
+            rows = np.flatnonzero(mask)
+
+        specs = self._spec_filters(wanted)
+        return EMPTY if specs is None else _apply_specs(rows, specs)
+
+    def _spec_filters(self, wanted: List[Tuple[str, str]],
+                      memo: Optional[Dict] = None) -> Optional[List[Tuple[np.ndarray, np.ndarray]]]:
+        """(code column, matching codes) per requested spec; None if unsatisfiable"""
+        filters = []
+        for key, value in wanted:
+            column = self.spec_columns.get(key)
+            if column is None:
+                return None
+            if memo is None:
+                codes = column.matching_codes(value)
+            else:
+                codes = memo.get((key, value))
+                if codes is None:
+                    codes = memo[(key, value)] = column.matching_codes(value)
+            if not len(codes):
+                return None
+            filters.append((column.codes, codes))
+        return filters
+
+    def filter_batch(self, queries: List[Dict]) -> List[List[Dict]]:
+        """Evaluate many recommendation queries with one pass per category set.
+
+        Queries expanding to the same categories (or, for free text, the same
+        normalized use case) share a single merged run,
+        cut at the group's highest budget; each query then takes its own
+        budget prefix of that run and applies its spec masks.
+        """
+        results: List[List[Dict]] = [[] for _ in queries]
+        groups: Dict[Tuple[str, ...], List[Tuple[int, float, List[Tuple[str, str]]]]] = {}
+        for i, query in enumerate(queries):
+            try:
+                budget = float(query["budget"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Invalid budget in batch query {i}: {query.get('budget')}")
+                continue
+            use_case = " ".join(str(query.get("use_case", "")).lower().split())
+            group = tuple(self.categories_for(use_case)) or ("", use_case)
+            wanted = normalize_specs(query.get("preferred_specs"))
+            groups.setdefault(group, []).append((use_case, i, budget, wanted))
+
+        memo: Dict[Tuple[str, str], np.ndarray] = {}
+        for members in groups.values():
+            shared = self.match_rows(max(m[2] for m in members), members[0][0], [])
+            for _, i, budget, wanted in members:
+                specs = self._spec_filters(wanted, memo)
+                if specs is None:
+                    continue
+                cutoff = np.searchsorted(self.prices, budget, side="right")
+                rows = shared[:np.searchsorted(shared, cutoff)]
+                results[i] = self.products_at(_apply_specs(rows, specs))
+        return results
+
+    def iter_rows(self, budget: float, use_case: str, wanted: List[Tuple[str, str]],
+                  start: int = 0, chunk: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+        """Yield matching row positions at or after start, in order, a chunk at a time.
+
+        Each step takes at most `chunk` positions from every candidate run, so
+        memory stays bounded and a caller that stops early never touches the
+        rest of the catalog.
+        """
+        specs = self._spec_filters(wanted)
+        if specs is None:
+            return
+        cutoff = np.searchsorted(self.prices, budget, side="right")
+        runs = []
+        for positions in self.candidate_runs(use_case):
+            lo = np.searchsorted(positions, start)
+            hi = np.searchsorted(positions, cutoff)
+            if lo < hi:
+                runs.append(positions[lo:hi])
+
+        while runs:
+            # Everything up to the smallest chunk end is complete in every run
+            bound = min(run[min(chunk, len(run)) - 1] for run in runs)
+            parts, remaining = [], []
+            for run in runs:
+                split = np.searchsorted(run, bound, side="right")
+                parts.append(run[:split])
+                if split < len(run):
+                    remaining.append(run[split:])
+            runs = remaining
+            rows = parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+            rows = _apply_specs(rows, specs)
+            if len(rows):
+                yield rows
+
+    def position_after(self, price: float, pid: str) -> int:
+        """First row position ordered strictly after (price, id)"""
+        lo = int(np.searchsorted(self.prices, price, side="left"))
+        hi = int(np.searchsorted(self.prices, price, side="right"))
+        return bisect.bisect_right(self.rows, pid, lo, hi, key=product_id)
+
+    def page(self, budget, use_case: str, preferred_specs: Optional[Dict] = None,
+             limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Top `limit` matches after an optional cursor, plus the next cursor"""
+        budget = float(budget)
+        start = self.position_after(*decode_cursor(cursor)) if cursor else 0
+        picked = []
+        for rows in self.iter_rows(budget, use_case,
+                                   normalize_specs(preferred_specs), start):
+            # Take one extra row to learn whether another page exists
+            picked.extend(rows[:limit + 1 - len(picked)].tolist())
+            if len(picked) > limit:
+                break
+
+        products = [self.rows[i] for i in picked[:limit]]
+        next_cursor = None
+        if len(picked) > limit:
+            last = picked[limit - 1]
+            next_cursor = encode_cursor(float(self.prices[last]), product_id(self.rows[last]))
+        return products, next_cursor
+
+    def stream(self, budget, use_case: str, preferred_specs: Optional[Dict] = None) -> Iterator[Dict]:
+        """Yield every match cheapest first without materializing the result"""
+        for rows in self.iter_rows(float(budget), use_case,
+                                   normalize_specs(preferred_specs)):
+            for i in rows.tolist():
+                yield self.rows[i]
+
+    def filter(self, budget, use_case: str, preferred_specs: Optional[Dict] = None) -> List[Dict]:
+        """Return products within budget for a use case, cheapest first"""
+        try:
+            budget = float(budget)
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid budget: {budget}")
+            return []
+
+        rows = self.match_rows(budget, use_case, normalize_specs(preferred_specs))
+        return self.products_at(rows)
+
+    def products_at(self, rows: np.ndarray) -> List[Dict]:
+        return [self.rows[i] for i in rows.tolist()]
+
+    def get(self, pid) -> Optional[Dict]:
+        """Product by id, or None"""
+        position = self.id_index.get(str(pid))
+        return None if position is None else self.products[position]
+
+    def spec_vector(self, position: int, product: Dict) -> Dict[str, Optional[float]]:
+        """Normalized spec numbers for the product at a position"""
+        specs = product.get("specs") or {}
+        if position >= len(self.rows):
+            return {key: parse_spec_value(value) for key, value in specs.items()}
+        return {key: self.spec_columns[key].number_at(position) for key in specs}
+
+    def compare(self, product_ids: List) -> Dict:
+        """Side-by-side products with a normalized spec matrix"""
+        products, vectors, missing = [], [], []
+        for pid in product_ids:
+            position = self.id_index.get(str(pid))
+            if position is None:
+                missing.append(pid)
+                continue
+            product = self.products[position]
+            products.append(product)
+            vectors.append(self.spec_vector(position, product))
+
+        spec_keys = list(dict.fromkeys(key for vector in vectors for key in vector))
+        return {
+            "comparison": products,
+            "spec_keys": spec_keys,
+            "matrix": {key: [vector.get(key) for vector in vectors] for key in spec_keys},
+            "missing": missing
+        }
+
+
+def _apply_specs(rows: np.ndarray, specs: List[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    for column, codes in specs:
+        if not len(rows):
+            break
+        rows = rows[np.isin(column[rows], codes)]
+    return rows
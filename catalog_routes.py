@@ -0,0 +1,42 @@
+import click
+from flask import Blueprint, jsonify, current_app
+from flask_jwt_extended import jwt_required
+
+from product_db import IMPORT_BATCH_SIZE, import_products
+
+# Catalog operations routes; the live CatalogStore is registered on the app
+# under app.extensions["catalog_store"]
+catalog_bp = Blueprint('catalog', __name__, url_prefix='/catalog')
+
+
+def get_catalog_store():
+    return current_app.extensions["catalog_store"]
+
+
+# --- Catalog Status ---
+@catalog_bp.route("/status", methods=["GET"])
+def status():
+    stats = get_catalog_store().stats()
+    cache = current_app.extensions.get("recommend_cache")
+    if cache is not None:
+        stats["recommend_cache"] = cache.stats()
+    return jsonify(stats), 200
+
+
+# --- Force Reload ---
+@catalog_bp.route("/reload", methods=["POST"])
+@jwt_required()
+def reload_catalog():
+    store = get_catalog_store()
+    if not store.reload():
+        return jsonify({"error": store.last_error, **store.stats()}), 500
+    return jsonify(store.stats()), 200
+
+
+# --- Bulk Import (flask catalog import products.json) ---
+@catalog_bp.cli.command("import")
+@click.argument("path", default="products.json")
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+def import_command(path, batch_size):
+    """Load a products.json file into the shared products table"""
+    click.echo(f"Imported {import_products(path, batch_size)} products from {path}")
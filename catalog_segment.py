@@ -0,0 +1,232 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from collections.abc import Sequence
+from typing import List, Optional
+
+import numpy as np
+
+from catalog import Catalog, SpecColumn
+from product_search import SemanticIndex
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer deployments only
+    fcntl = None
+
+# Segments are read-only directories of .npy arrays and a JSON-lines product
+# blob. Every worker maps the same files, so the page cache holds one copy of
+# the catalog no matter how many processes attach to it.
+POINTER_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+KEEP_SEGMENTS = 3
+
+
+class ProductBlob(Sequence):
+    """Lazily decoded products stored as JSON lines in a mapped file"""
+
+    def __init__(self, path: str, offsets: np.ndarray, count: Optional[int] = None):
+        with open(path, "rb") as f:
+            empty = os.fstat(f.fileno()).st_size == 0
+            self._data = b"" if empty else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = offsets
+        self._count = len(offsets) - 1 if count is None else count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return json.loads(self._data[self._offsets[index]:self._offsets[index + 1]])
+
+
+class SortedIdIndex:
+    """Product id -> position lookup over mapped sorted arrays"""
+
+    def __init__(self, keys: np.ndarray, positions: np.ndarray):
+        self._keys = keys
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, pid: str, default=None):
+        i = int(np.searchsorted(self._keys, pid))
+        if i < len(self._keys) and self._keys[i] == pid:
+            return int(self._positions[i])
+        return default
+
+
+class MappedNgramIndex:
+    """Trigram -> spec value codes over mapped arrays: sorted grams and their postings back to back"""
+
+    def __init__(self, grams: np.ndarray, offsets: np.ndarray, codes: np.ndarray):
+        self._grams = grams
+        self._offsets = offsets
+        self._codes = codes
+
+    def __len__(self):
+        return len(self._grams)
+
+    def get(self, gram: str, default=None):
+        i = int(np.searchsorted(self._grams, gram))
+        if i < len(self._grams) and self._grams[i] == gram:
+            return self._codes[self._offsets[i]:self._offsets[i + 1]]
+        return default
+
+
+def _save(segment: str, name: str, array: np.ndarray):
+    np.save(os.path.join(segment, f"{name}.npy"), np.ascontiguousarray(array))
+
+
+def _load(segment: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(segment, f"{name}.npy"), mmap_mode="r")
+
+
+def write_segment(catalog: Catalog, root: str, source: Optional[List[int]] = None) -> str:
+    """Write a catalog snapshot to a new segment directory under root"""
+    os.makedirs(root, exist_ok=True)
+    segment = tempfile.mkdtemp(prefix=".building-", dir=root)
+    try:
+        # Products are already ordered priced rows first, then unpriced ones
+        ordered = catalog.products
+        offsets = np.zeros(len(ordered) + 1, dtype=np.int64)
+        with open(os.path.join(segment, "products.jsonl"), "wb") as f:
+            for i, product in enumerate(ordered):
+                line = json.dumps(product, separators=(",", ":")).encode() + b"\n"
+                f.write(line)
+                offsets[i + 1] = offsets[i] + len(line)
+        _save(segment, "offsets", offsets)
+        ids = sorted(catalog.id_index.items())
+        _save(segment, "id_keys", np.array([pid for pid, _ in ids], dtype=str))
+        _save(segment, "id_positions", np.array([pos for _, pos in ids], dtype=np.int64))
+        _save(segment, "prices", catalog.prices)
+        _save(segment, "categories", catalog.categories)
+        for i, name in enumerate(catalog.category_names):
+            _save(segment, f"category_rows_{i}", catalog.category_rows[name])
+
+        _save(segment, "semantic_idf", catalog.semantic.idf)
+        _save(segment, "semantic_offsets", catalog.semantic.offsets)
+        _save(segment, "semantic_rows", catalog.semantic.rows)
+        _save(segment, "semantic_weights", catalog.semantic.weights)
+
+        # Spec dictionaries and their trigram index are arrays too, so no
+        # worker decodes them into its own heap
+        spec_meta = []
+        for i, (key, column) in enumerate(catalog.spec_columns.items()):
+            _save(segment, f"spec_{i}", column.codes)
+            _save(segment, f"spec_{i}_values", np.array(column.values, dtype=str))
+            _save(segment, f"spec_{i}_numbers", column.numbers)
+            grams = sorted(column.ngrams)
+            offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(column.ngrams[g]) for g in grams])
+            _save(segment, f"spec_{i}_grams", np.array(grams, dtype=str))
+            _save(segment, f"spec_{i}_gram_offsets", offsets)
+            _save(segment, f"spec_{i}_gram_codes",
+                  np.concatenate([column.ngrams[g] for g in grams]) if grams else np.empty(0, dtype=np.int32))
+            spec_meta.append({"key": key})
+
+        meta = {
+            "version": catalog.version,
+            "rows": len(catalog.rows),
+            "products": len(ordered),
+            "category_names": catalog.category_names,
+            "specs": spec_meta,
+            "source": source
+        }
+        with open(os.path.join(segment, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        final = os.path.join(root, f"v{catalog.version}-{os.path.basename(segment)[len('.building-'):]}")
+        os.rename(segment, final)
+        return final
+    except Exception:
+        shutil.rmtree(segment, ignore_errors=True)
+        raise
+
+
+def attach_segment(segment: str) -> Catalog:
+    """Map a segment read-only and wrap it as a Catalog without copying"""
+    with open(os.path.join(segment, "meta.json")) as f:
+        meta = json.load(f)
+    offsets = _load(segment, "offsets")
+    blob_path = os.path.join(segment, "products.jsonl")
+    spec_columns = {
+        spec["key"]: SpecColumn.from_parts(
+            _load(segment, f"spec_{i}"),
+            _load(segment, f"spec_{i}_values"),
+            MappedNgramIndex(_load(segment, f"spec_{i}_grams"), _load(segment, f"spec_{i}_gram_offsets"),
+                             _load(segment, f"spec_{i}_gram_codes")),
+            numbers=_load(segment, f"spec_{i}_numbers")
+        )
+        for i, spec in enumerate(meta["specs"])
+    }
+    catalog = Catalog.from_parts(
+        version=meta["version"],
+        products=ProductBlob(blob_path, offsets),
+        rows=ProductBlob(blob_path, offsets, count=meta["rows"]),
+        prices=_load(segment, "prices"),
+        categories=_load(segment, "categories"),
+        category_names=meta["category_names"],
+        category_rows={name: _load(segment, f"category_rows_{i}")
+                       for i, name in enumerate(meta["category_names"])},
+        spec_columns=spec_columns,
+        id_index=SortedIdIndex(_load(segment, "id_keys"), _load(segment, "id_positions")),
+        semantic=SemanticIndex(_load(segment, "semantic_idf"), _load(segment, "semantic_offsets"),
+                               _load(segment, "semantic_rows"), _load(segment, "semantic_weights"))
+    )
+    catalog.segment = segment
+    catalog.source = meta.get("source")
+    return catalog
+
+
+def read_pointer(root: str) -> Optional[str]:
+    """Segment directory currently published under root, if any"""
+    try:
+        with open(os.path.join(root, POINTER_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, name) if name else None
+
+
+def publish(root: str, segment: str):
+    """Atomically point root/CURRENT at segment and prune old segments"""
+    fd, tmp = tempfile.mkstemp(prefix=".pointer-", dir=root)
+    with os.fdopen(fd, "w") as f:
+        f.write(os.path.basename(segment))
+    os.replace(tmp, os.path.join(root, POINTER_FILE))
+
+    # Workers that still map an older segment keep it alive until they swap
+    segments = sorted(
+        (d for d in os.listdir(root) if d.startswith("v") and os.path.isdir(os.path.join(root, d))),
+        key=lambda d: os.stat(os.path.join(root, d)).st_mtime_ns
+    )
+    for name in segments[:-KEEP_SEGMENTS]:
+        if name != os.path.basename(segment):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+@contextmanager
+def writer_lock(root: str):
+    """Serialize segment builds across worker processes"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from catalog import Catalog
+from catalog_segment import attach_segment, publish, read_pointer, write_segment, writer_lock
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 16
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def iter_products(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """Yield products from a top-level JSON array one object at a time.
+
+    Only the current read chunk and the object being decoded are held in
+    memory, so the file is never materialized as a whole string.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buf = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            # Skip whitespace and separators between array items
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if not started and pos < len(buf):
+                if buf[pos] != "[":
+                    raise ValueError(f"{path}: expected a JSON array of products")
+                started = True
+                pos += 1
+                continue
+            if started and pos < len(buf) and buf[pos] == "]":
+                return
+
+            if pos < len(buf):
+                try:
+                    product, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    # A value running to the end of the buffer may be cut short
+                    if end < len(buf) or eof:
+                        yield product
+                        pos = end
+                        continue
+
+            if eof:
+                if not started:
+                    raise ValueError(f"{path}: expected a JSON array of products")
+                raise ValueError(f"{path}: unterminated JSON array")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+def process_peak_rss_bytes() -> Optional[int]:
+    """Memory high-water mark of the whole process (not of a reload), if the platform reports one"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class CatalogStore:
+    """Holds the live catalog snapshot and swaps in new versions on change"""
+
+    def __init__(self, path: str, poll_interval: float = 2.0, segment_dir: Optional[str] = None):
+        self.path = path
+        self.poll_interval = poll_interval
+        # When set, snapshots are published as memory-mapped segments shared
+        # by every worker process instead of being built per process
+        self.segment_dir = segment_dir
+        self.current = Catalog([], version=0)
+        self.last_reload_seconds = None
+        self.last_reload_at = None
+        self.last_error = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.reload()
+
+    def _stat_signature(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def reload(self) -> bool:
+        """Parse the catalog file into a new snapshot and swap it in"""
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                signature = self._stat_signature()
+            except FileNotFoundError:
+                self.last_error = "Products file not found"
+                logger.error(f"{self.last_error}: {self.path}")
+                return False
+
+            try:
+                if self.segment_dir:
+                    snapshot = self._load_shared(signature)
+                else:
+                    snapshot = Catalog(iter_products(self.path), version=self.current.version + 1)
+            except Exception as e:
+                # Keep serving the previous snapshot until the file changes again
+                self._signature = signature
+                self.last_error = f"Failed to load products: {type(e).__name__}"
+                logger.error(f"Failed to load products from {self.path}: {e}")
+                return False
+
+            # In-flight requests keep whichever snapshot they already read
+            self.current = snapshot
+            self._signature = signature
+            self.last_error = None
+            self.last_reload_seconds = time.perf_counter() - started
+            self.last_reload_at = time.time()
+            logger.info(f"Loaded catalog v{snapshot.version}: {len(snapshot.products)} products "
+                        f"in {self.last_reload_seconds:.3f}s")
+            return True
+
+    def _load_shared(self, signature) -> Catalog:
+        """Attach the published segment, building it first if it is stale"""
+        with writer_lock(self.segment_dir):
+            segment = read_pointer(self.segment_dir)
+            published = None
+            if segment:
+                try:
+                    published = attach_segment(segment)
+                except Exception as e:
+                    logger.warning(f"Ignoring unreadable catalog segment {segment}: {e}")
+            if published is not None and published.source == list(signature):
+                return published
+
+            # This process won the lock and the file changed: build for everyone
+            version = max(self.current.version, published.version if published else 0) + 1
+            catalog = Catalog(iter_products(self.path), version=version)
+            segment = write_segment(catalog, self.segment_dir, source=list(signature))
+            publish(self.segment_dir, segment)
+        return attach_segment(segment)
+
+    def check_for_changes(self) -> bool:
+        """Reload if the catalog file or the published segment changed"""
+        try:
+            signature = self._stat_signature()
+        except OSError:
+            return False
+        if signature != self._signature:
+            return self.reload()
+        if self.segment_dir:
+            segment = read_pointer(self.segment_dir)
+            if segment and segment != getattr(self.current, "segment", None):
+                return self.reload()
+        return False
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.check_for_changes()
+
+    def watch(self):
+        """Start polling the catalog file from a daemon thread"""
+        if self._watcher is None and self.poll_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+            self._watcher.start()
+
+    def stats(self) -> Dict:
+        snapshot = self.current
+        return {
+            "version": snapshot.version,
+            "products": len(snapshot.products),
+            # Segment name only; filesystem paths stay out of the response
+            "segment": os.path.basename(snapshot.segment) if getattr(snapshot, "segment", None) else None,
+            "last_reload_seconds": self.last_reload_seconds,
+            "last_reload_at": self.last_reload_at,
+            "process_peak_rss_bytes": process_peak_rss_bytes(),
+            "last_error": self.last_error
+        }
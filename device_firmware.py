@@ -0,0 +1,331 @@
+import os
+import threading
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from ai_service import CompiledTemplate
+from caching import LRUCache
+from metrics import Counter
+
+FIRMWARE_CACHE_BYTES = int(os.getenv("FIRMWARE_CACHE_BYTES", str(2 * 1024 * 1024)))
+FIRMWARE_RENDERS = Counter("firmware_renders_total", "Device firmware renders by board and memo outcome",
+                           ["board", "memo"])
+
+OUTPUTS = ("json", "text", "csv")
+BAUD_RATES = (9600, 19200, 38400, 57600, 74880, 115200, 230400, 250000, 460800, 921600)
+MIN_INTERVAL_MS, MAX_INTERVAL_MS = 10, 3600 * 1000
+
+# Fragments below are CompiledTemplate sources: `{name}` is filled per
+# variant (pins, baud, interval), `{{` and `}}` are literal braces.
+
+
+class Part(NamedTuple):
+    """A hardware module on the board; one part can serve several sensors (DHT22: temperature and humidity)"""
+    label: str
+    pin: Optional[str]  # "digital", "analog", or None for I2C parts
+    includes: Tuple[str, ...]
+    globals: str
+    setup: str
+    read: str = ""  # runs once per sample, before the part's fields are read
+
+
+class Reading(NamedTuple):
+    part: str
+    fields: Tuple[Tuple[str, str, str], ...]  # (output key, C type, expression)
+
+
+class Board(NamedTuple):
+    label: str
+    language: str  # "arduino" sketches or "python" scripts
+    baud: Optional[int]
+    default_pins: Dict[str, str]
+    digital_pins: FrozenSet[str]
+    analog_pins: FrozenSet[str]
+    adc_max: int = 1023
+    gpio: str = ""  # GPIO module import for python boards
+
+
+class FirmwareSpec(NamedTuple):
+    """One fully parameterized firmware variant; also its memo key"""
+    board: str
+    sensors: Tuple[str, ...]
+    output: str
+    pins: Tuple[Tuple[str, str], ...]  # (part, pin) in part order
+    interval_ms: int
+    baud: Optional[int]
+
+
+# === Boards ===
+_ESP32_GPIO = frozenset(str(p) for p in range(40) if p not in (1, 3, 6, 7, 8, 9, 10, 11, 20, 24, 28, 29, 30, 31))
+_BCM_GPIO = frozenset(str(p) for p in range(2, 28))
+
+BOARDS: Dict[str, Board] = {
+    "arduino": Board("Arduino Uno", "arduino", 9600, {"dht": "2", "pir": "3", "ldr": "A0"},
+                     frozenset([str(p) for p in range(2, 14)] + [f"A{p}" for p in range(6)]),
+                     frozenset(f"A{p}" for p in range(6))),
+    # ADC2 pins stop working once WiFi is up, so only ADC1 (32-39) counts as analog
+    "esp32": Board("ESP32", "arduino", 115200, {"dht": "4", "pir": "27", "ldr": "34"}, _ESP32_GPIO,
+                   frozenset(str(p) for p in range(32, 40)), adc_max=4095),
+    "raspberry": Board("Raspberry Pi", "python", None, {"dht": "4", "pir": "17", "ldr": "27"}, _BCM_GPIO,
+                       frozenset(), gpio="import RPi.GPIO as GPIO"),
+    "jetson": Board("Jetson Nano", "python", None, {"dht": "4", "pir": "17", "ldr": "27"}, _BCM_GPIO,
+                    frozenset(), gpio="import Jetson.GPIO as GPIO")
+}
+
+# === Sketch Fragments (Arduino / ESP32) ===
+ARDUINO_PARTS: Dict[str, Part] = {
+    "dht": Part("DHT22", "digital", ('#include "DHT.h"',),
+                "#define DHT_PIN {dht_pin}\nDHT dht(DHT_PIN, DHT22);\n", "    dht.begin();\n"),
+    "pir": Part("PIR motion sensor", "digital", (), "#define PIR_PIN {pir_pin}\n", "    pinMode(PIR_PIN, INPUT);\n"),
+    "ldr": Part("LDR light sensor", "analog", (), "#define LDR_PIN {ldr_pin}\n", ""),
+    "mpu": Part("MPU6050 (I2C)", None, ("#include <Wire.h>", "#include <Adafruit_MPU6050.h>"),
+                "Adafruit_MPU6050 mpu;\n",
+                '    if (!mpu.begin()) {{\n        Serial.println("MPU6050 not found");\n    }}\n',
+                "    sensors_event_t accel, gyro, mpuTemp;\n    mpu.getEvent(&accel, &gyro, &mpuTemp);\n")
+}
+ARDUINO_READINGS: Dict[str, Reading] = {
+    "temperature": Reading("dht", (("temperature", "float", "dht.readTemperature()"),)),
+    "humidity": Reading("dht", (("humidity", "float", "dht.readHumidity()"),)),
+    "motion": Reading("pir", (("motion", "int", "digitalRead(PIR_PIN)"),)),
+    "light": Reading("ldr", (("light", "int", "map(analogRead(LDR_PIN), 0, {adc_max}, 0, 100)"),)),
+    "gyroscope": Reading("mpu", (("gyro_x", "float", "gyro.gyro.x"), ("gyro_y", "float", "gyro.gyro.y"),
+                                 ("gyro_z", "float", "gyro.gyro.z")))
+}
+_ARDUINO_JSON_HELPER = ("\n// DHT reads fail now and then; report them as null\n"
+                        "void printReading(float value) {{\n"
+                        '    if (isnan(value)) Serial.print("null");\n'
+                        "    else Serial.print(value);\n"
+                        "}}\n")
+
+# === Script Fragments (Raspberry Pi / Jetson) ===
+PYTHON_PARTS: Dict[str, Part] = {
+    "dht": Part("DHT22", "digital", ("import board", "import adafruit_dht"),
+                "dht = adafruit_dht.DHT22(board.D{dht_pin})\n\n"
+                "def read_dht(attribute):\n"
+                "    try:\n"
+                "        return getattr(dht, attribute)\n"
+                "    except RuntimeError:  # DHT reads fail now and then; retry next sample\n"
+                "        return None\n\n\n", ""),
+    "pir": Part("PIR motion sensor", "digital", (), "PIR_PIN = {pir_pin}\n", "GPIO.setup(PIR_PIN, GPIO.IN)\n"),
+    # No ADC on these boards: use the digital output (DO) of an LDR module, LOW when lit
+    "ldr": Part("LDR light module (DO)", "digital", (), "LIGHT_PIN = {ldr_pin}\n", "GPIO.setup(LIGHT_PIN, GPIO.IN)\n"),
+    "mpu": Part("MPU6050 (I2C)", None, ("from mpu6050 import mpu6050",), "mpu = mpu6050(0x68)\n", "",
+                "    gyro = mpu.get_gyro_data()\n")
+}
+PYTHON_READINGS: Dict[str, Reading] = {
+    "temperature": Reading("dht", (("temperature", "", 'read_dht("temperature")'),)),
+    "humidity": Reading("dht", (("humidity", "", 'read_dht("humidity")'),)),
+    "motion": Reading("pir", (("motion", "", "GPIO.input(PIR_PIN)"),)),
+    "light": Reading("ldr", (("light", "", "int(not GPIO.input(LIGHT_PIN))"),)),
+    "gyroscope": Reading("mpu", (("gyro_x", "", 'gyro["x"]'), ("gyro_y", "", 'gyro["y"]'),
+                                 ("gyro_z", "", 'gyro["z"]')))
+}
+_GPIO_PARTS = ("pir", "ldr")
+
+SENSORS = tuple(ARDUINO_READINGS)
+
+
+def _fragments(language: str) -> Tuple[Dict[str, Part], Dict[str, Reading]]:
+    if language == "python":
+        return PYTHON_PARTS, PYTHON_READINGS
+    return ARDUINO_PARTS, ARDUINO_READINGS
+
+
+def _parts_for(language: str, sensors: Sequence[str]) -> List[str]:
+    readings = _fragments(language)[1]
+    return list(dict.fromkeys(readings[s].part for s in sensors))
+
+
+def _compose_arduino(board: Board, sensors: Sequence[str], output: str) -> str:
+    parts, readings = _fragments("arduino")
+    used = [parts[p] for p in _parts_for("arduino", sensors)]
+    fields = [field for s in sensors for field in readings[s].fields]
+    includes = list(dict.fromkeys(line for part in used for line in part.includes))
+
+    source = [f"// {board.label}: {', '.join(sensors)} ({output} output)\n"
+              f"// Parts: {', '.join(part.label for part in used)}\n"]
+    source += [line + "\n" for line in includes]
+    source += ["\n"] + [part.globals for part in used]
+    if output == "json" and any(ctype == "float" for _, ctype, _ in fields):
+        source.append(_ARDUINO_JSON_HELPER)
+    source.append("\nvoid setup() {{\n    Serial.begin({baud});\n")
+    source += [part.setup for part in used]
+    source.append("}}\n\nvoid loop() {{\n")
+    source += [part.read for part in used]
+    source += [f"    {ctype} {key} = {expr};\n" for key, ctype, expr in fields]
+    source.append("\n")
+    if output == "json":
+        for i, (key, ctype, _) in enumerate(fields):
+            opening = "{{" if i == 0 else ","
+            source.append(f'    Serial.print("{opening}\\"{key}\\":");\n')
+            source.append(f"    printReading({key});\n" if ctype == "float" else f"    Serial.print({key});\n")
+        source.append('    Serial.println("}}");\n')
+    elif output == "text":
+        for key, _, _ in fields:
+            source.append(f'    Serial.print("{key}: ");\n    Serial.println({key});\n')
+    else:
+        # The IDE's serial monitor parses "DATA:" lines
+        source.append('    Serial.print("DATA:");\n')
+        for i, (key, _, _) in enumerate(fields):
+            if i:
+                source.append('    Serial.print(",");\n')
+            source.append(f"    Serial.print({key});\n")
+        source.append("    Serial.println();\n")
+    source.append("\n    delay({interval_ms});\n}}\n")
+    return "".join(source)
+
+
+def _compose_python(board: Board, sensors: Sequence[str], output: str) -> str:
+    parts, readings = _fragments("python")
+    names = _parts_for("python", sensors)
+    used = [parts[p] for p in names]
+    fields = [field for s in sensors for field in readings[s].fields]
+    gpio = any(name in _GPIO_PARTS for name in names)
+
+    source = [f"# {board.label}: {', '.join(sensors)} ({output} output)\n"
+              f"# Parts: {', '.join(part.label for part in used)}\n"]
+    imports = (["import json"] if output == "json" else []) + ["import time"]
+    imports += ([board.gpio] if gpio else []) + list(dict.fromkeys(l for part in used for l in part.includes))
+    source += [line + "\n" for line in imports]
+    source.append("\n")
+    if gpio:
+        source.append("GPIO.setmode(GPIO.BCM)\n")
+    declarations = "".join(part.globals for part in used) + "".join(part.setup for part in used)
+    source.append(declarations.rstrip("\n") + "\n")
+    source.append("\n\ndef read_sensors():\n    readings = {{}}\n")
+    source += [part.read for part in used]
+    source += [f'    readings["{key}"] = {expr}\n' for key, _, expr in fields]
+    source.append("    return readings\n\n\ntry:\n    while True:\n        readings = read_sensors()\n")
+    if output == "json":
+        source.append("        print(json.dumps(readings), flush=True)\n")
+    elif output == "text":
+        source.append('        for name, value in readings.items():\n            print(f"{{name}}: {{value}}", flush=True)\n')
+    else:
+        # The IDE's serial monitor parses "DATA:" lines
+        source.append('        print("DATA:" + ",".join(str(v) for v in readings.values()), flush=True)\n')
+    source.append("        time.sleep({interval})\nexcept KeyboardInterrupt:\n    pass\n")
+    if gpio:
+        source.append("finally:\n    GPIO.cleanup()\n")
+    return "".join(source)
+
+
+class FirmwareGenerator:
+    """Composes device firmware from per-board and per-sensor fragments.
+
+    The fragments for one (board, sensors, output) combination are joined
+    and compiled once; each parameter tuple (pins, sampling interval, baud
+    rate) is rendered from it once and memoized in an LRU bounded by
+    FIRMWARE_CACHE_BYTES.
+    """
+
+    def __init__(self, cache_bytes: int = FIRMWARE_CACHE_BYTES):
+        self._compiled: Dict[Tuple[str, Tuple[str, ...], str], CompiledTemplate] = {}
+        self._rendered = LRUCache(cache_bytes, sizeof=len)
+        self._lock = threading.Lock()
+
+    def spec(self, board: str, sensors: Iterable[str], pins: Optional[Dict] = None,
+             interval_ms: Optional[int] = None, baud: Optional[int] = None, output: str = "json") -> FirmwareSpec:
+        """Validate and normalize request parameters; raises ValueError on anything unsupported"""
+        board_name = str(board).strip().lower()
+        if board_name not in BOARDS:
+            raise ValueError(f"Unsupported board '{board}'; choose one of {', '.join(BOARDS)}")
+        spec_board = BOARDS[board_name]
+        if isinstance(sensors, str):
+            sensors = [sensors]
+        requested = {str(s).strip().lower() for s in sensors}
+        unknown = requested - set(SENSORS)
+        if unknown:
+            raise ValueError(f"Unsupported sensors {', '.join(sorted(unknown))}; choose from {', '.join(SENSORS)}")
+        if not requested:
+            raise ValueError("At least one sensor is required")
+        ordered = tuple(s for s in SENSORS if s in requested)  # any order of the same sensors shares a variant
+        if output not in OUTPUTS:
+            raise ValueError(f"'output' must be one of {', '.join(OUTPUTS)}")
+
+        interval_ms = 1000 if interval_ms is None else interval_ms
+        if isinstance(interval_ms, bool) or not isinstance(interval_ms, int) \
+                or not MIN_INTERVAL_MS <= interval_ms <= MAX_INTERVAL_MS:
+            raise ValueError(f"'interval_ms' must be an integer from {MIN_INTERVAL_MS} to {MAX_INTERVAL_MS}")
+        if spec_board.language == "python":
+            baud = None  # scripts print to stdout
+        else:
+            baud = spec_board.baud if baud is None else baud
+            if baud not in BAUD_RATES:
+                raise ValueError(f"'baud' must be one of {', '.join(map(str, BAUD_RATES))}")
+
+        parts, readings = _fragments(spec_board.language)
+        if pins is not None and not isinstance(pins, dict):
+            raise ValueError("'pins' must map sensor names to pins")
+        overrides = {}
+        for sensor, pin in (pins or {}).items():
+            sensor = str(sensor).strip().lower()
+            if sensor not in ordered:
+                raise ValueError(f"Pin given for '{sensor}', which is not among the requested sensors")
+            part = readings[sensor].part
+            pin = str(pin).strip().upper()
+            if overrides.get(part, pin) != pin:
+                raise ValueError(f"Sensors sharing the {parts[part].label} must use one pin")
+            overrides[part] = pin
+        assigned = []
+        for part in _parts_for(spec_board.language, ordered):
+            kind = parts[part].pin
+            if kind is None:
+                continue
+            pin = overrides.get(part, spec_board.default_pins[part])
+            allowed = spec_board.analog_pins if kind == "analog" else spec_board.digital_pins
+            if pin not in allowed:
+                raise ValueError(f"Pin {pin} on {spec_board.label} cannot read the {parts[part].label} "
+                                 f"({kind} input needed)")
+            assigned.append((part, pin))
+        taken = [pin for _, pin in assigned]
+        if len(set(taken)) != len(taken):
+            raise ValueError("Two sensors are wired to the same pin")
+        return FirmwareSpec(board_name, ordered, output, tuple(assigned), interval_ms, baud)
+
+    def language(self, spec: FirmwareSpec) -> str:
+        return BOARDS[spec.board].language
+
+    def sensor_pins(self, spec: FirmwareSpec) -> Dict[str, str]:
+        """Pin per requested sensor (I2C sensors have none)"""
+        pins = dict(spec.pins)
+        readings = _fragments(self.language(spec))[1]
+        return {s: pins[readings[s].part] for s in spec.sensors if readings[s].part in pins}
+
+    def _template(self, spec: FirmwareSpec) -> CompiledTemplate:
+        key = (spec.board, spec.sensors, spec.output)
+        template = self._compiled.get(key)
+        if template is None:
+            board = BOARDS[spec.board]
+            compose = _compose_python if board.language == "python" else _compose_arduino
+            template = CompiledTemplate(compose(board, spec.sensors, spec.output))
+            with self._lock:
+                template = self._compiled.setdefault(key, template)
+        return template
+
+    def render(self, spec: FirmwareSpec) -> str:
+        code = self._rendered.get(spec, None)
+        memo = "hit"
+        if code is None:
+            board = BOARDS[spec.board]
+            values = {f"{part}_pin": pin for part, pin in spec.pins}
+            values.update(baud=str(spec.baud), interval_ms=str(spec.interval_ms),
+                          interval=repr(spec.interval_ms / 1000), adc_max=str(board.adc_max))
+            template = self._template(spec)
+            code, memo = template.render([values[field] for field in template.fields]), "miss"
+            self._rendered.set(spec, code)
+        FIRMWARE_RENDERS.inc(board=spec.board, memo=memo)
+        return code
+
+    def generate(self, board: str, sensors: Iterable[str], **params) -> str:
+        return self.render(self.spec(board, sensors, **params))
+
+    def precompile(self, outputs: Sequence[str] = ("json",)):
+        """Render every board's single-sensor variants with default parameters ahead of the first request"""
+        for board in BOARDS:
+            for sensor in SENSORS:
+                for output in outputs:
+                    self.render(self.spec(board, [sensor], output=output))
+
+    def stats(self) -> Dict:
+        return {"compiled": len(self._compiled), "rendered": len(self._rendered),
+                "rendered_bytes": self._rendered.bytes, "hits": self._rendered.hits,
+                "misses": self._rendered.misses}
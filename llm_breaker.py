@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class CircuitBreaker:
+    """Stops calling the provider while most recent calls fail.
+
+    The last `size` outcomes from the past `window` seconds are kept; once
+    at least `min_calls` are known and `failure_ratio` of them failed
+    (errors, or calls slower than their deadline), the breaker opens and
+    every call is refused at once. After `reset_timeout` it lets `probes`
+    calls through: a success closes it again, a failure re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_ratio: float = 0.5, min_calls: int = 10, size: int = 20,
+                 window: float = 30.0, reset_timeout: float = 15.0, probes: int = 1):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.state = self.CLOSED
+        self.opened = 0
+        self.refused = 0
+        self._outcomes: deque = deque(maxlen=size)
+        self._opened_at = 0.0
+        self._probing = 0
+        self._lock = threading.Lock()
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self.opened += 1
+        self._opened_at = now
+        self._outcomes.clear()
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; a caller that gets True must record() or abandon()"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.refused += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probing = 0
+            if self.state == self.HALF_OPEN:
+                if self._probing >= self.probes:
+                    self.refused += 1
+                    return False
+                self._probing += 1
+            return True
+
+    def abandon(self):
+        """Give back an allowed call that never went upstream"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probing:
+                self._probing -= 1
+
+    def record(self, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if ok:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open(now)
+                return
+            if self.state == self.OPEN:
+                return  # a call admitted before the breaker opened
+            self._outcomes.append((now, ok))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, success in self._outcomes if not success)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                self._open(now)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"state": self.state, "recent_calls": len(self._outcomes),
+                    "recent_failures": sum(1 for _, ok in self._outcomes if not ok),
+                    "opened": self.opened, "refused": self.refused}
+
+
+class LatencyTracker:
+    """Recent successful call latencies for one endpoint"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-quantile of recent latencies, or None until min_samples are known"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,408 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_breaker import CircuitBreaker, LatencyTracker
+from llm_scheduler import INTERACTIVE, LLMScheduler, estimate_tokens
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# === Metrics ===
+LLM_CALLS = Counter("llm_calls_total", "LLM calls by endpoint, model and outcome",
+                    ["endpoint", "model", "outcome"])
+LLM_ERRORS = Counter("llm_errors_total", "LLM call failures by endpoint and error type", ["endpoint", "error"])
+LLM_QUEUE_WAIT = Histogram("llm_queue_wait_seconds", "Time from submission until the upstream request "
+                           "starts (slot, rate budget and thread pool)", ["endpoint"])
+LLM_LATENCY = Histogram("llm_upstream_latency_seconds", "Duration of the upstream chat completion",
+                        ["endpoint", "model"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens used by LLM calls (estimated for streams)",
+                     ["endpoint", "model", "kind"])
+
+
+class LLMBusyError(Exception):
+    """Raised when an endpoint already has its maximum number of LLM calls in flight"""
+
+
+class LLMCircuitOpenError(LLMBusyError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class LLMTimeoutError(Exception):
+    """Raised when an LLM call does not finish within its endpoint's timeout"""
+
+
+def retry_after(error: Exception, attempt: int) -> float:
+    """Seconds to pause after a 429: the provider's Retry-After, else exponential backoff"""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return min(30.0, 2.0 ** attempt)
+
+
+class LLMClientPool:
+    """Runs chat completions on a dedicated thread pool over keep-alive connections.
+
+    Each endpoint ("generate", "summarize", ...) gets its own concurrency
+    limit and timeout. A call over the limit is rejected at once instead of
+    queueing. submit() never blocks its caller; chat() and stream() do, so
+    with `max_waiting` at most that many caller (request) threads wait on
+    LLM results at once, whatever the endpoint limits add up to, and the
+    rest of the app keeps its workers.
+
+    With a scheduler, a call that got a slot also waits on its pool thread
+    (up to the endpoint timeout) for rate budget at its endpoint's
+    priority, and a 429 from the provider pauses the scheduler before the
+    call is retried.
+
+    With a circuit breaker, calls fail fast while the provider is failing.
+    Once an endpoint has enough history, chat() timeouts shrink to
+    `timeout_factor` x its p95 latency (never below `min_timeout`, never
+    above the configured timeout), and for endpoints in `hedge` a second
+    identical request is sent when the first outlives that p95.
+    """
+
+    def __init__(self, max_workers: int = 16, limits: Optional[Dict[str, int]] = None,
+                 timeouts: Optional[Dict[str, float]] = None, default_limit: int = 4,
+                 default_timeout: float = 30.0, scheduler: Optional[LLMScheduler] = None,
+                 priorities: Optional[Dict[str, int]] = None, rate_limit_retries: int = 2,
+                 breaker: Optional[CircuitBreaker] = None, hedge: Iterable[str] = (),
+                 timeout_factor: float = 1.5, min_timeout: float = 2.0, max_waiting: Optional[int] = None):
+        self.max_workers = max_workers
+        self.limits = dict(limits or {})
+        self.timeouts = dict(timeouts or {})
+        self.default_limit = default_limit
+        self.default_timeout = default_timeout
+        self.scheduler = scheduler
+        self.priorities = dict(priorities or {})
+        self.rate_limit_retries = rate_limit_retries
+        self.breaker = breaker
+        self.hedge = set(hedge)
+        self.timeout_factor = timeout_factor
+        self.min_timeout = min_timeout
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self.max_waiting = max_waiting
+        self._waiting = threading.BoundedSemaphore(max_waiting) if max_waiting else None
+
+        # openai keeps one session per thread and closes it after MAX_SESSION_LIFETIME_SECS,
+        # so it gets a factory: a shared session would be closed under the other threads
+        openai.requestssession = self.new_session
+
+    @staticmethod
+    def new_session() -> requests.Session:
+        """Keep-alive session for one pool thread, which makes one upstream request at a time"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _endpoint(self, endpoint: str):
+        with self._lock:
+            slots = self._slots.get(endpoint)
+            if slots is None:
+                limit = self.limits.get(endpoint, self.default_limit)
+                slots = self._slots[endpoint] = threading.BoundedSemaphore(limit)
+                self._counters[endpoint] = {"calls": 0, "in_flight": 0, "rejected": 0, "short_circuited": 0,
+                                            "throttled": 0, "rate_limited": 0, "timeouts": 0, "errors": 0,
+                                            "hedged": 0, "hedge_wins": 0, "waiters_rejected": 0}
+                self._latency[endpoint] = LatencyTracker()
+            return slots, self._counters[endpoint]
+
+    def _count(self, counters: Dict[str, int], name: str, delta: int = 1):
+        with self._lock:
+            counters[name] += delta
+
+    def _wait_slot(self, endpoint: str, model: str):
+        """Claim one of the max_waiting caller slots; raises LLMBusyError when none is free"""
+        if self._waiting is not None and not self._waiting.acquire(blocking=False):
+            _, counters = self._endpoint(endpoint)
+            self._count(counters, "waiters_rejected")
+            LLM_CALLS.inc(endpoint=endpoint, model=model, outcome="rejected")
+            raise LLMBusyError(f"Too many request threads waiting on LLM calls for {endpoint}")
+
+    def _release_wait_slot(self):
+        if self._waiting is not None:
+            self._waiting.release()
+
+    @contextmanager
+    def waiting(self, endpoint: str, model: str = DEFAULT_MODEL) -> Iterator[None]:
+        """Hold a max_waiting slot while blocking on an LLM result obtained some other way,
+        e.g. one shared with a concurrent identical call; raises LLMBusyError when none is free"""
+        self._wait_slot(endpoint, model)
+        try:
+            yield
+        finally:
+            self._release_wait_slot()
+
+    def wait_timeout(self, endpoint: str) -> float:
+        """How long chat() waits for this endpoint right now (its p95-adaptive timeout)"""
+        return self._timeout(endpoint, None)
+
+    def _admit(self, endpoint: str, counters: Dict[str, int], tokens: int, timeout: float) -> bool:
+        if self.scheduler is None:
+            return True
+        priority = self.priorities.get(endpoint, INTERACTIVE)
+        if self.scheduler.acquire(tokens, priority, timeout=timeout):
+            return True
+        self._count(counters, "throttled")
+        return False
+
+    def _run(self, endpoint: str, fn: Callable, timeout: float, model: str = DEFAULT_MODEL,
+             tokens: int = 0, usage: Optional[Callable] = None, deadline: Optional[float] = None) -> Future:
+        """Run fn on the pool while holding one of the endpoint's slots; returns at once.
+
+        `timeout` bounds the wait for rate budget, which happens on the pool
+        thread; a call that gets none fails with LLMBusyError. `tokens` is the call's
+        estimated cost for the scheduler; `usage` maps fn's result to
+        OpenAI-style token usage, if known. A call that outlives `deadline`
+        counts as a failure for the circuit breaker.
+        """
+        submitted = time.monotonic()
+        slots, counters = self._endpoint(endpoint)
+        if self.breaker is not None and not self.breaker.allow():
+            self._count(counters, "short_circuited")
+            LLM_CALLS.inc(endpoint=endpoint, model=model, outcome="short_circuited")
+            raise LLMCircuitOpenError(f"LLM circuit is open; not calling upstream for {endpoint}")
+        if not slots.acquire(blocking=False):
+            self._abandon()
+            self._count(counters, "rejected")
+            LLM_CALLS.inc(endpoint=endpoint, model=model, outcome="rejected")
+            raise LLMBusyError(f"Too many concurrent LLM calls for {endpoint}")
+
+        def call():
+            admitted = False
+            try:
+                admitted = self._admit(endpoint, counters, tokens, timeout)
+            finally:
+                if not admitted:
+                    self._count(counters, "in_flight", -1)
+                    slots.release()
+                    self._abandon()
+            if not admitted:
+                LLM_CALLS.inc(endpoint=endpoint, model=model, outcome="throttled")
+                raise LLMBusyError(f"LLM rate budget exhausted for {endpoint}")
+            LLM_QUEUE_WAIT.observe(time.monotonic() - submitted, endpoint=endpoint)
+            started = time.monotonic()
+            try:
+                attempt = 0
+                while True:
+                    try:
+                        result = fn()
+                        break
+                    except openai.error.RateLimitError as e:
+                        if self.scheduler is None or attempt >= self.rate_limit_retries:
+                            raise
+                        self._count(counters, "rate_limited")
+                        LLM_ERRORS.inc(endpoint=endpoint, error=type(e).__name__)
+                        self.scheduler.throttle(retry_after(e, attempt))
+                        attempt += 1
+                        if not self._admit(endpoint, counters, tokens, timeout):
+                            raise
+                        started = time.monotonic()
+                latency = time.monotonic() - started
+                if deadline is not None:
+                    self._latency[endpoint].observe(latency)
+                if self.breaker is not None:
+                    self.breaker.record(deadline is None or latency <= deadline)
+                used = usage(result) if usage is not None else None
+                if used:
+                    for kind in ("prompt", "completion"):
+                        LLM_TOKENS.inc(used.get(f"{kind}_tokens") or 0, endpoint=endpoint, model=model, kind=kind)
+                    if self.scheduler is not None:
+                        self.scheduler.settle(tokens, used.get("total_tokens"))
+                LLM_CALLS.inc(endpoint=endpoint, model=model, outcome="ok")
+                return result
+            except Exception as e:
+                if isinstance(e, openai.error.RateLimitError):
+                    self._abandon()  # the provider is up, just busy; the scheduler handles that
+                elif self.breaker is not None:
+                    self.breaker.record(False)
+                self._count(counters, "errors")
+                LLM_CALLS.inc(endpoint=endpoint, model=model, outcome="error")
+                LLM_ERRORS.inc(endpoint=endpoint, error=type(e).__name__)
+                raise
+            finally:
+                LLM_LATENCY.observe(time.monotonic() - started, endpoint=endpoint, model=model)
+                # The slot is held until upstream finishes, even if the caller gave up
+                self._count(counters, "in_flight", -1)
+                slots.release()
+
+        self._count(counters, "calls")
+        self._count(counters, "in_flight")
+        try:
+            return self._executor.submit(call)
+        except RuntimeError:
+            self._count(counters, "in_flight", -1)
+            slots.release()
+            self._abandon()
+            raise
+
+    def _abandon(self):
+        if self.breaker is not None:
+            self.breaker.abandon()
+
+    def _timeout(self, endpoint: str, timeout: Optional[float], adaptive: bool = True) -> float:
+        if timeout is not None:
+            return timeout
+        configured = self.timeouts.get(endpoint, self.default_timeout)
+        if not adaptive:
+            return configured
+        self._endpoint(endpoint)
+        p95 = self._latency[endpoint].percentile(0.95)
+        if p95 is None:
+            return configured
+        return min(configured, max(self.min_timeout, p95 * self.timeout_factor))
+
+    def submit(self, endpoint: str, messages: List[Dict], model: str = DEFAULT_MODEL,
+               timeout: Optional[float] = None, **params) -> Future:
+        """Start a chat completion on the pool; raises LLMBusyError if the endpoint is full"""
+        timeout = self._timeout(endpoint, timeout)
+        return self._run(endpoint, lambda: openai.ChatCompletion.create(
+            model=model, messages=messages, request_timeout=timeout, **params),
+            timeout=timeout, model=model, tokens=estimate_tokens(messages, params.get("max_tokens")),
+            usage=lambda response: response.get("usage"), deadline=timeout)
+
+    def chat(self, endpoint: str, messages: List[Dict], model: str = DEFAULT_MODEL,
+             timeout: Optional[float] = None, background: bool = False, **params):
+        """Run a chat completion and wait for it, at most the endpoint's (adaptive) timeout.
+
+        `background` callers (worker threads, not request threads) take no max_waiting slot.
+        """
+        timeout = self._timeout(endpoint, timeout)
+        started = time.monotonic()
+        deadline = started + timeout  # time spent waiting for rate budget counts too
+        _, counters = self._endpoint(endpoint)
+        if not background:
+            self._wait_slot(endpoint, model)
+        try:
+            first = self.submit(endpoint, messages, model=model, timeout=timeout, **params)
+            pending = {first}
+
+            hedge_after = self._latency[endpoint].percentile(0.95) if endpoint in self.hedge else None
+            if hedge_after is not None and started + hedge_after < deadline:
+                done, _ = wait(pending, timeout=max(0.0, started + hedge_after - time.monotonic()))
+                if not done:
+                    try:
+                        pending.add(self.submit(endpoint, messages, model=model,
+                                                timeout=max(0.0, deadline - time.monotonic()), **params))
+                        self._count(counters, "hedged")
+                    except LLMBusyError:
+                        pass  # no slot for a second request; keep waiting on the first
+
+            error = None
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        if future is not first:
+                            self._count(counters, "hedge_wins")
+                        return future.result()
+                    error = future.exception()
+            if not pending and error is not None:
+                raise error
+        finally:
+            if not background:
+                self._release_wait_slot()
+        self._count(counters, "timeouts")
+        LLM_ERRORS.inc(endpoint=endpoint, error="LLMTimeoutError")
+        raise LLMTimeoutError(f"LLM call for {endpoint} timed out after {timeout:.1f}s")
+
+    def stream(self, endpoint: str, messages: List[Dict], model: str = DEFAULT_MODEL,
+               timeout: Optional[float] = None, **params) -> Iterator[str]:
+        """Yield content deltas of a streamed chat completion as they arrive.
+
+        The timeout bounds the wait for each chunk rather than the whole
+        completion. Closing the iterator early stops reading upstream.
+        """
+        # Chunk gaps are not comparable to whole-call latencies; use the configured timeout
+        timeout = self._timeout(endpoint, timeout, adaptive=False)
+        chunks: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+        finished = object()
+        streamed = [0]  # characters received; streams report no usage
+
+        def produce():
+            try:
+                response = openai.ChatCompletion.create(model=model, messages=messages, stream=True,
+                                                        request_timeout=timeout, **params)
+                try:
+                    for chunk in response:
+                        if cancelled.is_set():
+                            break
+                        delta = chunk["choices"][0].get("delta", {}).get("content")
+                        if delta:
+                            streamed[0] += len(delta)
+                            chunks.put(delta)
+                finally:
+                    close = getattr(response, "close", None)
+                    if close is not None:
+                        close()
+            except Exception as e:
+                chunks.put(e)
+                raise
+            chunks.put(finished)
+
+        def failed(future: Future):
+            # Calls refused before produce() ran, e.g. for rate budget
+            if not future.cancelled() and future.exception() is not None:
+                chunks.put(future.exception())
+
+        tokens = estimate_tokens(messages, params.get("max_tokens"))
+        prompt_tokens = estimate_tokens(messages, 0)
+        self._wait_slot(endpoint, model)
+        try:
+            self._run(endpoint, produce, timeout=timeout, model=model, tokens=tokens,
+                      usage=lambda _: {"prompt_tokens": prompt_tokens, "completion_tokens": streamed[0] // 4,
+                                       "total_tokens": prompt_tokens + streamed[0] // 4}).add_done_callback(failed)
+        except BaseException:
+            self._release_wait_slot()
+            raise
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=timeout)
+                except queue.Empty:
+                    _, counters = self._endpoint(endpoint)
+                    self._count(counters, "timeouts")
+                    LLM_ERRORS.inc(endpoint=endpoint, error="LLMTimeoutError")
+                    raise LLMTimeoutError(f"LLM stream for {endpoint} stalled for {timeout}s")
+                if item is finished:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+            self._release_wait_slot()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            endpoints = {endpoint: {"limit": self.limits.get(endpoint, self.default_limit), **counters}
+                         for endpoint, counters in self._counters.items()}
+        for endpoint, stats in endpoints.items():
+            p95 = self._latency[endpoint].percentile(0.95)
+            stats["p95_latency"] = None if p95 is None else round(p95, 3)
+            stats["timeout"] = round(self._timeout(endpoint, None), 3)
+        return endpoints
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
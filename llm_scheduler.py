@@ -0,0 +1,206 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import ExitStack
+from typing import Callable, ContextManager, Dict, List, Optional, Sequence
+
+INTERACTIVE, BATCH = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+def estimate_tokens(messages: Sequence[Dict], max_tokens: Optional[int] = None) -> int:
+    """Rough token cost of a chat call: ~4 characters per prompt token plus the completion budget"""
+    prompt = sum(len(str(m.get("content") or "")) for m in messages) // 4 + 4 * len(messages)
+    return prompt + (256 if max_tokens is None else max_tokens)
+
+
+class LLMScheduler:
+    """Admits LLM calls within tokens-per-minute and requests-per-minute budgets.
+
+    Both budgets are token buckets that refill continuously. Callers wait in
+    one queue ordered by priority, then arrival; only the head of the queue
+    may spend budget, so batch work never overtakes a waiting interactive
+    call. A call is charged its estimated tokens up front and settled with
+    the provider's reported usage afterwards. A 429 pauses every admission
+    for the Retry-After period instead of letting each caller retry on its
+    own.
+    """
+
+    def __init__(self, tokens_per_minute: int = 200000, requests_per_minute: int = 500):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self._tokens = float(tokens_per_minute)
+        self._requests = float(requests_per_minute)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._queue: List[list] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.admitted = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.timed_out = 0
+        self.rate_limited = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+
+    def _wait_for_budget(self, tokens: int, now: float) -> float:
+        """Seconds until the head of the queue could be admitted (0 if now)"""
+        needed = min(tokens, self.tokens_per_minute)  # oversized calls wait for a full bucket
+        waits = [self._paused_until - now,
+                 (needed - self._tokens) * 60 / self.tokens_per_minute,
+                 (1 - self._requests) * 60 / self.requests_per_minute]
+        return max(0.0, *waits)
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE, timeout: Optional[float] = None) -> bool:
+        """Wait for budget for one call of about `tokens` tokens; False if timeout expires first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            entry = [priority, next(self._seq), tokens]
+            heapq.heappush(self._queue, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = None
+                if self._queue[0] is entry:
+                    wait = self._wait_for_budget(tokens, now)
+                    if wait == 0:
+                        heapq.heappop(self._queue)
+                        self._tokens -= tokens
+                        self._requests -= 1
+                        self.admitted[PRIORITY_NAMES.get(priority, str(priority))] += 1
+                        self._cond.notify_all()  # the next caller is now at the head
+                        return True
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._queue.remove(entry)
+                        heapq.heapify(self._queue)
+                        self.timed_out += 1
+                        self._cond.notify_all()
+                        return False
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def settle(self, charged: int, used: Optional[int]):
+        """Correct an admitted call's charge once its real token usage is known"""
+        if used is None:
+            return
+        with self._cond:
+            self._refill(time.monotonic())
+            self._tokens = min(self.tokens_per_minute, self._tokens + charged - used)
+            self._cond.notify_all()
+
+    def throttle(self, seconds: float):
+        """Stop admitting calls for `seconds`, e.g. after the provider answered 429"""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, now + seconds)
+            # Budget refilled during the pause was already spent upstream; run it
+            # into debt so admissions resume at the steady rate, not in a burst
+            self._requests = min(self._requests, -seconds * self.requests_per_minute / 60)
+            self._tokens = min(self._tokens, -seconds * self.tokens_per_minute / 60)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, _ in self._queue:
+                queued[PRIORITY_NAMES.get(priority, str(priority))] += 1
+            return {
+                "tokens_per_minute": self.tokens_per_minute,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_available": int(self._tokens),
+                "requests_available": int(self._requests),
+                "paused_for": round(max(0.0, self._paused_until - now), 3),
+                "queued": queued,
+                "admitted": dict(self.admitted),
+                "timed_out": self.timed_out,
+                "rate_limited": self.rate_limited
+            }
+
+
+class MicroBatcher:
+    """Groups items submitted within a short window into one batch call.
+
+    The first caller of a window becomes its leader: it waits up to
+    `window` seconds (less if `max_items` arrive), runs `run_batch` on every
+    item collected and hands each caller its own result. `run_batch` must
+    return one result per item, in order; an exception in place of a
+    result is raised to that item's caller alone.
+
+    Other callers hold `wait()` (e.g. a slot limiting how many threads may
+    block on LLM calls) while they wait, and give up after `timeout`
+    seconds with TimeoutError.
+    """
+
+    def __init__(self, run_batch: Callable[[List], List], window: float = 0.05, max_items: int = 8):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_items = max_items
+        self._cond = threading.Condition()
+        self._pending: Optional[List] = None
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item, timeout: Optional[float] = None,
+               wait: Optional[Callable[[], ContextManager]] = None):
+        waiting = ExitStack()
+        with self._cond:
+            if self._pending is not None and len(self._pending) < self.max_items:
+                if wait is not None:
+                    waiting.enter_context(wait())  # before joining, so a refused item is never run
+                future: Future = Future()
+                self._pending.append((item, future))
+                if len(self._pending) >= self.max_items:
+                    self._cond.notify_all()
+                leader = False
+            else:
+                future = Future()
+                batch = self._pending = [(item, future)]
+                leader = True
+        if not leader:
+            with waiting:
+                return future.result(timeout=timeout)
+
+        with self._cond:
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._pending is batch:
+                self._pending = None
+            self.batches += 1
+            self.items += len(batch)
+        try:
+            results = self.run_batch([i for i, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Batch returned {len(results)} results for {len(batch)} items")
+        except BaseException as e:
+            for _, f in batch:
+                if f is not future:
+                    f.set_exception(e)
+            raise
+        for (_, f), result in zip(batch, results):
+            if f is not future:
+                if isinstance(result, BaseException):
+                    f.set_exception(result)
+                else:
+                    f.set_result(result)
+        if isinstance(results[0], BaseException):
+            raise results[0]
+        return results[0]
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {"batches": self.batches, "items": self.items}
@@ -0,0 +1,121 @@
+import json
+import re
+from typing import Dict, List, Optional
+
+FENCE = "```"
+# Info strings recognised when a fence's code starts on the fence's own line ("```js x = 1```")
+_INLINE_INFO = re.compile(r"^(?:javascript|js|typescript|ts|arduino|cpp|python|json|html)(?:\s+|$)", re.IGNORECASE)
+_LIST_ITEM = re.compile(r"^\s*(?:[-*\u2022]|\d+[.)])\s+(.*\S)")
+_SECTION = re.compile(r"^\W*(?:snippet|section)\s+(\d+)\W*$", re.IGNORECASE | re.MULTILINE)
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def extract_code(text: str) -> str:
+    """Code inside the first fenced block of a completion, or the whole text"""
+    stripper = FenceStripper()
+    stripper.feed(text)
+    stripper.finish()
+    return stripper.result
+
+
+def parse_suggestions(text: str) -> List[str]:
+    """Bullet or numbered list items from free text"""
+    return [m.group(1) for m in map(_LIST_ITEM.match, text.splitlines()) if m]
+
+
+def split_sections(text: str, count: int) -> Optional[List[str]]:
+    """Bodies of "Snippet 1" .. "Snippet <count>" headings, in order; None if any is missing"""
+    headings = list(_SECTION.finditer(text))
+    if [int(m.group(1)) for m in headings] != list(range(1, count + 1)):
+        return None
+    ends = [m.start() for m in headings[1:]] + [len(text)]
+    return [text[m.end():end].strip() for m, end in zip(headings, ends)]
+
+
+class FenceStripper:
+    """Incrementally extracts the first fenced code block from streamed text.
+
+    feed() returns only text that is certain to be code: anything before the
+    opening fence and the fence's info string ("javascript") are dropped,
+    and trailing whitespace or a partial closing fence is held back until
+    the next chunk decides it. The concatenated output always equals
+    `result`. Text after the closing fence is kept in `tail`. A completion
+    without any fence is released whole by finish(). A block opened and
+    closed on one line ("```const x = 1```") yields the text between the
+    fences, minus a leading language name.
+    """
+
+    BEFORE, INSIDE, AFTER = range(3)
+
+    def __init__(self):
+        self.state = self.BEFORE
+        self.pending = ""
+        self.tail = ""
+        self._emitted: List[str] = []
+
+    @property
+    def result(self) -> str:
+        return "".join(self._emitted)
+
+    def _emit(self, text: str) -> str:
+        if not self._emitted:
+            text = text.lstrip()
+        if text:
+            self._emitted.append(text)
+        return text
+
+    def feed(self, text: str) -> str:
+        if self.state == self.AFTER:
+            self.tail += text
+            return ""
+        self.pending += text
+        out = ""
+        if self.state == self.BEFORE:
+            start = self.pending.find(FENCE)
+            if start < 0:
+                return ""
+            newline = self.pending.find("\n", start + len(FENCE))
+            close = self.pending.find(FENCE, start + len(FENCE))
+            if 0 <= close and (newline < 0 or close < newline):
+                out = self._emit(_inline_code(self.pending[start + len(FENCE):close]))
+                self.tail = self.pending[close + len(FENCE):]
+                self.pending = ""
+                self.state = self.AFTER
+                return out
+            if newline < 0:
+                return ""  # still reading the info string, or a one-line block
+            self.pending = self.pending[newline + 1:]
+            self.state = self.INSIDE
+
+        end = self.pending.find(FENCE)
+        if end >= 0:
+            out = self._emit(self.pending[:end].rstrip())
+            self.tail = self.pending[end + len(FENCE):]
+            self.pending = ""
+            self.state = self.AFTER
+            return out
+        # Hold back what a later chunk could turn into a fence or trailing space
+        safe = self.pending.rstrip("`").rstrip()
+        self.pending = self.pending[len(safe):]
+        return self._emit(safe)
+
+    def finish(self) -> str:
+        """Release whatever is still held back once the stream has ended"""
+        if self.state == self.AFTER:
+            return ""
+        if self.state == self.BEFORE and FENCE in self.pending:
+            # An unclosed fence on the last line: its info string, or code after it
+            self.pending = _inline_code(self.pending[self.pending.find(FENCE) + len(FENCE):])
+        out = self._emit(self.pending.rstrip())
+        self.pending = ""
+        self.state = self.AFTER
+        return out
+
+
+def _inline_code(text: str) -> str:
+    """Code written on a fence's own line, without a leading language name"""
+    return _INLINE_INFO.sub("", text.strip(), count=1).strip()
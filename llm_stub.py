@@ -0,0 +1,221 @@
+"""Local OpenAI-compatible chat-completions stub for offline load tests.
+
+Run with `python llm_stub.py --port 8001 --latency lognormal:0.8,0.5` and
+point the app at it with OPENAI_API_BASE=http://127.0.0.1:8001/v1.
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_SNIPPETS = re.compile(r"Explain these (\d+) code snippets")
+
+
+def parse_latency(spec: str):
+    """Latency sampler from "fixed:S", "uniform:LO,HI", "normal:MEAN,SD" or "lognormal:MEDIAN,SIGMA" (seconds)"""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: random.uniform(*values)
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, random.gauss(*values))
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Bad latency spec {spec!r}")
+
+
+def reply_for(messages: List[Dict]) -> str:
+    """A plausible completion for the app's prompts, so response parsing is exercised too"""
+    system = str(messages[0].get("content", "")) if messages else ""
+    user = str(messages[-1].get("content", "")) if messages else ""
+    batch = _SNIPPETS.search(user)
+    if batch:
+        return "\n\n".join(f"Snippet {i}:\nThis snippet declares a value and uses it in the scene."
+                           for i in range(1, int(batch.group(1)) + 1))
+    if user.startswith("Optimize this code"):
+        return ("Here is the optimized version:\n```javascript\nconst geometry = new THREE.BoxGeometry(1, 1, 1);\n"
+                "for (const mesh of meshes) mesh.geometry = geometry;\n```\n"
+                "- Share one geometry between meshes\n- Avoid allocations inside the render loop\n")
+    if user.startswith("Explain this code"):
+        return ("This code creates a mesh, adds it to the scene and updates it every frame. "
+                "First it builds the geometry, then a material, then combines them into a mesh.")
+    if user.startswith("Products:") or "product advisor" in system:
+        return ("Product A offers the best value for hobby projects, while Product B trades a higher "
+                "price for more memory and faster I/O. Choose A for learning and B for production.")
+    return ("```javascript\n// Generated offline by llm_stub\nconst geometry = new THREE.BoxGeometry(1, 1, 1);\n"
+            "const material = new THREE.MeshStandardMaterial({ color: 0x44aa88 });\n"
+            "const mesh = new THREE.Mesh(geometry, material);\nscene.add(mesh);\n"
+            "function animate() {\n    mesh.rotation.y += 0.01;\n    requestAnimationFrame(animate);\n}\n"
+            "animate();\n```")
+
+
+class StubConfig:
+    def __init__(self, latency: str = "fixed:0.3", tokens_per_second: float = 0.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, timeout_rate: float = 0.0, hang_seconds: float = 60.0,
+                 seed: Optional[int] = None):
+        self.latency_spec = latency
+        self.latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second  # 0: whole completion after the latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        if seed is not None:
+            random.seed(seed)
+
+
+class StubStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    stats = StubStats()
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def _json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            return self._json(200, self.stats.snapshot())
+        self._json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = self.config
+        self.stats.count("requests")
+
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            self.stats.count("rate_limited")
+            return self._json(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests",
+                                              "code": "rate_limit_exceeded"}}, {"Retry-After": "1"})
+        roll -= config.rate_limit_rate
+        if roll < config.error_rate:
+            self.stats.count("errors")
+            time.sleep(config.latency() / 4)
+            return self._json(500, {"error": {"message": "The server had an error (stub)", "type": "server_error"}})
+        roll -= config.error_rate
+        if roll < config.timeout_rate:
+            self.stats.count("hangs")
+            time.sleep(config.hang_seconds)  # the client's request timeout should fire first
+            return
+
+        messages = body.get("messages") or []
+        content = reply_for(messages)
+        pieces = re.findall(r"\S+\s*|\s+", content)  # ~1 token per word
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        completion_tokens = min(len(pieces), int(body.get("max_tokens") or len(pieces)))
+        pieces = pieces[:completion_tokens]
+        delay = config.latency()
+        gap = 1 / config.tokens_per_second if config.tokens_per_second else 0.0
+        model = body.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if body.get("stream"):
+            self.stats.count("streams")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(delay)  # time to first token
+            try:
+                for piece in pieces:
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                    if gap:
+                        time.sleep(gap)
+                final = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self._chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+                self._chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                self.stats.count("client_disconnects")
+            return
+
+        time.sleep(delay + gap * len(pieces))
+        self._json(200, {
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+
+def start_stub(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serve the stub on a background thread; the API base is http://host:server_port/v1"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config, "stats": StubStats()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default="lognormal:0.8,0.5",
+                        help="time to first token: fixed:S, uniform:LO,HI, normal:MEAN,SD or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="completion speed; 0 for instant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of calls answered with HTTP 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="share of calls that hang")
+    parser.add_argument("--seed", type=int)
+
+
+def config_from_args(args) -> StubConfig:
+    return StubConfig(latency=args.latency, tokens_per_second=args.tokens_per_second, error_rate=args.error_rate,
+                      rate_limit_rate=args.rate_limit_rate, timeout_rate=args.timeout_rate, seed=args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = start_stub(config_from_args(args), args.host, args.port)
+    logger.info("LLM stub listening on http://%s:%d/v1", args.host, server.server_port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
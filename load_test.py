@@ -0,0 +1,243 @@
+"""Load test for the LLM-bound routes against the local OpenAI stub.
+
+Run with `python load_test.py --concurrency 16 --duration 30`. By default the
+stub (llm_stub.py) and the Flask app both run in this process; pass
+--app-url to drive a deployed app instead (point its OPENAI_API_BASE at a
+stub started with `python llm_stub.py`).
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+from llm_stub import add_stub_arguments, config_from_args, start_stub
+
+ROUTES = ("generate", "generate-stream", "explain", "optimize", "summarize")
+SHAPES = ("torus knot", "helix", "dodecahedron", "ribbon", "lattice", "spiral tower")
+MOTIONS = ("pulses", "twists", "fades", "drifts", "glows", "wobbles")
+_ANSWER = re.compile(r'^llm_route_answers_total\{route="([^"]+)",path="([^"]+)"\} (\S+)$', re.M)
+
+
+# === Request Payloads ===
+def generate_payload(rng: random.Random, tag: str) -> Dict:
+    shape, motion = rng.choice(SHAPES), rng.choice(MOTIONS)
+    return {"prompt": f"Build a {shape} that {motion} whenever reading {tag} changes",
+            "context": {"selectedBoard": "esp32", "connectedSensors": ["temperature"]}}
+
+
+def explain_payload(rng: random.Random, tag: str) -> Dict:
+    # Short enough to be micro-batched (EXPLAIN_BATCH_MAX_CHARS)
+    return {"code": f"const mesh_{tag} = new THREE.Mesh(geometry, material);\n"
+                    f"mesh_{tag}.position.set({rng.randint(-5, 5)}, 0, 0);\nscene.add(mesh_{tag});"}
+
+
+def optimize_payload(rng: random.Random, tag: str) -> Dict:
+    return {"code": f"// batch {tag}\nfor (let i = 0; i < {rng.randint(10, 500)}; i++) {{\n"
+                    "    const m = new THREE.Mesh(new THREE.BoxGeometry(1, 1, 1), new THREE.MeshBasicMaterial());\n"
+                    "    m.position.x = i;\n    scene.add(m);\n}"}
+
+
+def summarize_payload(rng: random.Random, product_ids: List, tag: str) -> Dict:
+    return {"product_ids": rng.sample(product_ids, min(len(product_ids), rng.randint(2, 3)))}
+
+
+def payload_builders(products_file: str) -> Dict[str, Tuple[str, Callable]]:
+    """Route name -> (path, builder(rng, tag) -> JSON body)"""
+    with open(products_file, encoding="utf-8") as f:
+        product_ids = [p["id"] for p in json.load(f) if "id" in p]
+    return {
+        "generate": ("/generate-js", generate_payload),
+        "generate-stream": ("/generate-js", lambda rng, tag: {**generate_payload(rng, tag), "stream": True}),
+        "explain": ("/explain-code", explain_payload),
+        "optimize": ("/optimize-code", optimize_payload),
+        "summarize": ("/summarize", lambda rng, tag: summarize_payload(rng, product_ids, tag))
+    }
+
+
+# === Load Generation ===
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.first_event: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+
+    def record(self, route: str, status: str, seconds: float, first_event: Optional[float] = None):
+        with self._lock:
+            counts = self.statuses.setdefault(route, {})
+            counts[status] = counts.get(status, 0) + 1
+            if status.startswith("2"):
+                self.latencies.setdefault(route, []).append(seconds)
+                if first_event is not None:
+                    self.first_event.setdefault(route, []).append(first_event)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+def send(session: requests.Session, base_url: str, path: str, body: Dict, timeout: float):
+    """Returns (status, seconds, seconds to the first SSE event or None)"""
+    start = time.perf_counter()
+    stream = bool(body.get("stream"))
+    response = session.post(base_url + path, json=body, timeout=timeout, stream=stream)
+    first_event = None
+    if stream and response.ok:
+        for line in response.iter_lines():
+            if first_event is None and line.startswith(b"event:"):
+                first_event = time.perf_counter() - start
+    else:
+        response.content
+    return str(response.status_code), time.perf_counter() - start, first_event
+
+
+def worker(base_url: str, routes: List[str], builders: Dict, results: Results, stop_at: float,
+           issued: Iterator[int], total: Optional[int], hot_ratio: float, timeout: float, seed: int):
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.monotonic() < stop_at:
+        if total and next(issued) >= total:
+            return
+        route = rng.choice(routes)
+        path, build = builders[route]
+        # Hot payloads repeat across the run and exercise the caches; the rest are new
+        tag = str(rng.randrange(20)) if rng.random() < hot_ratio else uuid.uuid4().hex[:8]
+        body = build(random.Random(f"{route}:{tag}"), tag)
+        try:
+            status, seconds, first_event = send(session, base_url, path, body, timeout)
+        except requests.RequestException as e:
+            status, seconds, first_event = type(e).__name__, 0.0, None
+        results.record(route, status, seconds, first_event)
+
+
+def route_answers(base_url: str) -> Dict[Tuple[str, str], float]:
+    """llm_route_answers_total from /metrics, keyed by (route, path)"""
+    try:
+        text = requests.get(base_url + "/metrics", timeout=5).text
+    except requests.RequestException:
+        return {}
+    return {(route, path): float(value) for route, path, value in _ANSWER.findall(text)}
+
+
+def run(base_url: str, routes: List[str], builders: Dict, concurrency: int, duration: float,
+        total: Optional[int], hot_ratio: float, timeout: float) -> Tuple[Results, float]:
+    results = Results()
+    issued = itertools.count()  # shared by the workers for --requests
+    stop_at = time.monotonic() + (duration if not total else float("inf"))
+    threads = [threading.Thread(target=worker, args=(base_url, routes, builders, results, stop_at, issued,
+                                                     total, hot_ratio, timeout, i), daemon=True)
+               for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def report(results: Results, elapsed: float, answers: Dict) -> Dict:
+    summary = {"elapsed": round(elapsed, 2), "routes": {}, "answers": answers}
+    for route, counts in sorted(results.statuses.items()):
+        latencies = results.latencies.get(route, [])
+        entry = {"requests": sum(counts.values()), "ok": len(latencies), "statuses": counts,
+                 "throughput": round(sum(counts.values()) / elapsed, 2)}
+        for q in (0.5, 0.9, 0.95, 0.99):
+            entry[f"p{int(q * 100)}"] = round(percentile(latencies, q), 4)
+        entry["max"] = round(max(latencies), 4) if latencies else None
+        if route in results.first_event:
+            entry["first_event_p50"] = round(percentile(results.first_event[route], 0.5), 4)
+            entry["first_event_p99"] = round(percentile(results.first_event[route], 0.99), 4)
+        summary["routes"][route] = entry
+    summary["throughput"] = round(sum(e["requests"] for e in summary["routes"].values()) / elapsed, 2)
+    return summary
+
+
+def print_report(summary: Dict):
+    print(f"{'route':16s} {'reqs':>6s} {'ok':>6s} {'req/s':>7s} {'p50':>7s} {'p90':>7s} {'p95':>7s} "
+          f"{'p99':>7s} {'max':>7s}  statuses")
+    for route, e in summary["routes"].items():
+        print(f"{route:16s} {e['requests']:6d} {e['ok']:6d} {e['throughput']:7.1f} {e['p50']:7.3f} {e['p90']:7.3f} "
+              f"{e['p95']:7.3f} {e['p99']:7.3f} {e['max'] or 0:7.3f}  {e['statuses']}")
+        if "first_event_p50" in e:
+            print(f"{'':16s} first event p50 {e['first_event_p50']:.3f}s p99 {e['first_event_p99']:.3f}s")
+    print(f"total {summary['throughput']:.1f} req/s over {summary['elapsed']:.1f}s")
+    if summary["answers"]:
+        print("answered by: " + ", ".join(f"{route} {path}={int(n)}"
+                                          for (route, path), n in sorted(summary["answers"].items()) if n))
+    if summary.get("stub"):
+        print(f"stub: {summary['stub']}")
+
+
+def serve_app(stub_url: str):
+    """Start the Flask app in this process, talking to the stub; returns its base URL"""
+    os.environ["OPENAI_API_BASE"] = stub_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-load-test")
+    os.environ.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite://")
+    # Start cold and keep the real caches out of it
+    scratch = tempfile.mkdtemp(prefix="load_test_")
+    os.environ.setdefault("PROMPT_CACHE_PATH", os.path.join(scratch, "prompt_cache.sqlite3"))
+    os.environ.setdefault("SUMMARY_CACHE_PATH", os.path.join(scratch, "summary_cache.sqlite3"))
+    from werkzeug.serving import make_server
+    from main import app  # reads the environment at import time
+
+    # Per-request access logs would drown the report
+    for name in ("", "werkzeug"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-test-app", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app-url", help="drive this app instead of an in-process one")
+    parser.add_argument("--stub-url", help="OpenAI API base of a running stub for the in-process app")
+    parser.add_argument("--routes", default=",".join(ROUTES), help=f"comma-separated subset of {','.join(ROUTES)}")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, help="stop after this many requests instead")
+    parser.add_argument("--hot-ratio", type=float, default=0.0, help="share of requests reusing a small hot set")
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request")
+    parser.add_argument("--products-file", default="products.json")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+    stub = None
+    base_url = args.app_url
+    if not base_url:
+        stub_url = args.stub_url
+        if not stub_url:
+            stub = start_stub(config_from_args(args))
+            stub_url = f"http://127.0.0.1:{stub.server_port}/v1"
+        base_url = serve_app(stub_url)
+    base_url = base_url.rstrip("/")
+
+    before = route_answers(base_url)
+    results, elapsed = run(base_url, routes, payload_builders(args.products_file), args.concurrency,
+                           args.duration, args.requests, args.hot_ratio, args.timeout)
+    after = route_answers(base_url)
+    summary = report(results, elapsed, {key: n - before.get(key, 0) for key, n in after.items()})
+    if stub is not None:
+        summary["stub"] = stub.RequestHandlerClass.stats.snapshot()
+    if args.json:
+        summary["answers"] = {f"{route} {path}": n for (route, path), n in summary["answers"].items()}
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
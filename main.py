@@ -1,8 +1,28 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template, redirect, url_for, flash, render_template_string
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity
+from flask import Flask, Response, g, request, stream_with_context, jsonify, send_from_directory, render_template, redirect, url_for, flash, render_template_string
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import InvalidTokenError
 from flask_cors import CORS
 from auth import auth_bp 
-from models import db, User 
+from models import db, User, AISession
+from catalog_store import CatalogStore
+from catalog_routes import catalog_bp
+from recommend_cache import RecommendationCache
+from caching import LRUCache
+from summary_store import SummaryStore
+import product_db
+from llm_client import LLMBusyError, LLMClientPool, LLMTimeoutError
+from llm_breaker import CircuitBreaker
+from llm_scheduler import BATCH, LLMScheduler, MicroBatcher
+from prompt_cache import PromptCache, context_key
+from session_memory import ROLE_NAMES, SessionMemory
+from singleflight import SingleFlight
+from template_router import Route, TemplateRouter, keywords_for
+from template_pack import default_pack
+from ai_service import AICodeGenerator
+from device_firmware import FirmwareGenerator
+from llm_stream import FenceStripper, extract_code, parse_suggestions, split_sections, sse_event
+from metrics import REGISTRY, Counter, Gauge, Histogram
 from itsdangerous import URLSafeTimedSerializer
 import smtplib
 from email.message import EmailMessage
@@ -10,9 +30,13 @@ from dotenv import load_dotenv
 import os
 import json
 import logging
+import threading
+import time
+import uuid
 import requests
 import openai
 import flask_jwt_extended
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
 import re
 
@@ -29,26 +53,176 @@ db.init_app(app)
 jwt = JWTManager(app)
 CORS(app)
 app.register_blueprint(auth_bp)
+app.register_blueprint(catalog_bp)
 
 # === Logging Configuration ===
 logging.basicConfig(level=logging.INFO)
 
 # === Load Products Database ===
 PRODUCTS_FILE = "products.json"
-try:
-    with open(PRODUCTS_FILE, "r") as f:
-        PRODUCTS = json.load(f)
-except FileNotFoundError:
-    logging.error(f"Products file not found: {PRODUCTS_FILE}")
-    PRODUCTS = []
-except Exception as e:
-    logging.error(f"Failed to load products: {e}")
-    PRODUCTS = []
+# Parsed incrementally and hot-reloaded when the file changes; always read
+# CATALOG_STORE.current once per request so a reload never splits a request
+CATALOG_STORE = CatalogStore(
+    PRODUCTS_FILE,
+    poll_interval=float(os.getenv("CATALOG_POLL_INTERVAL", "2")),
+    segment_dir=os.getenv("CATALOG_SEGMENT_DIR")  # share one mapped copy across workers
+)
+CATALOG_STORE.watch()
+app.extensions["catalog_store"] = CATALOG_STORE
+# "sql" serves /recommend from the shared products table (see `flask catalog import`)
+CATALOG_BACKEND = os.getenv("CATALOG_BACKEND", "memory")
+
+# === Recommendation Result Cache ===
+RECOMMEND_CACHE = RecommendationCache(
+    max_bytes=int(os.getenv("RECOMMEND_CACHE_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("RECOMMEND_CACHE_TTL", "300")),
+    budget_step=float(os.getenv("RECOMMEND_BUDGET_BUCKET", "25"))
+)
+app.extensions["recommend_cache"] = RECOMMEND_CACHE
+# Comparison matrices for frequently compared id sets, keyed per catalog version
+COMPARE_CACHE = LRUCache(max_bytes=int(os.getenv("COMPARE_CACHE_BYTES", str(16 * 1024 * 1024))))
+MAX_COMPARE_PRODUCTS = 100
+# === Product Summary Store ===
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_PROMPT_VERSION = "1"  # bump when the summary prompt changes
+SUMMARY_STORE = SummaryStore(
+    os.getenv("SUMMARY_CACHE_PATH", "summary_cache.sqlite3"),
+    max_bytes=int(os.getenv("SUMMARY_CACHE_BYTES", str(32 * 1024 * 1024))),
+    fresh_seconds=float(os.getenv("SUMMARY_FRESH_SECONDS", str(24 * 3600))),
+    stale_seconds=float(os.getenv("SUMMARY_STALE_SECONDS", str(7 * 24 * 3600)))
+)
+MAX_SUMMARY_PRODUCTS = 20
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 500
+MAX_BATCH_QUERIES = 100
 
 # === Set OpenAI API Key ===
 openai.api_key = os.getenv("OPENAI_API_KEY")
 if not openai.api_key:
     logging.warning("OPENAI_API_KEY environment variable not set!")
+# Point at a local OpenAI-compatible server for offline testing
+openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+
+# === LLM Client Pool ===
+# LLM calls run on their own threads with per-endpoint limits, and at most
+# LLM_REQUEST_THREADS request threads wait on them at once (keep it below
+# the server's threads per worker), so slow completions cannot take every
+# worker away from /recommend and auth. Async /generate-js jobs hold none.
+# Every call also waits for the provider's token and request budgets;
+# IDE calls are admitted ahead of batch /summarize work
+LLM_SCHEDULER = LLMScheduler(
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000")),
+    requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+)
+# While most recent calls fail or time out, skip OpenAI and serve fallbacks at once
+LLM_BREAKER = CircuitBreaker(
+    failure_ratio=float(os.getenv("LLM_BREAKER_FAILURE_RATIO", "0.5")),
+    min_calls=int(os.getenv("LLM_BREAKER_MIN_CALLS", "10")),
+    size=int(os.getenv("LLM_BREAKER_SIZE", "20")),
+    window=float(os.getenv("LLM_BREAKER_WINDOW", "30")),
+    reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "15"))
+)
+LLM_POOL = LLMClientPool(
+    max_workers=int(os.getenv("LLM_MAX_WORKERS", "16")),
+    limits={
+        "generate": int(os.getenv("LLM_GENERATE_CONCURRENCY", "8")),
+        "summarize": int(os.getenv("LLM_SUMMARIZE_CONCURRENCY", "4"))
+    },
+    timeouts={
+        "generate": float(os.getenv("LLM_GENERATE_TIMEOUT", "20")),
+        "summarize": float(os.getenv("LLM_SUMMARIZE_TIMEOUT", "45"))
+    },
+    scheduler=LLM_SCHEDULER,
+    # Summaries and background session folds wait behind interactive IDE calls
+    priorities={"summarize": BATCH, "memory": BATCH},
+    breaker=LLM_BREAKER,
+    hedge=[e.strip() for e in os.getenv("LLM_HEDGE_ENDPOINTS", "").split(",") if e.strip()],
+    timeout_factor=float(os.getenv("LLM_TIMEOUT_P95_FACTOR", "1.5")),
+    min_timeout=float(os.getenv("LLM_MIN_TIMEOUT", "2")),
+    max_waiting=int(os.getenv("LLM_REQUEST_THREADS", "8"))
+)
+app.extensions["llm_pool"] = LLM_POOL
+# Identical LLM requests in flight at the same time share one upstream call
+LLM_FLIGHTS = SingleFlight()
+
+def shared_llm_call(endpoint, key, fn, model="gpt-4o-mini"):
+    """LLM_FLIGHTS.do for a call to an LLM_POOL endpoint.
+
+    Callers waiting on another's call hold a request-thread slot like any
+    chat() caller (LLMBusyError when none is free) and wait at most the
+    endpoint's timeout (LLMTimeoutError).
+    """
+    try:
+        return LLM_FLIGHTS.do(key, fn, timeout=LLM_POOL.wait_timeout(endpoint),
+                              wait=lambda: LLM_POOL.waiting(endpoint, model))
+    except FutureTimeoutError:
+        raise LLMTimeoutError(f"Shared LLM call for {endpoint} did not finish in time")
+
+# === Metrics ===
+# Per-call LLM metrics are recorded by llm_client; these cover the routes
+HTTP_LATENCY = Histogram("http_request_duration_seconds",
+                         "Time to build a response (for event streams, until headers are sent)",
+                         ["route", "method", "status"])
+ROUTE_ANSWERS = Counter("llm_route_answers_total",
+                        "How LLM-backed routes were answered: template, cache, llm or fallback",
+                        ["route", "path"])
+SUMMARY_LOOKUPS = Counter("summary_cache_lookups_total", "Product summary lookups by cache status", ["status"])
+LLM_IN_FLIGHT = Gauge("llm_in_flight", "LLM calls currently running per endpoint", ["endpoint"])
+LLM_QUEUED = Gauge("llm_scheduler_queued", "LLM calls waiting for rate budget per priority", ["priority"])
+LLM_BUDGET = Gauge("llm_scheduler_available", "Rate budget currently available", ["budget"])
+LLM_TIMEOUT = Gauge("llm_timeout_seconds", "Current (p95-adaptive) chat timeout per endpoint", ["endpoint"])
+LLM_CIRCUIT_OPEN = Gauge("llm_circuit_open", "1 while the circuit breaker refuses LLM calls")
+SESSION_CONTEXT_TOKENS = Histogram("session_context_tokens", "Estimated tokens of AI session memory added to a prompt",
+                                   buckets=(0, 100, 250, 500, 1000, 1500, 2000, 3000, 5000))
+
+# === Generated Code Cache ===
+CODE_MODEL = "gpt-4o-mini"
+CODE_PROMPT_VERSION = "1"  # bump when the code generation prompt changes
+# Near-identical prompts for the same board/sensors reuse earlier completions
+PROMPT_CACHE = PromptCache(
+    os.getenv("PROMPT_CACHE_PATH", "prompt_cache.sqlite3"),
+    threshold=float(os.getenv("PROMPT_CACHE_THRESHOLD", "0.85")),
+    max_bytes=int(os.getenv("PROMPT_CACHE_BYTES", str(16 * 1024 * 1024))),
+    ttl=float(os.getenv("PROMPT_CACHE_TTL", str(7 * 24 * 3600)))
+)
+# Async /generate-js jobs by id (each entry counts as 1); jobs live in one
+# process, like the caches, and expire if nobody polls them
+GENERATE_JOBS = LRUCache(int(os.getenv("GENERATE_JOBS_MAX", "1000")),
+                         ttl=float(os.getenv("GENERATE_JOB_TTL", "600")))
+
+# === AI Session Memory ===
+def summarize_session(summary, turns, max_tokens):
+    """Fold older session turns into the rolling summary"""
+    if not openai.api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    transcript = "\n".join(f"{ROLE_NAMES[role]}: {text}" for role, text in turns)
+    response = LLM_POOL.chat(
+        "memory",
+        [
+            {"role": "system", "content": "You maintain the running summary of a coding session in a Three.js and "
+                                          "IoT IDE. Merge the new turns into the summary. Keep the user's goals, "
+                                          "decisions, object names, boards and sensors; drop pleasantries and code. "
+                                          f"Answer with the updated summary only, under {max_tokens * 3 // 4} words."},
+            {"role": "user", "content": f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"}
+        ],
+        model=CODE_MODEL,
+        max_tokens=max_tokens,
+        temperature=0.2,
+        background=True  # runs on the fold daemon, not a request thread
+    )
+    return response.choices[0].message.content
+
+# Requests with a `session_id` replay a fixed-size slice of the conversation:
+# recent turns, a rolling summary of older ones and recalled exchanges
+SESSION_MEMORY = SessionMemory(
+    summarize_session,
+    recent_tokens=int(os.getenv("SESSION_RECENT_TOKENS", "1200")),
+    summary_tokens=int(os.getenv("SESSION_SUMMARY_TOKENS", "300")),
+    recall_tokens=int(os.getenv("SESSION_RECALL_TOKENS", "400")),
+    fold_after=int(os.getenv("SESSION_FOLD_AFTER", "6")),
+    max_turns=int(os.getenv("SESSION_MAX_TURNS", "200"))
+)
 
 # === Agent Service Registry ===
 AGENT_ENDPOINTS = {
@@ -57,651 +231,428 @@ AGENT_ENDPOINTS = {
     "startup": "http://localhost:5003/startup"
 }
 
-# === AI Code Generation Templates ===
-AI_TEMPLATES = {
-    "gravity": """
-// AI-Generated: Gravity Physics System
-const gravitySystem = {
-    enabled: true,
-    strength: -9.81,
-    objects: [],
-    
-    addObject: function(mesh, mass = 1) {
-        if (!mesh.physics) {
-            mesh.physics = {
-                velocity: new THREE.Vector3(0, 0, 0),
-                mass: mass,
-                grounded: false
-            };
-        }
-        this.objects.push(mesh);
-    },
-    
-    update: function() {
-        if (!this.enabled) return;
-        
-        this.objects.forEach(obj => {
-            if (obj.physics) {
-                // Apply gravity
-                obj.physics.velocity.y += this.strength * 0.001;
-                
-                // Update position
-                obj.position.add(obj.physics.velocity);
-                
-                // Ground collision
-                if (obj.position.y <= 0.5) {
-                    obj.position.y = 0.5;
-                    obj.physics.velocity.y *= -0.8; // Bounce
-                    obj.physics.grounded = true;
-                } else {
-                    obj.physics.grounded = false;
-                }
-            }
-        });
-    },
-    
-    toggle: function() {
-        this.enabled = !this.enabled;
-    }
-};
-
-// Add gravity to existing meshes
-meshObjects.forEach(mesh => gravitySystem.addObject(mesh));
-
-// Update gravity in animation loop
-function updateGravity() {
-    gravitySystem.update();
-    requestAnimationFrame(updateGravity);
-}
-updateGravity();
-""",
-    
-    "draggable": """
-// AI-Generated: Draggable Objects System
-const dragSystem = {
-    raycaster: new THREE.Raycaster(),
-    mouse: new THREE.Vector2(),
-    dragObject: null,
-    dragPlane: new THREE.Plane(),
-    offset: new THREE.Vector3(),
-    
-    init: function() {
-        const canvas = document.getElementById('meshCanvas');
-        canvas.addEventListener('mousedown', this.onMouseDown.bind(this));
-        canvas.addEventListener('mousemove', this.onMouseMove.bind(this));
-        canvas.addEventListener('mouseup', this.onMouseUp.bind(this));
-    },
-    
-    onMouseDown: function(event) {
-        const rect = event.target.getBoundingClientRect();
-        this.mouse.x = ((event.clientX - rect.left) / rect.width) * 2 - 1;
-        this.mouse.y = -((event.clientY - rect.top) / rect.height) * 2 + 1;
-        
-        this.raycaster.setFromCamera(this.mouse, camera);
-        const intersects = this.raycaster.intersectObjects(meshObjects);
-        
-        if (intersects.length > 0) {
-            this.dragObject = intersects[0].object;
-            this.dragPlane.setFromNormalAndCoplanarPoint(camera.getWorldDirection(new THREE.Vector3()), intersects[0].point);
-            this.offset.copy(intersects[0].point).sub(this.dragObject.position);
-        }
-    },
-    
-    onMouseMove: function(event) {
-        if (!this.dragObject) return;
-        
-        const rect = event.target.getBoundingClientRect();
-        this.mouse.x = ((event.clientX - rect.left) / rect.width) * 2 - 1;
-        this.mouse.y = -((event.clientY - rect.top) / rect.height) * 2 + 1;
-        
-        this.raycaster.setFromCamera(this.mouse, camera);
-        const intersection = new THREE.Vector3();
-        this.raycaster.ray.intersectPlane(this.dragPlane, intersection);
-        
-        if (intersection) {
-            this.dragObject.position.copy(intersection.sub(this.offset));
-        }
-    },
-    
-    onMouseUp: function(event) {
-        this.dragObject = null;
-    }
-};
-
-dragSystem.init();
-""",
-    
-    "particles": """
-// AI-Generated: Particle System
-class ParticleSystem {
-    constructor(position = new THREE.Vector3(0, 5, 0)) {
-        this.particles = [];
-        this.position = position;
-        this.init();
-    }
-    
-    init() {
-        const geometry = new THREE.BufferGeometry();
-        const positions = [];
-        const colors = [];
-        const velocities = [];
-        
-        const particleCount = 1000;
-        
-        for (let i = 0; i < particleCount; i++) {
-            // Position
-            positions.push(
-                this.position.x + (Math.random() - 0.5) * 2,
-                this.position.y + Math.random() * 2,
-                this.position.z + (Math.random() - 0.5) * 2
-            );
-            
-            // Color
-            const color = new THREE.Color();
-            color.setHSL(Math.random(), 0.7, 0.5);
-            colors.push(color.r, color.g, color.b);
-            
-            // Velocity
-            velocities.push(
-                (Math.random() - 0.5) * 0.02,
-                Math.random() * 0.02,
-                (Math.random() - 0.5) * 0.02
-            );
-        }
-        
-        geometry.setAttribute('position', new THREE.Float32BufferAttribute(positions, 3));
-        geometry.setAttribute('color', new THREE.Float32BufferAttribute(colors, 3));
-        geometry.setAttribute('velocity', new THREE.Float32BufferAttribute(velocities, 3));
-        
-        const material = new THREE.PointsMaterial({ 
-            size: 0.05,
-            vertexColors: true,
-            transparent: true,
-            opacity: 0.8
-        });
-        
-        this.system = new THREE.Points(geometry, material);
-        scene.add(this.system);
-        
-        this.animate();
-    }
-    
-    animate() {
-        const positions = this.system.geometry.attributes.position.array;
-        const velocities = this.system.geometry.attributes.velocity.array;
-        
-        for (let i = 0; i < positions.length; i += 3) {
-            positions[i] += velocities[i];
-            positions[i + 1] += velocities[i + 1];
-            positions[i + 2] += velocities[i + 2];
-            
-            // Reset particles that fall too low
-            if (positions[i + 1] < -5) {
-                positions[i + 1] = this.position.y + Math.random() * 2;
-            }
-        }
-        
-        this.system.geometry.attributes.position.needsUpdate = true;
-        requestAnimationFrame(() => this.animate());
-    }
-}
-
-const particleSystem = new ParticleSystem();
-""",
-    
-    "lighting": """
-// AI-Generated: Dynamic Lighting System
-const lightingSystem = {
-    lights: [],
-    
-    init: function() {
-        // Remove existing lights except ambient
-        scene.children = scene.children.filter(child => 
-            !(child instanceof THREE.DirectionalLight || child instanceof THREE.SpotLight)
-        );
-        
-        // Add dynamic point lights
-        const colors = [0xff0040, 0x0040ff, 0x40ff00, 0xff4000];
-        
-        for (let i = 0; i < 4; i++) {
-            const light = new THREE.PointLight(colors[i], 1, 10);
-            light.position.set(
-                Math.cos(i * Math.PI / 2) * 3,
-                2,
-                Math.sin(i * Math.PI / 2) * 3
-            );
-            
-            // Add light helper
-            const helper = new THREE.PointLightHelper(light, 0.3);
-            scene.add(light);
-            scene.add(helper);
-            
-            this.lights.push({ light, helper, angle: i * Math.PI / 2 });
-        }
-        
-        this.animate();
-    },
-    
-    animate: function() {
-        this.lights.forEach((lightObj, index) => {
-            lightObj.angle += 0.02;
-            lightObj.light.position.set(
-                Math.cos(lightObj.angle) * 3,
-                2 + Math.sin(lightObj.angle * 2) * 0.5,
-                Math.sin(lightObj.angle) * 3
-            );
-            lightObj.helper.update();
-        });
-        
-        requestAnimationFrame(() => this.animate());
-    }
-};
-
-lightingSystem.init();
-""",
-    
-    "collision": """
-// AI-Generated: Collision Detection System
-const collisionSystem = {
-    objects: [],
-    
-    addObject: function(mesh, type = 'sphere') {
-        if (!mesh.collision) {
-            mesh.collision = {
-                type: type,
-                radius: this.getBoundingRadius(mesh),
-                onCollision: null
-            };
-        }
-        this.objects.push(mesh);
-    },
-    
-    getBoundingRadius: function(mesh) {
-        const box = new THREE.Box3().setFromObject(mesh);
-        return box.getSize(new THREE.Vector3()).length() / 2;
-    },
-    
-    checkCollisions: function() {
-        for (let i = 0; i < this.objects.length; i++) {
-            for (let j = i + 1; j < this.objects.length; j++) {
-                const objA = this.objects[i];
-                const objB = this.objects[j];
-                
-                const distance = objA.position.distanceTo(objB.position);
-                const minDistance = objA.collision.radius + objB.collision.radius;
-                
-                if (distance < minDistance) {
-                    this.handleCollision(objA, objB);
-                }
-            }
-        }
-    },
-    
-    handleCollision: function(objA, objB) {
-        // Simple collision response
-        const direction = new THREE.Vector3().subVectors(objB.position, objA.position).normalize();
-        const force = 0.1;
-        
-        if (objA.physics) {
-            objA.physics.velocity.add(direction.clone().multiplyScalar(-force));
-        }
-        if (objB.physics) {
-            objB.physics.velocity.add(direction.clone().multiplyScalar(force));
-        }
-        
-        // Visual feedback
-        objA.material.color.setHex(0xff0000);
-        objB.material.color.setHex(0xff0000);
-        
-        setTimeout(() => {
-            objA.material.color.setHex(0x00ff00);
-            objB.material.color.setHex(0x00ff00);
-        }, 200);
-        
-        // Trigger callbacks
-        if (objA.collision.onCollision) objA.collision.onCollision(objB);
-        if (objB.collision.onCollision) objB.collision.onCollision(objA);
-    },
-    
-    update: function() {
-        this.checkCollisions();
-        requestAnimationFrame(() => this.update());
-    }
-};
-
-// Add collision to existing meshes
-meshObjects.forEach(mesh => collisionSystem.addObject(mesh));
-collisionSystem.update();
-"""
-}
-
-# === Device Integration Templates ===
+# === Code Templates ===
+# Template bodies live in code_templates/ and are read from it on first use
+TEMPLATE_PACK = default_pack()
+AI_TEMPLATES = TEMPLATE_PACK.group("ai")
 DEVICE_TEMPLATES = {
-    "arduino": {
-        "temperature": """
-// Arduino Temperature Sensor (DHT22)
-#include "DHT.h"
-#define DHTPIN 2
-#define DHTTYPE DHT22
-DHT dht(DHTPIN, DHTTYPE);
-
-void setup() {
-    Serial.begin(9600);
-    dht.begin();
-}
-
-void loop() {
-    float temperature = dht.readTemperature();
-    float humidity = dht.readHumidity();
-    
-    if (!isnan(temperature)) {
-        Serial.print("Temperature: ");
-        Serial.print(temperature);
-        Serial.println("°C");
-        
-        // Send to web interface
-        Serial.print("DATA:");
-        Serial.print(temperature);
-        Serial.print(",");
-        Serial.println(humidity);
-    }
-    
-    delay(2000);
-}""",
-        
-        "motion": """
-// Arduino Motion Sensor (PIR)
-#define PIR_PIN 2
-#define LED_PIN 13
-
-void setup() {
-    Serial.begin(9600);
-    pinMode(PIR_PIN, INPUT);
-    pinMode(LED_PIN, OUTPUT);
-}
-
-void loop() {
-    int motionState = digitalRead(PIR_PIN);
-    
-    if (motionState == HIGH) {
-        digitalWrite(LED_PIN, HIGH);
-        Serial.println("MOTION_DETECTED");
-        delay(1000);
-    } else {
-        digitalWrite(LED_PIN, LOW);
-    }
-    
-    delay(100);
-}""",
-        
-        "light": """
-// Arduino Light Sensor (LDR)
-#define LDR_PIN A0
-#define LED_PIN 9
-
-void setup() {
-    Serial.begin(9600);
-    pinMode(LED_PIN, OUTPUT);
-}
-
-void loop() {
-    int lightValue = analogRead(LDR_PIN);
-    int brightness = map(lightValue, 0, 1023, 0, 255);
-    
-    analogWrite(LED_PIN, 255 - brightness); // Inverse control
-    
-    Serial.print("Light: ");
-    Serial.print(lightValue);
-    Serial.print(" Brightness: ");
-    Serial.println(brightness);
-    
-    delay(500);
-}"""
-    },
-    
-    "raspberry": {
-        "temperature": """
-# Raspberry Pi Temperature Sensor (DS18B20)
-import os
-import glob
-import time
-
-os.system('modprobe w1-gpio')
-os.system('modprobe w1-therm')
-
-base_dir = '/sys/bus/w1/devices/'
-device_folder = glob.glob(base_dir + '28*')[0]
-device_file = device_folder + '/w1_slave'
-
-def read_temp_raw():
-    f = open(device_file, 'r')
-    lines = f.readlines()
-    f.close()
-    return lines
-
-def read_temp():
-    lines = read_temp_raw()
-    while lines[0].strip()[-3:] != 'YES':
-        time.sleep(0.2)
-        lines = read_temp_raw()
-    equals_pos = lines[1].find('t=')
-    if equals_pos != -1:
-        temp_string = lines[1][equals_pos+2:]
-        temp_c = float(temp_string) / 1000.0
-        return temp_c
-
-while True:
-    temperature = read_temp()
-    print(f"Temperature: {temperature}°C")
-    time.sleep(1)""",
-        
-        "motion": """
-# Raspberry Pi Motion Sensor (PIR)
-import RPi.GPIO as GPIO
-import time
-
-PIR_PIN = 18
-LED_PIN = 24
-
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(PIR_PIN, GPIO.IN)
-GPIO.setup(LED_PIN, GPIO.OUT)
-
-def motion_detected(channel):
-    print("Motion detected!")
-    GPIO.output(LED_PIN, GPIO.HIGH)
-    time.sleep(1)
-    GPIO.output(LED_PIN, GPIO.LOW)
-
-GPIO.add_event_detect(PIR_PIN, GPIO.RISING, callback=motion_detected)
-
-try:
-    print("PIR Module ready...")
-    while True:
-        time.sleep(1)
-except KeyboardInterrupt:
-    print("Quit")
-    GPIO.cleanup()"""
-    },
-    
-    "esp32": {
-        "wifi_sensor": """
-// ESP32 WiFi Sensor Hub
-#include <WiFi.h>
-#include <WebServer.h>
-#include <ArduinoJson.h>
-
-const char* ssid = "your_wifi";
-const char* password = "your_password";
-
-WebServer server(80);
-
-// Sensor pins
-#define TEMP_PIN 34
-#define LIGHT_PIN 35
-#define MOTION_PIN 2
-
-void setup() {
-    Serial.begin(115200);
-    pinMode(MOTION_PIN, INPUT);
-    
-    WiFi.begin(ssid, password);
-    while (WiFi.status() != WL_CONNECTED) {
-        delay(1000);
-        Serial.println("Connecting to WiFi...");
-    }
-    
-    Serial.println("WiFi connected!");
-    Serial.print("IP address: ");
-    Serial.println(WiFi.localIP());
-    
-    server.on("/sensors", HTTP_GET, handleSensors);
-    server.begin();
-}
-
-void loop() {
-    server.handleClient();
-    delay(10);
+    board: TEMPLATE_PACK.group(f"device/{board}")
+    for board in dict.fromkeys(key.split("/")[1] for key in TEMPLATE_PACK.keys("device/"))
 }
 
-void handleSensors() {
-    DynamicJsonDocument json(1024);
-    
-    // Read sensors
-    int temperature = analogRead(TEMP_PIN);
-    int light = analogRead(LIGHT_PIN);
-    int motion = digitalRead(MOTION_PIN);
-    
-    json["temperature"] = map(temperature, 0, 4095, -40, 85);
-    json["light"] = map(light, 0, 4095, 0, 100);
-    json["motion"] = motion;
-    json["timestamp"] = millis();
-    
-    String response;
-    serializeJson(json, response);
-    
-    server.send(200, "application/json", response);
-}"""
-    }
-}
+# === Device Firmware ===
+# /device-code composes sketches from board and sensor fragments; every
+# board's single-sensor variants are rendered at startup
+FIRMWARE = FirmwareGenerator()
+if os.getenv("FIRMWARE_PRECOMPILE", "1") == "1":
+    FIRMWARE.precompile()
+
+# === Template Router ===
+# Prompts are matched against every built-in template in one pass; a
+# template answers a prompt locally when the prompt names an AI template or
+# the template explains most of its words
+TEMPLATE_MIN_COVERAGE = float(os.getenv("TEMPLATE_MIN_COVERAGE", "0.6"))
+CODE_GENERATOR = AICodeGenerator()
+
+def build_template_router():
+    routes = []
+    # Routes hold template keys, not bodies, so building the router reads no templates
+    for name in AI_TEMPLATES:
+        key = f"ai/{name}"
+        routes.append(Route(key, "javascript", lambda params, key=key: TEMPLATE_PACK.get(key), keywords_for(key),
+                            names=(name.replace("_", " "),)))
+    for board, sketches in DEVICE_TEMPLATES.items():
+        language = "python" if board == "raspberry" else "arduino"
+        for sensor in sketches:
+            key = f"device/{board}/{sensor}"
+            routes.append(Route(key, language, lambda params, key=key: TEMPLATE_PACK.get(key), keywords_for(key)))
+    for language, templates in CODE_GENERATOR.templates.items():
+        for name in templates:
+            render = lambda params, language=language, name=name: CODE_GENERATOR.render_template(language, name, **params)
+            routes.append(Route(f"{language}/{name}", language, render, keywords_for(f"{language}/{name}")))
+    return TemplateRouter(routes)
+
+TEMPLATE_ROUTER = build_template_router()
 
 # === Helper Functions ===
 def filter_products(budget, use_case, preferred_specs):
-    category_map = {
-        "robotics": ["microcontroller", "sensors"],
-        "iot": ["sensors", "boards"],
-        "ai": ["gpu", "computer"],
-        "gaming": ["computer", "graphics"],
-        "learning": ["kits", "tools"]
-    }
-    categories = category_map.get(use_case.lower(), [use_case.lower()])
-    filtered = []
-
-    for p in PRODUCTS:
-        if p["category"].lower() not in categories:
-            continue
-        try:
-            if float(p["price"]) > float(budget):
-                continue
-        except ValueError:
-            logging.warning(f"Invalid price format for product: {p.get('name')}")
-            continue
-
-        if preferred_specs:
-            if not all(k in p["specs"] and str(v).lower() in str(p["specs"][k]).lower()
-                       for k, v in preferred_specs.items()):
-                continue
-        filtered.append(p)
-
-    return sorted(filtered, key=lambda x: float(x["price"]) if isinstance(x["price"], (int, float, str)) and str(x["price"]).replace('.', '', 1).isdigit() else 0)
-
-def generate_ai_code(prompt, context=None):
-    """Generate JavaScript code using OpenAI based on prompt and context"""
+    if CATALOG_BACKEND == "sql":
+        return product_db.filter_products(budget, use_case, preferred_specs)
+    return RECOMMEND_CACHE.filter(CATALOG_STORE.current, budget, use_case, preferred_specs)
+
+def compare_products(product_ids):
+    catalog = CATALOG_STORE.current
+    key = (catalog.version, tuple(str(pid) for pid in product_ids))
+    comparison = COMPARE_CACHE.get(key)
+    if comparison is LRUCache.MISSING:
+        comparison = catalog.compare(product_ids)
+        COMPARE_CACHE.set(key, comparison)
+    return comparison
+
+def request_product_summary(products):
+    """Ask the LLM for a summary and comparison of the given products"""
+    response = LLM_POOL.chat(
+        "summarize",
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You are an electronics product advisor. Summarize each product "
+                                          "and compare them for a buyer, noting trade-offs in price and specs."},
+            {"role": "user", "content": f"Products:\n{json.dumps(products, indent=2)}"}
+        ],
+        max_tokens=600,
+        temperature=0.3
+    )
+    return response.choices[0].message.content.strip()
+
+def summarize_products(product_ids):
+    """Return (summary, cache status) for the given ids, (None, None) if none exist,
+    or (None, "unavailable") on a cache miss without an OpenAI key"""
+    catalog = CATALOG_STORE.current
+    products = [p for p in (catalog.get(pid) for pid in dict.fromkeys(product_ids)) if p is not None]
+    if not products:
+        return None, None
+    products.sort(key=lambda p: str(p.get("id", "")))
+    key = SummaryStore.make_key(products, SUMMARY_MODEL, SUMMARY_PROMPT_VERSION)
     if not openai.api_key:
-        return generate_fallback_code(prompt)
+        # Cached summaries are still served; only a miss needs OpenAI, and nothing is refreshed
+        return SUMMARY_STORE.lookup(key) or (None, "unavailable")
+    ids = [str(p.get("id", "")) for p in products]
+    # The key already covers model, prompt version and product content
+    return SUMMARY_STORE.get_or_create(
+        key, ids, lambda: shared_llm_call("summarize", ("summarize", key), lambda: request_product_summary(products),
+                                          model=SUMMARY_MODEL))
+
+def match_code_template(prompt, context=None):
+    """Built-in Three.js template that answers the prompt outright, if any.
+
+    A prompt naming an AI template ("gravity", "collision", ...) always gets
+    it, as before the router; any other template must explain
+    TEMPLATE_MIN_COVERAGE of the prompt's words.
+    """
+    match = TEMPLATE_ROUTER.best(prompt, context, languages=("javascript",),
+                                 min_score=1.0, min_coverage=TEMPLATE_MIN_COVERAGE)
+    return match.code() if match else None
+
+def code_generation_messages(prompt, context=None, history=None):
+    """Chat messages for a code generation prompt, its IDE context and any session memory"""
+    # Build context-aware system message
+    system_message = """You are an expert JavaScript developer specializing in Three.js 3D programming and IoT device integration. 
+    Generate clean, working JavaScript code that can be directly injected into a Three.js scene. 
+    Always include proper error handling and comments.
+    Focus on creating interactive, visually appealing 3D experiences."""
+    
+    if context:
+        if context.get('selectedBoard'):
+            system_message += f"\nTarget device: {context['selectedBoard']}."
+        if context.get('connectedSensors'):
+            system_message += f"\nConnected sensors: {', '.join(context['connectedSensors'])}."
+    
+    return [
+        {"role": "system", "content": system_message},
+        *(history or []),
+        {"role": "user", "content": f"Generate JavaScript code for: {prompt}"}
+    ]
+
+def request_ai_code(prompt, context=None, history=None):
+    """Code from a template, the prompt cache or OpenAI; None when only the local fallback can answer"""
+    if not openai.api_key:
+        return None
     
     try:
         # Check for template matches first
-        prompt_lower = prompt.lower()
-        for template_key, template_code in AI_TEMPLATES.items():
-            if template_key in prompt_lower:
-                return template_code
-        
-        # Build context-aware system message
-        system_message = """You are an expert JavaScript developer specializing in Three.js 3D programming and IoT device integration. 
-        Generate clean, working JavaScript code that can be directly injected into a Three.js scene. 
-        Always include proper error handling and comments.
-        Focus on creating interactive, visually appealing 3D experiences."""
-        
-        if context:
-            if context.get('selectedBoard'):
-                system_message += f"\nTarget device: {context['selectedBoard']}."
-            if context.get('connectedSensors'):
-                system_message += f"\nConnected sensors: {', '.join(context['connectedSensors'])}."
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"Generate JavaScript code for: {prompt}"}
-            ],
-            max_tokens=1000,
-            temperature=0.3
-        )
-        
-        generated_code = response.choices[0].message.content
-        
-        # Clean up the response to extract just the code
-        if "```javascript" in generated_code:
-            generated_code = generated_code.split("```javascript")[1].split("```")[0]
-        elif "```" in generated_code:
-            generated_code = generated_code.split("```")[1].split("```")[0]
-        
-        return generated_code.strip()
+        template_code = match_code_template(prompt, context)
+        if template_code is not None:
+            ROUTE_ANSWERS.inc(route="/generate-js", path="template")
+            return template_code
+        
+        if history:
+            # The answer depends on the conversation, so it is neither cached nor shared
+            response = LLM_POOL.chat("generate", model=CODE_MODEL,
+                                     messages=code_generation_messages(prompt, context, history),
+                                     max_tokens=1000, temperature=0.3)
+            ROUTE_ANSWERS.inc(route="/generate-js", path="llm")
+            return extract_code(response.choices[0].message.content)
+        
+        ctx = context_key(context, CODE_MODEL, CODE_PROMPT_VERSION)
+        cached = PROMPT_CACHE.get(prompt, ctx)
+        if cached is not None:
+            ROUTE_ANSWERS.inc(route="/generate-js", path="cache")
+            return cached
+        
+        def complete():
+            response = LLM_POOL.chat(
+                "generate",
+                model=CODE_MODEL,
+                messages=code_generation_messages(prompt, context),
+                max_tokens=1000,
+                temperature=0.3
+            )
+            # Clean up the response to extract just the code
+            code = extract_code(response.choices[0].message.content)
+            if code:
+                PROMPT_CACHE.put(prompt, ctx, code)
+            return code
+        
+        code = shared_llm_call("generate", ("generate", ctx, " ".join(prompt.lower().split())), complete,
+                               model=CODE_MODEL)
+        ROUTE_ANSWERS.inc(route="/generate-js", path="llm")
+        return code
         
     except Exception as e:
-        logging.error(f"OpenAI API error: {e}")
+        logging.error(f"OpenAI API error ({type(e).__name__}): {e}")
+        return None
+
+def start_generate_job(prompt, context=None):
+    """Start an async /generate-js job on the LLM pool; returns a Future of the code, None for the fallback"""
+    ctx = context_key(context, CODE_MODEL, CODE_PROMPT_VERSION)
+    job = Future()
+
+    def finish(call):
+        try:
+            code = extract_code(call.result().choices[0].message.content)
+            if code:
+                PROMPT_CACHE.put(prompt, ctx, code)
+            ROUTE_ANSWERS.inc(route="/generate-js", path="llm")
+        except Exception as e:
+            logging.error(f"OpenAI API error ({type(e).__name__}): {e}")
+            ROUTE_ANSWERS.inc(route="/generate-js", path="fallback")
+            code = None
+        job.set_result(code)
+
+    LLM_POOL.submit("generate", code_generation_messages(prompt, context), model=CODE_MODEL,
+                    max_tokens=1000, temperature=0.3).add_done_callback(finish)
+    return job
+
+def generate_ai_code(prompt, context=None, history=None, on_done=None):
+    """Generate JavaScript code using OpenAI based on prompt and context; on_done(code) sees real answers only"""
+    code = request_ai_code(prompt, context, history)
+    if code is None:
+        ROUTE_ANSWERS.inc(route="/generate-js", path="fallback")
         return generate_fallback_code(prompt)
+    if on_done:
+        on_done(code)
+    return code
+
+def stream_ai_code(prompt, context=None, history=None, on_done=None):
+    """Server-sent events for generate_ai_code: code deltas, then the full result.
+
+    on_done(code) runs after the final event is sent, and never for the local fallback.
+    """
+    code = None
+    if openai.api_key:
+        code = match_code_template(prompt, context)
+        if code is not None:
+            ROUTE_ANSWERS.inc(route="/generate-js", path="template")
+
+    if openai.api_key and code is None:
+        stripper = FenceStripper()
+        try:
+            ctx = context_key(context, CODE_MODEL, CODE_PROMPT_VERSION)
+            code = None if history else PROMPT_CACHE.get(prompt, ctx)
+            if code is not None:
+                ROUTE_ANSWERS.inc(route="/generate-js", path="cache")
+            else:
+                deltas = LLM_POOL.stream("generate", code_generation_messages(prompt, context, history),
+                                         model=CODE_MODEL, max_tokens=1000, temperature=0.3)
+                for delta in deltas:
+                    text = stripper.feed(delta)
+                    if text:
+                        yield sse_event("token", {"delta": text})
+                text = stripper.finish()
+                if text:
+                    yield sse_event("token", {"delta": text})
+                code = stripper.result
+                if code and not history:
+                    PROMPT_CACHE.put(prompt, ctx, code)
+                ROUTE_ANSWERS.inc(route="/generate-js", path="llm")
+        except Exception as e:
+            logging.error(f"OpenAI API error ({type(e).__name__}): {e}")
+            ROUTE_ANSWERS.inc(route="/generate-js", path="fallback")
+            # The final event replaces anything streamed so far
+            yield sse_event("done", {"code": generate_fallback_code(prompt), "fallback": True})
+            return
+    elif code is None:
+        ROUTE_ANSWERS.inc(route="/generate-js", path="fallback")
+        yield sse_event("done", {"code": generate_fallback_code(prompt)})
+        return
+
+    yield sse_event("done", {"code": code})
+    if on_done:
+        on_done(code)
+
+def explain_code_messages(code):
+    return [
+        {"role": "system", "content": "You are an expert JavaScript and Three.js mentor. Explain what the "
+                                      "given code does, step by step, in plain language for a learner."},
+        {"role": "user", "content": f"Explain this code:\n{code}"}
+    ]
+
+def optimize_code_messages(code):
+    return [
+        {"role": "system", "content": "You are an expert JavaScript and Three.js performance engineer. Return the "
+                                      "optimized code in a single fenced code block, followed by a bullet "
+                                      "list of the changes you made."},
+        {"role": "user", "content": f"Optimize this code:\n{code}"}
+    ]
+
+def explain_batch_messages(codes):
+    snippets = "\n\n".join(f"Snippet {i}:\n{code}" for i, code in enumerate(codes, 1))
+    return [
+        {"role": "system", "content": "You are an expert JavaScript and Three.js mentor. Explain what each "
+                                      "given snippet does, step by step, in plain language for a learner. "
+                                      "Start each explanation with a line 'Snippet <n>:' and keep the "
+                                      "snippets in order."},
+        {"role": "user", "content": f"Explain these {len(codes)} code snippets:\n\n{snippets}"}
+    ]
+
+def request_explanation(code):
+    response = LLM_POOL.chat("explain", explain_code_messages(code), model="gpt-4o-mini",
+                             max_tokens=800, temperature=0.3)
+    return response.choices[0].message.content.strip()
+
+def explain_code_batch(codes):
+    """Explain several small snippets with a single LLM call"""
+    if len(codes) == 1:
+        return [request_explanation(codes[0])]
+    response = LLM_POOL.chat("explain", explain_batch_messages(codes), model="gpt-4o-mini",
+                             max_tokens=min(4000, 500 * len(codes)), temperature=0.3)
+    explanations = split_sections(response.choices[0].message.content, len(codes))
+    if explanations is None:
+        logging.warning("Batched explanation lost its snippet headings; explaining each snippet separately")
+        return explain_separately(codes)
+    return explanations
+
+def explain_separately(codes):
+    """One explanation call per snippet, all in flight at once; a snippet whose call fails gets its error"""
+    calls = []
+    for code in codes:
+        try:
+            calls.append(LLM_POOL.submit("explain", explain_code_messages(code), model="gpt-4o-mini",
+                                         max_tokens=800, temperature=0.3))
+        except LLMBusyError as e:
+            calls.append(e)
+    results = []
+    with LLM_POOL.waiting("explain"):
+        deadline = time.monotonic() + LLM_POOL.wait_timeout("explain")
+        for call in calls:
+            try:
+                if isinstance(call, Exception):
+                    raise call
+                response = call.result(timeout=max(0.0, deadline - time.monotonic()))
+                results.append(response.choices[0].message.content.strip())
+            except FutureTimeoutError:
+                results.append(LLMTimeoutError("LLM call for explain timed out"))
+            except Exception as e:
+                results.append(e)
+    return results
+
+# Small /explain-code snippets arriving within a few milliseconds share one call
+EXPLAIN_BATCH_MAX_CHARS = int(os.getenv("EXPLAIN_BATCH_MAX_CHARS", "600"))
+EXPLAIN_BATCHER = MicroBatcher(
+    explain_code_batch,
+    window=float(os.getenv("EXPLAIN_BATCH_WINDOW", "0.05")),
+    max_items=int(os.getenv("EXPLAIN_BATCH_SIZE", "8"))
+)
+
+def record_llm_answer(route, fn):
+    """Call fn, counting its outcome as an llm or error answer for the route"""
+    try:
+        result = fn()
+    except Exception:
+        ROUTE_ANSWERS.inc(route=route, path="error")
+        raise
+    ROUTE_ANSWERS.inc(route=route, path="llm")
+    return result
+
+def explain_code(code):
+    def complete():
+        if len(code) <= EXPLAIN_BATCH_MAX_CHARS:
+            # Joining another request's batch waits like a chat() caller would, plus the batch window
+            try:
+                return EXPLAIN_BATCHER.submit(code, timeout=LLM_POOL.wait_timeout("explain") + EXPLAIN_BATCHER.window,
+                                              wait=lambda: LLM_POOL.waiting("explain"))
+            except FutureTimeoutError:
+                raise LLMTimeoutError("Batched LLM call for explain did not finish in time")
+        return request_explanation(code)
+    return record_llm_answer("/explain-code",
+                             lambda: shared_llm_call("explain", ("explain", "gpt-4o-mini", code), complete))
+
+def optimize_code(code):
+    """Return (optimized code, list of suggestions)"""
+    def complete():
+        response = LLM_POOL.chat("optimize", optimize_code_messages(code), model="gpt-4o-mini",
+                                 max_tokens=1200, temperature=0.2)
+        stripper = FenceStripper()
+        stripper.feed(response.choices[0].message.content)
+        stripper.finish()
+        return stripper.result, parse_suggestions(stripper.tail)
+    return record_llm_answer("/optimize-code",
+                             lambda: shared_llm_call("optimize", ("optimize", "gpt-4o-mini", code), complete))
+
+def stream_explanation(code):
+    """Server-sent events for explain_code: text deltas, then the full explanation"""
+    parts = []
+    try:
+        for delta in LLM_POOL.stream("explain", explain_code_messages(code), model="gpt-4o-mini",
+                                     max_tokens=800, temperature=0.3):
+            parts.append(delta)
+            yield sse_event("token", {"delta": delta})
+        ROUTE_ANSWERS.inc(route="/explain-code", path="llm")
+        yield sse_event("done", {"explanation": "".join(parts).strip()})
+    except Exception as e:
+        logging.error(f"OpenAI API error ({type(e).__name__}): {e}")
+        ROUTE_ANSWERS.inc(route="/explain-code", path="error")
+        yield sse_event("error", {"error": "Failed to explain code"})
+
+def stream_optimization(code):
+    """Server-sent events for optimize_code: code deltas, then code and suggestions"""
+    stripper = FenceStripper()
+    try:
+        for delta in LLM_POOL.stream("optimize", optimize_code_messages(code), model="gpt-4o-mini",
+                                     max_tokens=1200, temperature=0.2):
+            optimized = stripper.feed(delta)
+            if optimized:
+                yield sse_event("token", {"delta": optimized})
+        optimized = stripper.finish()
+        if optimized:
+            yield sse_event("token", {"delta": optimized})
+        ROUTE_ANSWERS.inc(route="/optimize-code", path="llm")
+        yield sse_event("done", {"optimized_code": stripper.result,
+                                 "suggestions": parse_suggestions(stripper.tail)})
+    except Exception as e:
+        logging.error(f"OpenAI API error ({type(e).__name__}): {e}")
+        ROUTE_ANSWERS.inc(route="/optimize-code", path="error")
+        yield sse_event("error", {"error": "Failed to optimize code"})
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 def generate_fallback_code(prompt):
     """Generate fallback code when OpenAI is not available"""
-    prompt_lower = prompt.lower()
-    
-    if "gravity" in prompt_lower:
-        return AI_TEMPLATES["gravity"]
-    elif "drag" in prompt_lower:
-        return AI_TEMPLATES["draggable"]
-    elif "particle" in prompt_lower:
-        return AI_TEMPLATES["particles"]
-    elif "light" in prompt_lower:
-        return AI_TEMPLATES["lighting"]
-    elif "collision" in prompt_lower:
-        return AI_TEMPLATES["collision"]
-    elif "cube" in prompt_lower or "box" in prompt_lower:
-        return """
-// AI-Generated: Create a rotating cube
-const geometry = new THREE.BoxGeometry(1, 1, 1);
-const material = new THREE.MeshPhongMaterial({ color: Math.random() * 0xffffff });
-const cube = new THREE.Mesh(geometry, material);
-cube.position.set(Math.random() * 4 - 2, 1, Math.random() * 4 - 2);
-scene.add(cube);
-meshObjects.push(cube);
-
-// Add rotation animation
-function animateCube() {
-    cube.rotation.x += 0.01;
-    cube.rotation.y += 0.01;
-    requestAnimationFrame(animateCube);
-}
-animateCube();
-"""
-    else:
-        return f"""
+    match = TEMPLATE_ROUTER.best(prompt, languages=("javascript",))
+    if match is not None:
+        return match.code()
+    return f"""
 // AI-Generated code for: {prompt}
 console.log('AI processing: {prompt}');
 // This is a placeholder - OpenAI integration needed for full functionality
 """
 
+# === Request Timing ===
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method,
+                             status=str(response.status_code))
+    return response
+
 # === Flask Routes ===
 @app.route("/")
 def home():
@@ -712,6 +663,226 @@ def home():
     except Exception as e:
         return f"Failed to load IDE: {e}", 500
 
+def current_ai_session(session_id):
+    """The caller's AISession with this id, or None; requires a valid JWT"""
+    verify_jwt_in_request()
+    session = db.session.get(AISession, session_id)
+    if session is None or str(session.user_id) != str(get_jwt_identity()):
+        return None
+    return session
+
+def remember_turn(session_id, prompt, code):
+    # Loaded again: a streamed answer finishes outside the request's database session
+    session = db.session.get(AISession, session_id)
+    SESSION_MEMORY.record(session, prompt, code)
+    db.session.commit()
+    fold_in_background(session_id, SESSION_MEMORY.pending_fold(session))
+
+_folding = set()
+_folding_lock = threading.Lock()
+
+def fold_in_background(session_id, fold):
+    """Summarize a session's backlog on a daemon thread, so no response waits for the summarizer"""
+    if fold is None:
+        return
+    with _folding_lock:
+        if session_id in _folding:
+            return  # the next turn picks up whatever this fold leaves behind
+        _folding.add(session_id)
+
+    def run():
+        try:
+            summary = SESSION_MEMORY.fold(fold[2], fold[3])
+            with app.app_context():
+                session = db.session.get(AISession, session_id)
+                if session is not None and SESSION_MEMORY.apply_fold(session, fold, summary):
+                    db.session.commit()
+        except Exception as e:
+            logging.warning(f"Session {session_id} fold failed: {e}")
+        finally:
+            with _folding_lock:
+                _folding.discard(session_id)
+
+    threading.Thread(target=run, name="session-fold", daemon=True).start()
+
+@app.route("/generate-js", methods=["POST"])
+def generate_js():
+    try:
+        data = request.get_json()
+        prompt = data.get("prompt")
+        if not prompt:
+            return jsonify({"error": "Missing 'prompt'"}), 400
+        session = history = None
+        if data.get("session_id") is not None:
+            if not isinstance(data["session_id"], int) or isinstance(data["session_id"], bool):
+                return jsonify({"error": "'session_id' must be an integer"}), 400
+            session = current_ai_session(data["session_id"])
+            if session is None:
+                return jsonify({"error": "AI session not found"}), 404
+            history = SESSION_MEMORY.context_messages(session, prompt)
+            SESSION_CONTEXT_TOKENS.observe(sum(len(m["content"]) for m in history) // 4)
+        if data.get("async"):
+            if session is not None:
+                return jsonify({"error": "'async' cannot be combined with 'session_id'"}), 400
+            return generate_js_job(prompt, data.get("context"))
+        on_done = None
+        if session is not None:
+            session_id = session.id
+
+            def on_done(code):
+                # Only real answers are remembered, never the local fallback; the answer is sent either way
+                try:
+                    remember_turn(session_id, prompt, code)
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"AI session {session_id} turn not saved: {e}")
+        if data.get("stream"):
+            return sse_response(stream_ai_code(prompt, data.get("context"), history, on_done))
+        return jsonify({"code": generate_ai_code(prompt, data.get("context"), history, on_done)})
+    except (JWTExtendedException, InvalidTokenError):
+        raise  # answered 401/422 by JWTManager
+    except Exception as e:
+        logging.error(f"Code generation error: {e}")
+        return jsonify({"error": "Failed to generate code"}), 500
+
+def generate_js_job(prompt, context=None):
+    """202 with a job id to poll; templates, cache hits and the fallback are answered at once"""
+    if openai.api_key:
+        code, path = match_code_template(prompt, context), "template"
+        if code is None:
+            code, path = PROMPT_CACHE.get(prompt, context_key(context, CODE_MODEL, CODE_PROMPT_VERSION)), "cache"
+        if code is not None:
+            ROUTE_ANSWERS.inc(route="/generate-js", path=path)
+            return jsonify({"status": "done", "code": code})
+        try:
+            job = start_generate_job(prompt, context)
+        except Exception as e:
+            logging.error(f"OpenAI API error ({type(e).__name__}): {e}")
+        else:
+            job_id = uuid.uuid4().hex
+            GENERATE_JOBS.set(job_id, (job, prompt), size=1)
+            return jsonify({"status": "pending", "job_id": job_id}), 202
+    ROUTE_ANSWERS.inc(route="/generate-js", path="fallback")
+    return jsonify({"status": "done", "code": generate_fallback_code(prompt)})
+
+@app.route("/generate-js/jobs/<job_id>", methods=["GET"])
+def generate_js_job_status(job_id):
+    entry = GENERATE_JOBS.get(job_id, None)
+    if entry is None:
+        return jsonify({"error": "Job not found"}), 404
+    job, prompt = entry
+    if not job.done():
+        return jsonify({"status": "pending"}), 202
+    code = job.result()
+    if code is None:
+        return jsonify({"status": "done", "code": generate_fallback_code(prompt), "fallback": True})
+    return jsonify({"status": "done", "code": code})
+
+@app.route("/ai/sessions", methods=["POST"])
+@jwt_required()
+def create_ai_session():
+    data = request.get_json(silent=True) or {}
+    session = AISession(user_id=int(get_jwt_identity()), title=data.get("title"), turns=[], summarized=0)
+    db.session.add(session)
+    db.session.commit()
+    return jsonify(session.to_dict()), 201
+
+@app.route("/ai/sessions/<int:session_id>", methods=["GET"])
+@jwt_required()
+def get_ai_session(session_id):
+    session = current_ai_session(session_id)
+    if session is None:
+        return jsonify({"error": "AI session not found"}), 404
+    return jsonify(session.to_dict())
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus metrics for this worker process"""
+    for endpoint, stats in LLM_POOL.stats().items():
+        LLM_IN_FLIGHT.set(stats["in_flight"], endpoint=endpoint)
+        LLM_TIMEOUT.set(stats["timeout"], endpoint=endpoint)
+    LLM_CIRCUIT_OPEN.set(int(LLM_BREAKER.state == CircuitBreaker.OPEN))
+    scheduler = LLM_SCHEDULER.stats()
+    for priority, queued in scheduler["queued"].items():
+        LLM_QUEUED.set(queued, priority=priority)
+    LLM_BUDGET.set(scheduler["tokens_available"], budget="tokens")
+    LLM_BUDGET.set(scheduler["requests_available"], budget="requests")
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/llm/status", methods=["GET"])
+def llm_status():
+    return jsonify({"pool": LLM_POOL.stats(), "scheduler": LLM_SCHEDULER.stats(), "breaker": LLM_BREAKER.stats(),
+                    "prompt_cache": PROMPT_CACHE.stats(), "coalesced": LLM_FLIGHTS.stats(),
+                    "explain_batches": EXPLAIN_BATCHER.stats()})
+
+@app.route("/explain-code", methods=["POST"])
+def explain_code_route():
+    try:
+        data = request.get_json()
+        code = data.get("code")
+        if not code:
+            return jsonify({"error": "Missing 'code'"}), 400
+        if not openai.api_key:
+            return jsonify({"error": "Code explanations are unavailable: OPENAI_API_KEY is not set"}), 503
+        if data.get("stream"):
+            return sse_response(stream_explanation(code))
+        return jsonify({"explanation": explain_code(code)})
+    except (LLMBusyError, LLMTimeoutError) as e:
+        logging.warning(f"Code explanation unavailable: {e}")
+        return jsonify({"error": "Code explanations are busy, please retry shortly"}), 503
+    except Exception as e:
+        logging.error(f"OpenAI API error: {e}")
+        return jsonify({"error": "Failed to explain code"}), 500
+
+@app.route("/optimize-code", methods=["POST"])
+def optimize_code_route():
+    try:
+        data = request.get_json()
+        code = data.get("code")
+        if not code:
+            return jsonify({"error": "Missing 'code'"}), 400
+        if not openai.api_key:
+            return jsonify({"error": "Code optimization is unavailable: OPENAI_API_KEY is not set"}), 503
+        if data.get("stream"):
+            return sse_response(stream_optimization(code))
+        optimized_code, suggestions = optimize_code(code)
+        return jsonify({"optimized_code": optimized_code, "suggestions": suggestions})
+    except (LLMBusyError, LLMTimeoutError) as e:
+        logging.warning(f"Code optimization unavailable: {e}")
+        return jsonify({"error": "Code optimization is busy, please retry shortly"}), 503
+    except Exception as e:
+        logging.error(f"OpenAI API error: {e}")
+        return jsonify({"error": "Failed to optimize code"}), 500
+
+@app.route("/device-code", methods=["POST"])
+def device_code():
+    try:
+        data = request.get_json() or {}
+        context = data.get("context") or {}
+        board = data.get("board") or context.get("selectedBoard")
+        sensors = data.get("sensors") or context.get("connectedSensors")
+        if not board or not sensors:
+            return jsonify({"error": "Missing 'board' and 'sensors' (or 'context.selectedBoard' and "
+                                     "'context.connectedSensors')"}), 400
+        try:
+            spec = FIRMWARE.spec(board, sensors, pins=data.get("pins"), interval_ms=data.get("interval_ms"),
+                                 baud=data.get("baud"), output=data.get("output", "json"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify({
+            "code": FIRMWARE.render(spec),
+            "language": FIRMWARE.language(spec),
+            "board": spec.board,
+            "sensors": list(spec.sensors),
+            "pins": FIRMWARE.sensor_pins(spec),
+            "interval_ms": spec.interval_ms,
+            "baud": spec.baud,
+            "output": spec.output
+        })
+    except Exception as e:
+        logging.error(f"Device code generation error: {e}")
+        return jsonify({"error": "Failed to generate device code"}), 500
+
 @app.route("/recommend", methods=["POST"])
 def recommend():
     try:
@@ -721,7 +892,125 @@ def recommend():
         preferred_specs = data.get("preferred_specs", {})
 
         if budget is None or use_case is None:
-            return jsonify({"error": "Missing 'budget' or 'use_case
+            return jsonify({"error": "Missing 'budget' or 'use_case'"}), 400
+
+        limit = data.get("limit")
+        cursor = data.get("cursor")
+        if not data.get("stream") and limit is None and cursor is None:
+            return jsonify({"recommendations": filter_products(budget, use_case, preferred_specs)})
+
+        # Paginated and streaming modes read one snapshot for the whole response
+        if CATALOG_BACKEND == "sql":
+            stream, page_products = product_db.stream_products, product_db.page_products
+        else:
+            catalog = CATALOG_STORE.current
+            stream, page_products = catalog.stream, catalog.page
+        try:
+            budget = float(budget)
+            if data.get("stream"):
+                lines = (json.dumps(p) + "\n" for p in stream(budget, use_case, preferred_specs))
+                return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+            limit = int(limit if limit is not None else DEFAULT_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError(f"limit must be positive, got {limit}")
+            page, next_cursor = page_products(budget, use_case, preferred_specs,
+                                              limit=min(limit, MAX_PAGE_SIZE), cursor=cursor)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid 'budget', 'limit' or 'cursor': {e}"}), 400
+        return jsonify({"recommendations": page, "next_cursor": next_cursor})
+    except Exception as e:
+        logging.error(f"Recommendation error: {e}")
+        return jsonify({"error": "Failed to generate recommendations"}), 500
+
+def batch_query_error(query):
+    """Why a /recommend/batch query cannot run, or None if it can"""
+    if not isinstance(query, dict):
+        return "Each query must be an object"
+    if query.get("budget") is None or query.get("use_case") is None:
+        return "Missing 'budget' or 'use_case'"
+    try:
+        float(query["budget"])
+    except (TypeError, ValueError):
+        return f"Invalid 'budget': {query['budget']}"
+    if not isinstance(query.get("preferred_specs") or {}, dict):
+        return "'preferred_specs' must be an object"
+    return None
+
+@app.route("/recommend/batch", methods=["POST"])
+def recommend_batch():
+    try:
+        data = request.get_json()
+        queries = data.get("queries")
+        if not isinstance(queries, list) or not queries:
+            return jsonify({"error": "'queries' must be a non-empty array"}), 400
+        if len(queries) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+        results = []
+        valid = []
+        for query in queries:
+            error = batch_query_error(query)
+            if error is not None:
+                results.append({"error": error})
+            else:
+                results.append(None)
+                valid.append(query)
+
+        if CATALOG_BACKEND == "sql":
+            recommendations = iter(product_db.filter_batch(valid))
+        else:
+            recommendations = iter(CATALOG_STORE.current.filter_batch(valid))
+        results = [r if r is not None else {"recommendations": next(recommendations)} for r in results]
+        return jsonify({"results": results})
+    except Exception as e:
+        logging.error(f"Batch recommendation error: {e}")
+        return jsonify({"error": "Failed to generate recommendations"}), 500
+
+@app.route("/compare", methods=["POST"])
+def compare():
+    try:
+        data = request.get_json()
+        product_ids = data.get("product_ids")
+        if not isinstance(product_ids, list) or not product_ids:
+            return jsonify({"error": "'product_ids' must be a non-empty array"}), 400
+        if len(product_ids) > MAX_COMPARE_PRODUCTS:
+            return jsonify({"error": f"At most {MAX_COMPARE_PRODUCTS} products per comparison"}), 400
+        return jsonify(compare_products(product_ids))
+    except Exception as e:
+        logging.error(f"Comparison error: {e}")
+        return jsonify({"error": "Failed to compare products"}), 500
+
+@app.route("/summarize", methods=["POST"])
+def summarize():
+    try:
+        data = request.get_json()
+        product_ids = data.get("product_ids")
+        if not isinstance(product_ids, list) or not product_ids:
+            return jsonify({"error": "'product_ids' must be a non-empty array"}), 400
+        if len(product_ids) > MAX_SUMMARY_PRODUCTS:
+            return jsonify({"error": f"At most {MAX_SUMMARY_PRODUCTS} products per summary"}), 400
+        try:
+            summary, status = summarize_products(product_ids)
+        except Exception:
+            ROUTE_ANSWERS.inc(route="/summarize", path="error")
+            raise
+        if status == "unavailable":
+            return jsonify({"error": "Summaries are unavailable: OPENAI_API_KEY is not set"}), 503
+        if summary is None:
+            return jsonify({"error": "None of the requested products were found"}), 404
+        SUMMARY_LOOKUPS.inc(status=status)
+        ROUTE_ANSWERS.inc(route="/summarize", path="llm" if status == "miss" else "cache")
+        response = jsonify({"summary": summary})
+        response.headers["X-Summary-Cache"] = status
+        return response
+    except (LLMBusyError, LLMTimeoutError) as e:
+        logging.warning(f"Summary unavailable: {e}")
+        return jsonify({"error": "Summaries are busy, please retry shortly"}), 503
+    except Exception as e:
+        logging.error(f"OpenAI API error: {e}")
+        return jsonify({"error": "Failed to summarize products"}), 500
+
 # === Start the Flask Server ===
 if __name__ == "__main__":
     # Ensure database tables are created when the app starts if they don't exist
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 import json
 
@@ -124,4 +125,72 @@ class Scene(db.Model):
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
     
-    #
\ No newline at end of file
+    # Ownership (User.scenes needs this key to map)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AISession(db.Model):
+    """Conversation with the code assistant, kept small enough to replay into every prompt"""
+    __tablename__ = 'ai_sessions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=True)
+    
+    # Turns as compact [role, text] pairs, role "u" (user) or "a" (assistant)
+    turns = db.Column(db.JSON, nullable=False, default=list)
+    # Rolling summary of the first `summarized` turns
+    summary = db.Column(db.Text, nullable=True)
+    summarized = db.Column(db.Integer, default=0)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<AISession {self.id} of user {self.user_id}>"
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'turn_count': len(self.turns or []),
+            'summary': self.summary,
+            'summarized_turns': self.summarized or 0,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+# JSONB on Postgres so the specs column can carry a GIN index
+SpecsType = db.JSON().with_variant(JSONB(), "postgresql")
+
+class Product(db.Model):
+    """Catalog product shared by every app node through the database"""
+    __tablename__ = 'products'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String(100), nullable=False, unique=True)
+    name = db.Column(db.String(255), nullable=True)
+    category = db.Column(db.String(100), nullable=False)  # lowercased
+    price = db.Column(db.Float, nullable=False)
+    specs = db.Column(SpecsType, nullable=True)  # values lowercased for matching
+    data = db.Column(db.JSON, nullable=False)  # the product exactly as imported
+
+    __table_args__ = (
+        # /recommend is one range scan per category, already in (price, id) order
+        db.Index('ix_products_category_price', 'category', 'price', 'product_id'),
+        db.Index('ix_products_specs', 'specs', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+    def __repr__(self):
+        return f"<Product {self.product_id}>"
+
+class CatalogImport(db.Model):
+    """One load of the products table; app nodes rebuild what they derive from it when a newer one lands"""
+    __tablename__ = 'catalog_imports'
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False)
+    imported_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CatalogImport {self.id} of {self.product_count} products>"
@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, false, func, insert, select, tuple_
+
+from caching import LRUCache
+from catalog import CATEGORY_ALIASES, CATEGORY_MAP, SEMANTIC_MEMO_BYTES, decode_cursor, encode_cursor, \
+    normalize_specs, product_id
+from catalog_store import iter_products
+from models import CatalogImport, Product, db
+from product_search import SemanticIndex, product_tokens
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+STREAM_PAGE_SIZE = 1000
+# How often a node asks the database whether a newer import replaced the table
+INDEX_CHECK_INTERVAL = 2.0
+
+# Bulk loads and /recommend reads go through Core: no ORM entities are built
+products_table = Product.__table__
+
+
+def import_products(path: str, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+    """Replace the products table with the contents of a products.json file"""
+    db.create_all()
+    seen = set()
+    batch: List[Dict] = []
+    count = 0
+    db.session.execute(delete(products_table))
+    for product in iter_products(path):
+        try:
+            price = float(product["price"])
+        except (KeyError, TypeError, ValueError):
+            logger.warning(f"Invalid price format for product: {product.get('name')}")
+            continue
+        pid = product_id(product)
+        if pid in seen:
+            logger.warning(f"Skipping duplicate product id: {pid}")
+            continue
+        seen.add(pid)
+        batch.append({
+            "product_id": pid,
+            "name": product.get("name"),
+            "category": str(product.get("category", "")).lower(),
+            "price": price,
+            "specs": {k: str(v).lower() for k, v in (product.get("specs") or {}).items()},
+            "data": product
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(insert(products_table), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(products_table), batch)
+        count += len(batch)
+    db.session.add(CatalogImport(product_count=count))
+    # Readers keep seeing the previous catalog until this commits
+    db.session.commit()
+    logger.info(f"Imported {count} products from {path}")
+    return count
+
+
+class TableIndex:
+    """Categories and free-text index of one import of the products table.
+
+    Built from the table itself, so every node answers use cases the same
+    way without a products.json of its own.
+    """
+
+    def __init__(self, version: int, categories: Set[str], product_ids: List[str], semantic: SemanticIndex):
+        self.version = version
+        self.categories = categories
+        self.product_ids = product_ids  # in (price, id) order, the semantic index's rows
+        self.semantic = semantic
+        self._search_memo = LRUCache(SEMANTIC_MEMO_BYTES)
+
+    @classmethod
+    def load(cls, version: int) -> "TableIndex":
+        c = products_table.c
+        rows = db.session.execute(select(c.product_id, c.category, c.data).order_by(c.price, c.product_id)).all()
+        semantic = SemanticIndex.build(product_tokens(row.data, CATEGORY_ALIASES.get(row.category, ()))
+                                       for row in rows)
+        return cls(version, {row.category for row in rows}, [row.product_id for row in rows], semantic)
+
+    def categories_for(self, use_case: str) -> List[str]:
+        """Categories in the table a use case expands to; none for free text"""
+        use_case = str(use_case).lower()
+        if use_case in CATEGORY_MAP:
+            return [c for c in CATEGORY_MAP[use_case] if c in self.categories]
+        return [use_case] if use_case in self.categories else []
+
+    def search(self, use_case: str) -> List[str]:
+        """Ids of the products nearest to a free-text use case"""
+        key = " ".join(str(use_case).lower().split())
+        ids = self._search_memo.get(key)
+        if ids is LRUCache.MISSING:
+            ids = [self.product_ids[row] for row in self.semantic.search(key).tolist()]
+            self._search_memo.set(key, ids)
+        return ids
+
+
+_index: Optional[TableIndex] = None
+_index_checked = 0.0
+_index_lock = threading.Lock()
+
+
+def table_index() -> TableIndex:
+    """The TableIndex of the latest import, checked at most every INDEX_CHECK_INTERVAL seconds"""
+    global _index, _index_checked
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - _index_checked < INDEX_CHECK_INTERVAL:
+        return index
+    with _index_lock:
+        if _index is not None and time.monotonic() - _index_checked < INDEX_CHECK_INTERVAL:
+            return _index
+        version = db.session.execute(select(func.max(CatalogImport.id))).scalar() or 0
+        if _index is None or _index.version != version:
+            _index = TableIndex.load(version)
+        _index_checked = time.monotonic()
+        return _index
+
+
+def _candidates(stmt, use_case: str):
+    """Restrict stmt to a use case: its categories, else the products its text matches"""
+    c = products_table.c
+    index = table_index()
+    categories = index.categories_for(use_case)
+    if categories:
+        return stmt.where(c.category.in_(categories))
+    ids = index.search(use_case)
+    return stmt.where(c.product_id.in_(ids) if ids else false())
+
+
+def _query(budget: float, use_case: str, preferred_specs: Optional[Dict],
+           after: Optional[Tuple[float, str]] = None):
+    c = products_table.c
+    stmt = _candidates(select(c.data, c.price, c.product_id), use_case).where(c.price <= budget)
+    postgres = db.engine.dialect.name == "postgresql"
+    for key, value in normalize_specs(preferred_specs):
+        if postgres:
+            # Key existence is answered by the GIN index; the substring check runs on its hits
+            stmt = stmt.where(c.specs.op("?")(key))
+        stmt = stmt.where(c.specs[key].as_string().contains(value, autoescape=True))
+    if after is not None:
+        stmt = stmt.where(tuple_(c.price, c.product_id) > tuple_(*after))
+    return stmt.order_by(c.price, c.product_id)
+
+
+def filter_products(budget, use_case: str, preferred_specs: Optional[Dict] = None) -> List[Dict]:
+    """Products within budget for a use case, cheapest first, filtered in SQL"""
+    try:
+        budget = float(budget)
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid budget: {budget}")
+        return []
+    return [row.data for row in db.session.execute(_query(budget, use_case, preferred_specs))]
+
+
+def page_products(budget: float, use_case: str, preferred_specs: Optional[Dict] = None,
+                  limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Top `limit` matches after an optional keyset cursor, plus the next cursor"""
+    after = decode_cursor(cursor) if cursor else None
+    rows = db.session.execute(_query(budget, use_case, preferred_specs, after).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.price, last.product_id)
+    return [row.data for row in rows[:limit]], next_cursor
+
+
+def stream_products(budget: float, use_case: str, preferred_specs: Optional[Dict] = None) -> Iterator[Dict]:
+    """Yield every match cheapest first, one keyset page per query"""
+    cursor = None
+    while True:
+        products, cursor = page_products(budget, use_case, preferred_specs, STREAM_PAGE_SIZE, cursor)
+        yield from products
+        if cursor is None:
+            return
+
+
+def _specs_match(specs: Optional[Dict], wanted: List[Tuple[str, str]]) -> bool:
+    """The SQL spec predicate of _query, for rows already fetched"""
+    specs = specs or {}
+    return all(key in specs and value in str(specs[key]) for key, value in wanted)
+
+
+def filter_batch(queries: List[Dict]) -> List[List[Dict]]:
+    """filter_products for many validated queries with one SQL query per category set.
+
+    Queries expanding to the same categories (or, for free text, the same
+    normalized use case) share one scan up to their highest budget; each
+    then takes its own budget prefix and spec filters, as
+    Catalog.filter_batch does in memory.
+    """
+    c = products_table.c
+    index = table_index()
+    results: List[List[Dict]] = [[] for _ in queries]
+    groups: Dict[Tuple[str, ...], List[Tuple[str, int, float, List[Tuple[str, str]]]]] = {}
+    for i, query in enumerate(queries):
+        use_case = " ".join(str(query["use_case"]).lower().split())
+        group = tuple(index.categories_for(use_case)) or ("", use_case)
+        wanted = normalize_specs(query.get("preferred_specs"))
+        groups.setdefault(group, []).append((use_case, i, float(query["budget"]), wanted))
+
+    for members in groups.values():
+        stmt = _candidates(select(c.data, c.price, c.specs), members[0][0])
+        rows = db.session.execute(stmt.where(c.price <= max(m[2] for m in members))
+                                  .order_by(c.price, c.product_id)).all()
+        for _, i, budget, wanted in members:
+            results[i] = [row.data for row in rows if row.price <= budget and _specs_match(row.specs, wanted)]
+    return results
@@ -0,0 +1,111 @@
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# Hashed TF-IDF vectors searched through an impact-ordered inverted index.
+# Everything is computed locally from the catalog text: no network, model
+# files or GPU involved.
+HASH_BITS = 18
+HASH_DIM = 1 << HASH_BITS
+MAX_POSTINGS = 1 << 18   # per query term, only the highest-weighted rows are read
+MIN_SCORE = 0.15         # cosine similarity needed to count as a match
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric words"""
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def product_tokens(product: Dict, aliases: Iterable[str] = ()) -> List[str]:
+    """Searchable words for a product: name, category, aliases and specs"""
+    parts = [str(product.get("name", "")), str(product.get("category", ""))]
+    parts.extend(aliases)
+    for key, value in (product.get("specs") or {}).items():
+        parts.append(str(key).replace("_", " "))
+        parts.append(str(value))
+    return tokenize(" ".join(parts))
+
+
+@lru_cache(maxsize=1 << 16)
+def feature_id(token: str) -> int:
+    """Hashed feature for a token, stable across processes"""
+    # Naive plural strip so "drones" and "drone" share a feature
+    if len(token) > 3 and token[-1] == "s" and token[-2] != "s":
+        token = token[:-1]
+    return zlib.crc32(token.encode()) & (HASH_DIM - 1)
+
+
+class SemanticIndex:
+    """Approximate nearest-neighbour search over product text.
+
+    Each hashed feature's posting list holds (row, weight) pairs sorted by
+    descending weight, where weights are the rows' L2-normalized TF-IDF
+    values. Scoring a query reads at most MAX_POSTINGS entries per term, so
+    its cost stays bounded however common a term is; rows past that cut
+    only lose that (low-idf) term's contribution.
+    """
+
+    def __init__(self, idf: np.ndarray, offsets: np.ndarray,
+                 rows: np.ndarray, weights: np.ndarray):
+        self.idf = idf
+        self.offsets = offsets
+        self.rows = rows
+        self.weights = weights
+
+    @classmethod
+    def build(cls, documents: Iterable[List[str]]) -> "SemanticIndex":
+        lengths, features = [], []
+        for tokens in documents:
+            lengths.append(len(tokens))
+            features.extend(map(feature_id, tokens))
+        size = len(lengths)
+        if not size:
+            return cls(np.ones(HASH_DIM, dtype=np.float32), np.zeros(HASH_DIM + 1, dtype=np.int64),
+                       np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+
+        # One (doc, feature) entry per distinct term with its count
+        doc_ids = np.repeat(np.arange(size, dtype=np.int64), lengths)
+        pairs, counts = np.unique(doc_ids * HASH_DIM + np.array(features, dtype=np.int64),
+                                  return_counts=True)
+        doc_ids, features = pairs // HASH_DIM, pairs % HASH_DIM
+
+        df = np.bincount(features, minlength=HASH_DIM)
+        idf = (np.log((1 + size) / (1 + df)) + 1).astype(np.float32)
+        weights = counts * idf[features].astype(np.float64)
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights * weights, minlength=size))
+        weights /= np.where(norms[doc_ids] > 0, norms[doc_ids], 1.0)
+
+        order = np.lexsort((-weights, features))
+        offsets = np.searchsorted(features[order], np.arange(HASH_DIM + 1))
+        return cls(idf, offsets.astype(np.int64), doc_ids[order].astype(np.int32),
+                   weights[order].astype(np.float32))
+
+    def query_vector(self, text: str) -> Dict[int, float]:
+        """L2-normalized hashed TF-IDF vector for free text"""
+        vec: Dict[int, float] = {}
+        for feature, count in Counter(feature_id(t) for t in tokenize(text)).items():
+            vec[feature] = count * float(self.idf[feature])
+        norm = sum(w * w for w in vec.values()) ** 0.5
+        return {f: w / norm for f, w in vec.items()} if norm else {}
+
+    def search(self, text: str) -> np.ndarray:
+        """Ascending row positions whose similarity to text reaches MIN_SCORE"""
+        rows, contributions = [], []
+        for feature, weight in self.query_vector(text).items():
+            start = int(self.offsets[feature])
+            end = min(int(self.offsets[feature + 1]), start + MAX_POSTINGS)
+            if start < end:
+                rows.append(self.rows[start:end])
+                contributions.append(self.weights[start:end] * weight)
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+
+        # Accumulate per row; rows outside every posting list score zero
+        scores = np.bincount(np.concatenate(rows), weights=np.concatenate(contributions))
+        return np.flatnonzero(scores >= MIN_SCORE)
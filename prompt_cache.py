@@ -0,0 +1,260 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set
+
+from metrics import Counter
+
+# Words that do not change what code a prompt asks for
+STOPWORDS = {"a", "an", "the", "please", "can", "could", "would", "you", "me", "i", "my",
+             "some", "of", "to", "for", "and", "that", "this", "it", "into", "now", "just"}
+# Words that relate one object to another: "move cube to sphere" and "move sphere to cube" differ
+RELATIONS = {"to", "into", "onto", "on", "from", "behind", "above", "below", "under", "over", "around",
+             "toward", "towards", "near", "beside", "inside", "between", "through", "across", "at", "in",
+             "with", "after", "before"}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+NUM_PERM = 64
+BANDS = 16  # 16 bands of 4 rows: pairs at Jaccard 0.8 collide in some band ~99.9% of the time
+ROWS = NUM_PERM // BANDS
+_MERSENNE = (1 << 61) - 1
+LOOKUP_OUTCOMES = {"hits": "hit", "near_hits": "near_hit", "misses": "miss"}
+PROMPT_CACHE_LOOKUPS = Counter("prompt_cache_lookups_total", "Generated code cache lookups by outcome", ["outcome"])
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE)
+    for i in range(NUM_PERM)
+]
+
+
+def prompt_clauses(prompt: str) -> List[List[str]]:
+    """Content words of a prompt in order, lowercased with a naive plural strip, split at relation words"""
+    clauses = [[]]
+    for word in _WORD_RE.findall(prompt.lower()):
+        if word in RELATIONS and clauses[-1]:
+            clauses.append([])
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        clauses[-1].append(word)
+    return [clause for clause in clauses if clause]
+
+
+def prompt_words(prompt: str) -> List[str]:
+    """Content words of a prompt in order"""
+    return [word for clause in prompt_clauses(prompt) for word in clause]
+
+
+def prompt_terms(prompt: str) -> Set[str]:
+    """Content words of a prompt as a set"""
+    return set(prompt_words(prompt))
+
+
+def clause_index(clauses: List[List[str]]) -> Dict[str, int]:
+    """First clause each word appears in"""
+    index = {}
+    for position, clause in enumerate(clauses):
+        for word in clause:
+            index.setdefault(word, position)
+    return index
+
+
+def swapped_across_relation(clauses: List[List[str]], other: List[List[str]]) -> bool:
+    """Whether two words the prompts share sit on opposite sides of a relation in opposite order.
+
+    Order within a clause does not matter ("spinning red cube", "red
+    spinning cube"), but "move cube to sphere" and "move sphere to cube"
+    are swapped.
+    """
+    side, other_side = clause_index(clauses), clause_index(other)
+    shared = [word for word in side if word in other_side]
+    return any((side[a] - side[b]) * (other_side[a] - other_side[b]) < 0
+               for i, a in enumerate(shared) for b in shared[i + 1:])
+
+
+def minhash(terms: Set[str]) -> List[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), "big") for t in terms]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(signature: List[int]) -> List[int]:
+    """One 63-bit bucket id per LSH band"""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(repr((band, rows)).encode(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big") >> 1)
+    return keys
+
+
+def context_key(context: Optional[Dict], model: str, prompt_version: str) -> str:
+    """Prompts only match others sent for the same board, sensors and model"""
+    context = context or {}
+    sensors = sorted({str(s).lower() for s in context.get("connectedSensors") or []})
+    board = str(context.get("selectedBoard") or "").lower()
+    raw = json.dumps([model, prompt_version, board, sensors])
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+class PromptCache:
+    """Persistent cache of generated code that also answers near-duplicate prompts.
+
+    Prompts are reduced to their content words. Exact hits are keyed on the
+    word sequence, so "move cube to sphere" and "move sphere to cube" stay
+    apart. A MinHash signature of the word set, split into LSH bands, finds
+    earlier prompts that probably share most of those words, and a
+    candidate is served only if its exact Jaccard similarity reaches
+    `threshold` and no shared words were swapped across a relation word
+    such as "to" or "behind"; reordered adjectives still match. Entries
+    live in SQLite so every worker shares them, expire after `ttl` seconds and are evicted least recently used once the
+    stored code exceeds `max_bytes`.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.85, max_bytes: int = 16 * 1024 * 1024,
+                 ttl: float = 7 * 24 * 3600):
+        self.path = path
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS prompt_cache (
+                    key TEXT PRIMARY KEY,
+                    context_key TEXT NOT NULL,
+                    terms TEXT NOT NULL,  -- JSON content words in prompt order, one list per clause
+                    code TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS prompt_bands (
+                    context_key TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    key TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_prompt_bands ON prompt_bands (context_key, bucket)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_prompt_bands_key ON prompt_bands (key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_prompt_cache_accessed ON prompt_cache (accessed_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:  # commit on success, roll back on error
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _entry_key(ctx: str, words: List[str]) -> str:
+        return hashlib.sha256(f"{ctx}\0{' '.join(words)}".encode()).hexdigest()
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        PROMPT_CACHE_LOOKUPS.inc(outcome=LOOKUP_OUTCOMES[name])
+
+    def get(self, prompt: str, ctx: str) -> Optional[str]:
+        """Cached code for this prompt or a near-duplicate of it, or None"""
+        clauses = prompt_clauses(prompt)
+        words = [word for clause in clauses for word in clause]
+        if not words:
+            self._count("misses")
+            return None
+        terms = set(words)
+        now = time.time()
+        key = self._entry_key(ctx, words)
+        with self._connect() as conn:
+            row = conn.execute("SELECT code FROM prompt_cache WHERE key = ? AND created_at > ?",
+                               (key, now - self.ttl)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE prompt_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._count("hits")
+                return row[0]
+
+            buckets = band_keys(minhash(terms))
+            candidates = conn.execute(
+                f"SELECT DISTINCT c.key, c.terms, c.code FROM prompt_bands b "
+                f"JOIN prompt_cache c ON c.key = b.key "
+                f"WHERE b.context_key = ? AND b.bucket IN ({','.join('?' * len(buckets))}) "
+                f"AND c.created_at > ?",
+                (ctx, *buckets, now - self.ttl)
+            ).fetchall()
+            best, best_score = None, self.threshold
+            for cand_key, cand_clauses, code in candidates:
+                other_clauses = json.loads(cand_clauses)
+                if other_clauses and isinstance(other_clauses[0], str):
+                    other_clauses = [other_clauses]  # stored before clauses were kept
+                other = {word for clause in other_clauses for word in clause}
+                score = len(terms & other) / len(terms | other)
+                if score >= best_score and not swapped_across_relation(clauses, other_clauses):
+                    best, best_score = (cand_key, code), score
+            if best is None:
+                self._count("misses")
+                return None
+            conn.execute("UPDATE prompt_cache SET accessed_at = ? WHERE key = ?", (now, best[0]))
+        self._count("near_hits")
+        return best[1]
+
+    def put(self, prompt: str, ctx: str, code: str):
+        clauses = prompt_clauses(prompt)
+        words = [word for clause in clauses for word in clause]
+        if not words:
+            return
+        now = time.time()
+        key = self._entry_key(ctx, words)
+        buckets = band_keys(minhash(set(words)))
+        with self._connect() as conn:
+            conn.execute("DELETE FROM prompt_bands WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, context_key, terms, code, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, ctx, json.dumps(clauses), code, len(code.encode()), now, now)
+            )
+            conn.executemany("INSERT INTO prompt_bands (context_key, bucket, key) VALUES (?, ?, ?)",
+                             [(ctx, bucket, key) for bucket in set(buckets)])
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        doomed = [row for row in conn.execute("SELECT key FROM prompt_cache WHERE created_at <= ?",
+                                              (now - self.ttl,))]
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM prompt_cache WHERE created_at > ?",
+                             (now - self.ttl,)).fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in conn.execute("SELECT key, size FROM prompt_cache WHERE created_at > ? "
+                                          "ORDER BY accessed_at", (now - self.ttl,)):
+                if total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                total -= size
+        if doomed:
+            conn.executemany("DELETE FROM prompt_cache WHERE key = ?", doomed)
+            conn.executemany("DELETE FROM prompt_bands WHERE key = ?", doomed)
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM prompt_cache").fetchone()
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0
+        }
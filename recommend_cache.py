@@ -0,0 +1,65 @@
+import math
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from caching import LRUCache, json_size
+from catalog import Catalog, normalize_specs
+
+
+class RecommendationCache:
+    """Caches filter_products results per catalog version.
+
+    Budgets are rounded up to a bucket so that nearby budgets share one
+    entry; each entry keeps its result prices so a hit is trimmed to the
+    exact budget with a binary search.
+    """
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None, budget_step: float = 25.0):
+        self.cache = LRUCache(max_bytes, ttl)
+        self.budget_step = budget_step
+        self.version = None
+        self._lock = threading.Lock()
+
+    def _bucket(self, budget: float) -> float:
+        if self.budget_step <= 0:
+            return budget
+        return math.ceil(budget / self.budget_step) * self.budget_step
+
+    def key(self, version: int, bucket: float, use_case: str, preferred_specs: Optional[Dict]):
+        return (version, bucket, use_case.lower(), tuple(sorted(normalize_specs(preferred_specs))))
+
+    def _track_version(self, version: int) -> bool:
+        """Drop every entry once a newer catalog version shows up"""
+        with self._lock:
+            if self.version is None or version > self.version:
+                self.version = version
+                self.cache.clear()
+            return version == self.version
+
+    def filter(self, catalog: Catalog, budget, use_case: str,
+               preferred_specs: Optional[Dict] = None) -> List[Dict]:
+        try:
+            budget = float(budget)
+        except (TypeError, ValueError):
+            return catalog.filter(budget, use_case, preferred_specs)
+        # Requests still holding an older snapshot bypass the cache
+        if not math.isfinite(budget) or not self._track_version(catalog.version):
+            return catalog.filter(budget, use_case, preferred_specs)
+
+        bucket = self._bucket(budget)
+        key = self.key(catalog.version, bucket, use_case, preferred_specs)
+        entry = self.cache.get(key)
+        if entry is LRUCache.MISSING:
+            rows = catalog.match_rows(bucket, use_case, normalize_specs(preferred_specs))
+            prices = np.asarray(catalog.prices[rows])
+            products = catalog.products_at(rows)
+            entry = (prices, products)
+            self.cache.set(key, entry, size=prices.nbytes + json_size(products))
+
+        prices, products = entry
+        return products[:int(np.searchsorted(prices, budget, side="right"))]
+
+    def stats(self) -> Dict:
+        return {"catalog_version": self.version, **self.cache.stats()}
@@ -0,0 +1,165 @@
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from metrics import Counter
+from prompt_cache import prompt_terms
+
+SESSION_FOLDS = Counter("session_memory_folds_total", "Session turns folded into rolling summaries, by summarizer",
+                        ["summarizer"])
+
+ROLES = {"u": "user", "a": "assistant"}
+ROLE_NAMES = {"u": "User", "a": "Assistant"}
+
+
+def text_tokens(text: str) -> int:
+    """Rough token count, ~4 characters per token (as llm_scheduler.estimate_tokens)"""
+    return len(text) // 4 + 4
+
+
+def clip(text: str, tokens: int) -> str:
+    """Cut text to about `tokens` tokens"""
+    limit = max(0, tokens - 4) * 4
+    return text if len(text) <= limit else text[:max(0, limit - 4)].rstrip() + " ..."
+
+
+def extractive_summary(summary: Optional[str], turns: Sequence[Sequence[str]], tokens: int) -> str:
+    """Summary without an LLM: one line per user request, newest lines kept within the budget"""
+    lines = (summary or "").splitlines()
+    lines += [f"- User asked: {clip(' '.join(text.split()), 40)}" for role, text in turns if role == "u"]
+    kept, used = [], 0
+    for line in reversed(lines):
+        used += text_tokens(line)
+        if used > tokens:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+class SessionMemory:
+    """Token-budgeted conversation memory stored in an AISession.
+
+    Every prompt gets at most `summary_tokens` of rolling summary,
+    `recall_tokens` of earlier exchanges that share words with the new
+    request, and the newest turns that fit in `recent_tokens`, each turn
+    capped at `turn_tokens`. Turns that leave the recent window are folded
+    into the summary `fold_after` at a time (pending_fold, fold,
+    apply_fold), so the summarizer runs once every few requests on a
+    bounded input and can run after the response has been sent. Prompt size therefore stays
+    flat however long the session gets. At most `max_turns` turns are
+    stored; the oldest already-summarized ones are dropped first.
+    """
+
+    def __init__(self, summarize: Optional[Callable[[Optional[str], List[List[str]], int], str]] = None,
+                 recent_tokens: int = 1200, summary_tokens: int = 300, recall_tokens: int = 400,
+                 turn_tokens: int = 500, recall_exchanges: int = 2, min_similarity: float = 0.15,
+                 fold_after: int = 6, max_turns: int = 200):
+        self.summarize = summarize
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self.recall_tokens = recall_tokens
+        self.turn_tokens = turn_tokens
+        self.recall_exchanges = recall_exchanges
+        self.min_similarity = min_similarity
+        self.fold_after = fold_after
+        self.max_turns = max_turns
+
+    @property
+    def max_context_tokens(self) -> int:
+        return self.recent_tokens + self.summary_tokens + self.recall_tokens
+
+    def _window_start(self, turns: Sequence[Sequence[str]]) -> int:
+        """Index of the oldest turn in the recent window"""
+        start, used = len(turns), 0
+        for index in range(len(turns) - 1, -1, -1):
+            used += text_tokens(turns[index][1])
+            if used > self.recent_tokens:
+                break
+            start = index
+        return start
+
+    def _recall(self, turns: Sequence[Sequence[str]], end: int, query: str) -> List[Tuple[int, str]]:
+        """Earlier exchanges most similar to the query, as (index, text), within recall_tokens"""
+        query_terms = prompt_terms(query)
+        if not query_terms or not self.recall_exchanges:
+            return []
+        scored = []
+        for index in range(0, end):
+            if turns[index][0] != "u":
+                continue
+            exchange = turns[index:min(index + 2, end)]
+            terms = prompt_terms(" ".join(text for _, text in exchange))
+            similarity = len(query_terms & terms) / len(query_terms | terms) if terms else 0.0
+            if similarity >= self.min_similarity:
+                scored.append((similarity, index, exchange))
+        scored.sort(key=lambda item: (-item[0], -item[1]))  # ties go to the newer exchange
+        recalled, used = [], 0
+        for _, index, exchange in scored[:self.recall_exchanges]:
+            text = "\n".join(f"{ROLE_NAMES[role]}: {' '.join(body.split())}" for role, body in exchange)
+            text = clip(text, min(self.turn_tokens, self.recall_tokens - used))
+            if text_tokens(text) > self.recall_tokens - used:
+                break
+            used += text_tokens(text)
+            recalled.append((index, text))
+        return sorted(recalled)
+
+    def context_messages(self, session, query: str) -> List[Dict]:
+        """Summary, recalled exchanges and recent turns to place before the new request"""
+        turns = session.turns or []
+        start = self._window_start(turns)
+        messages = []
+        if session.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{session.summary}"})
+        recalled = self._recall(turns, start, query)
+        if recalled:
+            snippets = "\n\n".join(text for _, text in recalled)
+            messages.append({"role": "system", "content": f"Relevant earlier exchanges:\n{snippets}"})
+        messages += [{"role": ROLES[role], "content": text} for role, text in turns[start:]]
+        return messages
+
+    def record(self, session, request: str, answer: str):
+        """Append one exchange; the fold of turns that left the recent window is left to pending_fold"""
+        turns = list(session.turns or []) + [["u", clip(request, self.turn_tokens)],
+                                             ["a", clip(answer, self.turn_tokens)]]
+        self._store(session, turns, session.summarized or 0)
+
+    def pending_fold(self, session) -> Optional[Tuple[int, int, Optional[str], List[List[str]]]]:
+        """(summarized, window start, summary, backlog) once enough turns have left the recent window, else None"""
+        turns = session.turns or []
+        summarized = session.summarized or 0
+        start = self._window_start(turns)
+        backlog = [list(turn) for turn in turns[summarized:start]]
+        if len(backlog) < self.fold_after:
+            return None
+        return summarized, start, session.summary, backlog
+
+    def apply_fold(self, session, fold: Tuple[int, int, Optional[str], List[List[str]]], summary: str) -> bool:
+        """Store a summary made from pending_fold's backlog; False if the session was folded meanwhile"""
+        summarized, start, previous, _ = fold
+        if (session.summarized or 0) != summarized or session.summary != previous:
+            return False
+        session.summary = summary
+        self._store(session, list(session.turns or []), start)
+        return True
+
+    def _store(self, session, turns: List[List[str]], summarized: int):
+        # Only turns already in the summary may be dropped
+        overflow = min(len(turns) - self.max_turns, summarized)
+        if overflow > 0:
+            turns = turns[overflow:]
+            summarized -= overflow
+        session.turns = turns  # a new list, so the JSON column is marked dirty
+        session.summarized = summarized
+
+    def fold(self, summary: Optional[str], turns: List[List[str]]) -> str:
+        """The summary with `turns` folded in; needs no session, so it can run off the request path"""
+        # Each turn is shortened so the summarizer's input stays bounded too
+        short = [[role, clip(text, 60)] for role, text in turns]
+        if self.summarize is not None:
+            try:
+                folded = self.summarize(summary, short, self.summary_tokens)
+                SESSION_FOLDS.inc(len(turns), summarizer="llm")
+                return clip(folded.strip(), self.summary_tokens)
+            except Exception as e:
+                logging.warning(f"Session summary failed ({type(e).__name__}: {e}); keeping an extractive one")
+        SESSION_FOLDS.inc(len(turns), summarizer="extractive")
+        return extractive_summary(summary, short, self.summary_tokens)
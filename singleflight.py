@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import CancelledError, Future, TimeoutError
+from contextlib import nullcontext
+from typing import Any, Callable, ContextManager, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for the same result or exception. If the running caller is
+    interrupted (e.g. its client went away mid-generator), the waiters are
+    released and one of them runs the call instead. Nothing is kept once a
+    call finishes, so this never serves stale results.
+
+    A waiting caller gives up after `timeout` seconds with TimeoutError,
+    and holds `wait()` (e.g. a slot limiting how many threads may block on
+    LLM calls) while it waits; the running caller does neither.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executed = 0
+        self.shared = 0
+        self.timed_out = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None,
+           wait: Optional[Callable[[], ContextManager]] = None) -> Any:
+        """Run fn once for all concurrent callers of key and return its result"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = Future()
+                    self.executed += 1
+                    break
+                self.shared += 1
+            try:
+                with wait() if wait is not None else nullcontext():
+                    return future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except CancelledError:
+                continue  # the running caller was interrupted; try to take over
+            except TimeoutError:
+                with self._lock:
+                    self.timed_out += 1
+                raise
+
+        try:
+            result = fn()
+        except Exception as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        except BaseException:
+            self._finish(key)
+            future.cancel()
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key: Hashable):
+        # Forget the call before settling it, so released waiters start afresh
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"in_flight": len(self._calls), "executed": self.executed, "shared": self.shared,
+                    "timed_out": self.timed_out}
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryStore:
+    """Persistent, content-addressed store for LLM product summaries.
+
+    Keys hash the sorted product ids, each product's catalog content and the
+    prompt/model version, so editing one product only orphans the summaries
+    that include it; orphans age out through the size-bounded LRU eviction.
+    Entries older than `fresh_seconds` are still served for `stale_seconds`
+    while a background refresh replaces them.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 32 * 1024 * 1024,
+                 fresh_seconds: float = 24 * 3600, stale_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT PRIMARY KEY,
+                    product_ids TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_summaries_accessed ON summaries (accessed_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:  # commit on success, roll back on error
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(products: List[Dict], model: str, prompt_version: str) -> str:
+        """Content address for a summary of these products"""
+        digest = hashlib.sha256(f"{model}\0{prompt_version}".encode())
+        for product in sorted(products, key=lambda p: str(p.get("id", ""))):
+            digest.update(b"\0")
+            digest.update(json.dumps(product, sort_keys=True, separators=(",", ":")).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """(summary, age in seconds) for a key, or None"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary, created_at FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], now - row[1]
+
+    def put(self, key: str, product_ids: List[str], summary: str):
+        now = time.time()
+        size = len(summary.encode())
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, product_ids, summary, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(product_ids), summary, size, now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM summaries ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM summaries WHERE key = ?", doomed)
+
+    def lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        """(summary, "hit" | "stale") if a servable summary is cached, else None"""
+        cached = self.get(key)
+        if cached is not None:
+            summary, age = cached
+            if age <= self.fresh_seconds:
+                return summary, "hit"
+            if age <= self.fresh_seconds + self.stale_seconds:
+                return summary, "stale"
+        return None
+
+    def get_or_create(self, key: str, product_ids: List[str],
+                      compute: Callable[[], str]) -> Tuple[str, str]:
+        """Return (summary, "hit" | "stale" | "miss"), calling compute on a miss"""
+        cached = self.lookup(key)
+        if cached is not None:
+            if cached[1] == "stale":
+                self._refresh_in_background(key, product_ids, compute)
+            return cached
+
+        summary = compute()
+        self.put(key, product_ids, summary)
+        return summary, "miss"
+
+    def _refresh_in_background(self, key: str, product_ids: List[str], compute: Callable[[], str]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.put(key, product_ids, compute())
+            except Exception as e:
+                logger.warning(f"Summary refresh failed for {product_ids}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="summary-refresh", daemon=True).start()
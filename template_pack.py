@@ -0,0 +1,155 @@
+import json
+import mmap
+import os
+import sys
+import threading
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+
+from caching import LRUCache
+
+PACK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "code_templates")
+PACK_FILE = "templates.pack"
+MANIFEST_FILE = "manifest.json"
+TEMPLATE_CACHE_BYTES = int(os.getenv("TEMPLATE_CACHE_BYTES", str(256 * 1024)))
+
+# Source file extension per template family, used by pack/unpack
+EXTENSIONS = {"ai": ".js", "javascript": ".js", "arduino": ".ino", "device/raspberry": ".py",
+              "device": ".ino"}
+
+
+class TemplatePack:
+    """Read-only code templates stored in one file and located through a small manifest.
+
+    Only the manifest (key -> offset, length) is read when the pack is
+    opened. The pack file is memory-mapped on first use and a template
+    body is decoded only when it is asked for; recently used bodies stay
+    in a per-process LRU. Mapped pages are shared by every worker on the
+    host, so idle workers hold no template text of their own.
+    """
+
+    def __init__(self, directory: str = PACK_DIR, cache_bytes: int = TEMPLATE_CACHE_BYTES):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest: Dict[str, List[int]] = json.load(f)["templates"]
+        self._cache = LRUCache(cache_bytes, sizeof=len)
+        self._lock = threading.Lock()
+        self._map: Optional[mmap.mmap] = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.manifest
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """Template keys under a "group/" prefix, in pack order"""
+        return [key for key in self.manifest if key.startswith(prefix)]
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    with open(os.path.join(self.directory, PACK_FILE), "rb") as f:
+                        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def get(self, key: str) -> str:
+        """Template body; raises KeyError for unknown keys"""
+        body = self._cache.get(key, None)
+        if body is None:
+            offset, length = self.manifest[key]
+            body = self._mapped()[offset:offset + length].decode("utf-8")
+            self._cache.set(key, body)
+        return body
+
+    def group(self, prefix: str) -> "TemplateGroup":
+        return TemplateGroup(self, prefix)
+
+    def stats(self) -> Dict:
+        return {"templates": len(self.manifest), "cached": len(self._cache), "cached_bytes": self._cache.bytes,
+                "hits": self._cache.hits, "misses": self._cache.misses}
+
+
+class TemplateGroup(Mapping):
+    """Dict-like view of the templates under one prefix; bodies load on access"""
+
+    def __init__(self, pack: TemplatePack, prefix: str):
+        self.pack = pack
+        self.prefix = prefix.rstrip("/") + "/"
+        self._names = [key[len(self.prefix):] for key in pack.keys(self.prefix)
+                       if "/" not in key[len(self.prefix):]]
+
+    def __getitem__(self, name: str) -> str:
+        if name not in self._names:
+            raise KeyError(name)
+        return self.pack.get(self.prefix + name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name) -> bool:
+        return name in self._names
+
+
+@lru_cache(maxsize=None)
+def default_pack() -> TemplatePack:
+    """The process-wide pack, from TEMPLATE_PACK_DIR or the bundled code_templates/"""
+    return TemplatePack(os.getenv("TEMPLATE_PACK_DIR", PACK_DIR))
+
+
+# === Pack Maintenance ===
+def _extension(key: str) -> str:
+    for prefix, ext in sorted(EXTENSIONS.items(), key=lambda item: -len(item[0])):
+        if key.startswith(prefix + "/"):
+            return ext
+    return ".txt"
+
+
+def write_pack(templates: Dict[str, str], directory: str = PACK_DIR):
+    """Write templates (key -> body) as a pack file plus manifest"""
+    os.makedirs(directory, exist_ok=True)
+    manifest, offset = {}, 0
+    with open(os.path.join(directory, PACK_FILE), "wb") as f:
+        for key, body in templates.items():
+            data = body.encode("utf-8")
+            f.write(data + b"\n")  # newline keeps the pack readable in a pager
+            manifest[key] = [offset, len(data)]
+            offset += len(data) + 1
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "templates": manifest}, f, indent=1)
+        f.write("\n")
+
+
+def unpack(source_dir: str, pack_dir: str = PACK_DIR):
+    """Extract every template to an editable file, e.g. ai/gravity.js"""
+    pack = TemplatePack(pack_dir)
+    for key in pack.keys():
+        path = os.path.join(source_dir, key + _extension(key))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(pack.get(key))
+
+
+def pack(source_dir: str, pack_dir: str = PACK_DIR):
+    """Rebuild the pack from files laid out as unpack() writes them, keeping manifest order"""
+    found = {}
+    for root, _, files in os.walk(source_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            key = os.path.splitext(os.path.relpath(path, source_dir))[0].replace(os.sep, "/")
+            with open(path, encoding="utf-8", newline="") as f:
+                found[key] = f.read()
+    try:
+        order = TemplatePack(pack_dir).keys()
+    except FileNotFoundError:
+        order = []
+    keys = [key for key in order if key in found] + sorted(set(found) - set(order))
+    write_pack({key: found[key] for key in keys}, pack_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("pack", "unpack"):
+        sys.exit("usage: python template_pack.py pack|unpack <source_dir>")
+    (pack if sys.argv[1] == "pack" else unpack)(sys.argv[2])
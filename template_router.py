@@ -0,0 +1,218 @@
+import re
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# === Keyword / Synonym Table ===
+# route key -> keyword groups; every group needs a hit for the route to match.
+# Weights rank competing routes: 1.0 names the template outright, 0.5 hints at it.
+# Device firmware routes may also be satisfied by the IDE context (selected
+# board, connected sensors) rather than the prompt text.
+TEMPLATE_KEYWORDS: Dict[str, List[Dict[str, float]]] = {
+    "ai/gravity": [{"gravity": 1.0, "gravitational": 1.0, "falling object": 1.0, "fall": 0.5, "drop": 0.5}],
+    "ai/draggable": [{"draggable": 1.0, "drag and drop": 1.0, "drag": 1.0, "dragging": 1.0, "mouse move": 0.5}],
+    "ai/particles": [{"particle": 1.0, "particle system": 1.0, "sparkle": 0.5, "firework": 0.5,
+                      "snow": 0.5, "smoke": 0.5, "confetti": 0.5}],
+    "ai/lighting": [{"lighting": 1.0, "light source": 1.0, "lights": 0.5, "light": 0.5, "shadow": 0.5,
+                     "spotlight": 1.0, "sunlight": 0.5}],
+    "ai/collision": [{"collision": 1.0, "collide": 1.0, "bounce off": 0.5, "hit detection": 1.0}],
+    "javascript/3d_cube": [{"cube": 1.0, "box": 0.5}],
+    "javascript/physics_system": [{"physics": 1.0, "physics engine": 1.0, "rigid body": 1.0, "velocity": 0.5}],
+    "javascript/sensor_integration": [{"sensor data": 1.0, "sensor manager": 1.0, "sensor reading": 1.0,
+                                       "sensor": 0.5, "telemetry": 0.5}],
+    "javascript/ai_controls": [{"voice command": 1.0, "natural language control": 1.0, "ai control": 1.0,
+                                "command": 0.5}],
+    "arduino/sensor_hub": [{"arduino": 1.0}, {"sensor hub": 1.0, "multi sensor": 1.0, "multiple sensor": 1.0}],
+    "arduino/wifi_sensor": [{"esp32": 1.0, "arduino": 0.5}, {"wifi": 1.0, "web server": 1.0, "wireless": 0.5}],
+    "device/arduino/temperature": [{"arduino": 1.0, "uno": 0.5}, {"temperature": 1.0, "dht": 1.0, "dht22": 1.0,
+                                                                "dht11": 1.0, "thermometer": 1.0}],
+    "device/arduino/motion": [{"arduino": 1.0, "uno": 0.5}, {"motion": 1.0, "pir": 1.0, "movement": 0.5}],
+    "device/arduino/light": [{"arduino": 1.0, "uno": 0.5}, {"light sensor": 1.0, "ldr": 1.0, "photoresistor": 1.0,
+                                                          "light": 0.5}],
+    "device/raspberry/temperature": [{"raspberry": 1.0, "raspberry pi": 1.0, "rpi": 1.0},
+                                     {"temperature": 1.0, "ds18b20": 1.0, "thermometer": 1.0}],
+    "device/raspberry/motion": [{"raspberry": 1.0, "raspberry pi": 1.0, "rpi": 1.0},
+                                {"motion": 1.0, "pir": 1.0, "movement": 0.5}],
+    "device/esp32/wifi_sensor": [{"esp32": 1.0}, {"wifi": 1.0, "sensor": 0.5, "web server": 0.5}],
+}
+
+# Words that carry no template intent; they count as covered
+FILLER_WORDS = ["add", "create", "make", "show", "generate", "build", "insert", "put", "draw", "give", "write",
+                "code", "please", "a", "an", "the", "some", "to", "with", "and", "in", "on", "of", "for", "me",
+                "i", "want", "need", "scene", "object", "new", "simple", "basic", "that", "it", "is", "can",
+                "you", "my", "spinning", "rotating", "3d", "javascript", "js", "three", "threejs", "program",
+                "sketch", "read", "reading", "display", "system", "enable", "effect"]
+
+COLOR_NAMES = {
+    "red": "ff0000", "green": "00ff00", "blue": "0000ff", "yellow": "ffff00", "orange": "ff8800",
+    "purple": "8800ff", "pink": "ff66cc", "white": "ffffff", "black": "111111", "cyan": "00ffff",
+    "magenta": "ff00ff", "gray": "888888", "grey": "888888", "gold": "ffd700", "teal": "008080"
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def keywords_for(key: str) -> List[Dict[str, float]]:
+    """Keyword groups for a route, derived from its name if the table has none"""
+    if key in TEMPLATE_KEYWORDS:
+        return TEMPLATE_KEYWORDS[key]
+    return [{key.rsplit("/", 1)[-1].replace("_", " "): 1.0}]
+
+
+class AhoCorasick:
+    """Finds every occurrence of many keywords in one pass over a text"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]
+        for pattern, payload in patterns:
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(pattern), payload))
+
+        # Breadth-first failure links; outputs inherit those of their fallback
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """Yield (start, end, payload) for every keyword occurrence"""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, payload in self._out[node]:
+                yield i + 1 - length, i + 1, payload
+
+
+class Route(NamedTuple):
+    key: str
+    language: str
+    render: Callable[[Dict], str]
+    groups: List[Dict[str, float]]
+    names: Tuple[str, ...] = ()  # words naming the template outright; such a prompt needs no coverage
+
+
+class RouteMatch(NamedTuple):
+    key: str
+    language: str
+    score: float
+    coverage: float
+    params: Dict[str, str]
+    render: Callable[[Dict], str]
+    named: bool = False
+
+    def code(self) -> str:
+        return self.render(self.params)
+
+
+class TemplateRouter:
+    """Ranks every known code template against a prompt in a single scan.
+
+    Keywords, synonyms, filler words and parameter words (colors) are all
+    compiled into one Aho-Corasick automaton, so routing cost depends on
+    the prompt length, not on how many templates exist. `coverage` is the
+    share of the prompt's words explained by the match; callers use it to
+    decide whether a template answers the prompt or only relates to it. A
+    prompt that names a template (Route.names) matches it whatever the
+    coverage, and such matches rank first.
+    """
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+        patterns = []
+        for r, route in enumerate(routes):
+            for g, group in enumerate(route.groups):
+                for keyword, weight in group.items():
+                    patterns.append((keyword, ("keyword", r, g, weight, route.language != "javascript")))
+            patterns += [(name, ("name", r)) for name in route.names]
+        patterns += [(word, ("filler",)) for word in FILLER_WORDS]
+        patterns += [(name, ("color", value)) for name, value in COLOR_NAMES.items()]
+        self._automaton = AhoCorasick(patterns)
+
+    def _scan(self, text: str) -> Iterator[Tuple[int, int, tuple]]:
+        # Matches must sit on word boundaries; a trailing plural "s"/"es" is allowed
+        for start, end, payload in self._automaton.find(text):
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if end < len(text) and text[end].isalnum():
+                for suffix in ("s", "es"):
+                    stop = end + len(suffix)
+                    if text.startswith(suffix, end) and (stop == len(text) or not text[stop].isalnum()):
+                        end = stop
+                        break
+                else:
+                    continue
+            yield start, end, payload
+
+    def route(self, prompt: str, context: Optional[Dict] = None,
+              languages: Optional[Iterable[str]] = None) -> List[RouteMatch]:
+        """Matching templates, best first"""
+        text = prompt.lower()
+        words = [(m.start(), m.end()) for m in _WORD_RE.finditer(text)]
+        hits: Dict[Tuple[int, int], float] = {}
+        spans: Dict[int, List[Tuple[int, int]]] = {}
+        shared: List[Tuple[int, int]] = []
+        params: Dict[str, str] = {}
+        named = set()
+        for start, end, payload in self._scan(text):
+            if payload[0] == "keyword":
+                _, r, g, weight, _ = payload
+                hits[(r, g)] = max(hits.get((r, g), 0.0), weight)
+                spans.setdefault(r, []).append((start, end))
+            elif payload[0] == "name":
+                named.add(payload[1])
+                spans.setdefault(payload[1], []).append((start, end))
+            else:
+                shared.append((start, end))
+                if payload[0] == "color":
+                    params.setdefault("color", payload[1])
+
+        if context:
+            sensors = context.get("connectedSensors") or []
+            context_text = " ".join([str(context.get("selectedBoard") or "")] + [str(s) for s in sensors]).lower()
+            for _, _, payload in self._scan(context_text):
+                if payload[0] == "keyword" and payload[4]:
+                    _, r, g, weight, _ = payload
+                    hits[(r, g)] = max(hits.get((r, g), 0.0), weight)
+
+        allowed = set(languages) if languages is not None else None
+        matches = []
+        for r in sorted({r for r, _ in hits} | named):
+            route = self.routes[r]
+            if allowed is not None and route.language not in allowed:
+                continue
+            weights = [hits.get((r, g), 1.0 if r in named else None) for g in range(len(route.groups))] or [1.0]
+            if (not route.groups and r not in named) or any(w is None for w in weights):
+                continue
+            covered_spans = spans.get(r, []) + shared
+            covered = sum(1 for ws, we in words if any(s <= ws and we <= e for s, e in covered_spans))
+            coverage = covered / len(words) if words else 0.0
+            matches.append(RouteMatch(route.key, route.language, sum(weights) / len(weights),
+                                      coverage, dict(params), route.render, r in named))
+        matches.sort(key=lambda m: (not m.named, -m.score, -m.coverage))
+        return matches
+
+    def best(self, prompt: str, context: Optional[Dict] = None, languages: Optional[Iterable[str]] = None,
+             min_score: float = 0.0, min_coverage: float = 0.0) -> Optional[RouteMatch]:
+        """Top match meeting the score and coverage floors (named matches skip the coverage one), or None"""
+        for match in self.route(prompt, context, languages):
+            if match.score >= min_score and (match.named or match.coverage >= min_coverage):
+                return match
+        return None
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# main reads its configuration at import time; keep tests offline and off the real caches
+_SCRATCH = tempfile.mkdtemp(prefix="openq_tests_")
+os.environ.update({
+    "SQLALCHEMY_DATABASE_URI": "sqlite://",
+    "CATALOG_POLL_INTERVAL": "0",
+    "PROMPT_CACHE_PATH": os.path.join(_SCRATCH, "prompt_cache.sqlite3"),
+    "SUMMARY_CACHE_PATH": os.path.join(_SCRATCH, "summary_cache.sqlite3"),
+    "FIRMWARE_PRECOMPILE": "0",
+    "JWT_SECRET_KEY": "test-secret-key-with-at-least-32-bytes",
+})
+os.environ.pop("OPENAI_API_KEY", None)
+os.chdir(ROOT)  # products.json and the template pack are read relative to the repo
+
+
+@pytest.fixture(scope="session")
+def main_module():
+    import main
+    with main.app.app_context():
+        main.db.create_all()
+    return main
+
+
+@pytest.fixture
+def client(main_module):
+    return main_module.app.test_client()
@@ -0,0 +1,31 @@
+import ai_service
+from ai_service import AICodeGenerator
+
+
+def test_render_matches_str_format():
+    generator = AICodeGenerator()
+    for language, group in AICodeGenerator._load_templates().items():
+        for name, source in group.items():
+            params = {**AICodeGenerator.TEMPLATE_DEFAULTS, "color": "ff0000"}
+            for _ in range(2):  # the second render is a memo hit
+                assert generator.render_template(language, name, color="ff0000") == source.format(**params)
+
+
+def test_memo_stays_within_its_byte_budget(monkeypatch):
+    monkeypatch.setattr(AICodeGenerator, "_rendered", {})
+    monkeypatch.setattr(AICodeGenerator, "_rendered_bytes", 0)
+    generator = AICodeGenerator()
+    size = len(generator.render_template("javascript", "3d_cube", x=-1))
+    monkeypatch.setattr(ai_service, "TEMPLATE_RENDER_CACHE_BYTES", size * 3 + size // 2)
+    AICodeGenerator._rendered.clear()
+    AICodeGenerator._rendered_bytes = 0
+    for x in range(10):
+        generator.render_template("javascript", "3d_cube", x=x)
+    assert len(AICodeGenerator._rendered) == 3
+    assert AICodeGenerator._rendered_bytes <= ai_service.TEMPLATE_RENDER_CACHE_BYTES
+    assert ("javascript", "3d_cube", ("x", 9)) in AICodeGenerator._rendered  # the oldest went first
+
+
+def test_unhashable_params_are_rendered_without_the_memo():
+    code = AICodeGenerator().render_template("javascript", "3d_cube", color=["ff", "00", "00"])
+    assert "['ff', '00', '00']" in code
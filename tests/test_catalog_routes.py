@@ -0,0 +1,17 @@
+from flask_jwt_extended import create_access_token
+
+
+def test_reload_requires_a_token(main_module, client):
+    assert client.post("/catalog/reload").status_code == 401
+    with main_module.app.app_context():
+        token = create_access_token(identity="1")
+    response = client.post("/catalog/reload", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert response.get_json()["products"] > 0
+
+
+def test_status_does_not_expose_file_paths(main_module, client):
+    stats = client.get("/catalog/status").get_json()
+    assert "path" not in stats
+    assert main_module.PRODUCTS_FILE not in str(stats)
+    assert "process_peak_rss_bytes" in stats
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from catalog import Catalog
+from catalog_segment import MappedNgramIndex, attach_segment, write_segment
+from catalog_store import iter_products
+
+QUERIES = [
+    (100, "iot", {}),
+    (500, "microcontroller", {"wireless": "yes"}),
+    (1000, "robotics", {"ram": "4gb"}),
+    (1000, "learning", {"ram": "gb"}),
+    (1000, "learning", {"usb_ports": "4"}),
+    (200, "a small board for home weather station with wifi", {}),
+]
+
+
+@pytest.fixture(scope="module")
+def catalogs(tmp_path_factory):
+    catalog = Catalog(iter_products("products.json"), version=3)
+    return catalog, attach_segment(write_segment(catalog, str(tmp_path_factory.mktemp("segments"))))
+
+
+@pytest.mark.parametrize("budget,use_case,specs", QUERIES)
+def test_attached_segment_filters_like_the_catalog(catalogs, budget, use_case, specs):
+    catalog, attached = catalogs
+    assert attached.filter(budget, use_case, specs) == catalog.filter(budget, use_case, specs)
+
+
+def test_spec_index_is_mapped_not_decoded(catalogs):
+    _, attached = catalogs
+    for column in attached.spec_columns.values():
+        assert isinstance(column.values, np.memmap)
+        assert isinstance(column.numbers, np.memmap)
+        assert isinstance(column.ngrams, MappedNgramIndex)
+
+
+def test_mapped_ngram_index_lookup(catalogs):
+    catalog, attached = catalogs
+    column, mapped = catalog.spec_columns["ram"], attached.spec_columns["ram"]
+    for gram, codes in column.ngrams.items():
+        assert mapped.ngrams.get(gram).tolist() == codes.tolist()
+    assert mapped.ngrams.get("zzz") is None
@@ -0,0 +1,159 @@
+import itertools
+import time
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from llm_breaker import CircuitBreaker, LatencyTracker
+from llm_client import LLMCircuitOpenError, LLMClientPool, LLMTimeoutError
+
+MESSAGES = [{"role": "user", "content": "Explain this code: scene.add(cube);"}]
+
+
+def reply(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           get=lambda key, default=None: None)
+
+
+def trip(breaker, failures):
+    for _ in range(failures):
+        assert breaker.allow()
+        breaker.record(False)
+
+
+# === CircuitBreaker ===
+def test_breaker_opens_once_enough_calls_fail():
+    breaker = CircuitBreaker(failure_ratio=0.5, min_calls=4, size=10, reset_timeout=60)
+    for ok in (True, False, True):
+        breaker.record(ok)
+    assert breaker.state == CircuitBreaker.CLOSED  # below min_calls
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats()["refused"] == 1
+
+
+def test_breaker_forgets_outcomes_outside_its_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_ratio=0.5, min_calls=4, window=10)
+    for _ in range(3):
+        breaker.record(False)
+    now[0] += 11
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["recent_calls"] == 1
+
+
+def test_half_open_probe_closes_or_reopens(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_ratio=0.5, min_calls=2, reset_timeout=15)
+    trip(breaker, 2)
+    now[0] += 16
+    assert breaker.allow()  # the probe
+    assert not breaker.allow()  # only one at a time
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN and breaker.opened == 2
+
+    now[0] += 16
+    assert breaker.allow()
+    breaker.abandon()  # the probe never went upstream, so another caller may probe
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_latency_tracker_needs_min_samples():
+    tracker = LatencyTracker(min_samples=20)
+    for i in range(19):
+        tracker.observe(i / 100)
+    assert tracker.percentile(0.95) is None
+    tracker.observe(0.19)
+    assert tracker.percentile(0.95) == pytest.approx(0.19)
+    assert tracker.percentile(0.5) == pytest.approx(0.10)
+
+
+# === LLMClientPool with a breaker, adaptive timeouts and hedging ===
+@pytest.fixture
+def upstream(monkeypatch):
+    """openai.ChatCompletion.create answering after per-call delays (default: at once)"""
+    delays, calls = [], itertools.count()
+
+    def create(**kwargs):
+        n = next(calls)
+        time.sleep(delays[n] if n < len(delays) else 0)
+        return reply(f"answer {n}")
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(openai, "requestssession", None)
+    return SimpleNamespace(delays=delays, calls=calls)
+
+
+def warm(pool, endpoint, seconds, samples=20):
+    pool._endpoint(endpoint)
+    for _ in range(samples):
+        pool._latency[endpoint].observe(seconds)
+
+
+def test_open_circuit_fails_fast_without_calling_upstream(upstream):
+    breaker = CircuitBreaker(min_calls=2, reset_timeout=60)
+    trip(breaker, 2)
+    pool = LLMClientPool(max_workers=2, breaker=breaker)
+    with pytest.raises(LLMCircuitOpenError):
+        pool.chat("explain", MESSAGES)
+    assert next(upstream.calls) == 0
+    assert pool.stats()["explain"]["short_circuited"] == 1
+
+
+def test_calls_slower_than_their_deadline_count_as_failures(upstream):
+    breaker = CircuitBreaker(min_calls=1, failure_ratio=1.0, reset_timeout=60)
+    pool = LLMClientPool(max_workers=2, breaker=breaker)
+    upstream.delays.append(0.2)
+    future = pool.submit("explain", MESSAGES, timeout=0.05)
+    assert future.result(timeout=5).choices[0].message.content == "answer 0"
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_timeout_adapts_to_the_endpoint_p95(upstream):
+    pool = LLMClientPool(max_workers=2, timeouts={"explain": 30}, timeout_factor=1.5, min_timeout=2)
+    assert pool._timeout("explain", None) == 30  # no history yet
+    warm(pool, "explain", 4.0)
+    assert pool._timeout("explain", None) == pytest.approx(6.0)
+    warm(pool, "explain", 0.1, samples=200)
+    assert pool._timeout("explain", None) == 2  # never below min_timeout
+    warm(pool, "explain", 60.0, samples=200)
+    assert pool._timeout("explain", None) == 30  # never above the configured timeout
+    assert pool._timeout("explain", None, adaptive=False) == 30
+
+
+def test_adaptive_timeout_cuts_off_slow_calls(upstream):
+    pool = LLMClientPool(max_workers=2, min_timeout=0.1, timeout_factor=1.0)
+    warm(pool, "explain", 0.1)
+    upstream.delays.append(1.0)
+    started = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        pool.chat("explain", MESSAGES)
+    assert time.monotonic() - started < 0.5
+    assert pool.stats()["explain"]["timeouts"] == 1
+
+
+def test_hedged_request_wins_over_a_slow_first_call(upstream):
+    pool = LLMClientPool(max_workers=4, hedge=["generate"], min_timeout=2, timeout_factor=20)
+    warm(pool, "generate", 0.05)
+    upstream.delays.append(1.0)  # the first request stalls; the hedge answers at once
+    started = time.monotonic()
+    assert pool.chat("generate", MESSAGES).choices[0].message.content == "answer 1"
+    assert time.monotonic() - started < 0.5
+    stats = pool.stats()["generate"]
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_fast_calls_are_not_hedged(upstream):
+    pool = LLMClientPool(max_workers=4, hedge=["generate"])
+    warm(pool, "generate", 0.5)
+    assert pool.chat("generate", MESSAGES).choices[0].message.content == "answer 0"
+    assert pool.stats()["generate"]["hedged"] == 0
+    assert pool.chat("explain", MESSAGES)  # endpoints not listed are never hedged
+    assert pool.stats()["explain"]["hedged"] == 0
@@ -0,0 +1,125 @@
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from llm_client import LLMBusyError, LLMClientPool
+from llm_scheduler import LLMScheduler
+
+MESSAGES = [{"role": "user", "content": "Generate JavaScript code for: a cube"}]
+
+
+def completion(content="```javascript\nscene.add(cube);\n```"):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           get=lambda key, default=None: None)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """openai.ChatCompletion.create replaced by a call that blocks until released"""
+    release = threading.Event()
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        release.wait(5)
+        return completion()
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    monkeypatch.setattr(openai, "requestssession", None)
+    yield SimpleNamespace(release=release, calls=calls)
+    release.set()
+
+
+def test_submit_does_not_wait_for_rate_budget(upstream):
+    scheduler = LLMScheduler(requests_per_minute=1)
+    pool = LLMClientPool(max_workers=4, scheduler=scheduler)
+    upstream.release.set()
+    pool.submit("generate", MESSAGES).result(timeout=5)
+
+    started = time.monotonic()
+    future = pool.submit("generate", MESSAGES, timeout=0.3)
+    assert time.monotonic() - started < 0.1  # the budget wait runs on the pool thread
+    with pytest.raises(LLMBusyError):
+        future.result(timeout=5)
+    assert pool.stats()["generate"]["throttled"] == 1
+    assert pool.stats()["generate"]["in_flight"] == 0
+
+
+def test_waiting_request_threads_are_capped(upstream):
+    pool = LLMClientPool(max_workers=4, default_limit=4, max_waiting=1)
+    waiting = threading.Thread(target=pool.chat, args=("generate", MESSAGES))
+    waiting.start()
+    while not upstream.calls:
+        time.sleep(0.01)
+
+    started = time.monotonic()
+    with pytest.raises(LLMBusyError):
+        pool.chat("explain", MESSAGES)
+    assert time.monotonic() - started < 0.1
+    assert pool.submit("explain", MESSAGES) is not None  # submit holds no caller thread
+
+    upstream.release.set()
+    waiting.join(5)
+    assert pool.chat("explain", MESSAGES).choices[0].message.content
+    assert pool.stats()["explain"]["waiters_rejected"] == 1
+
+
+def test_stream_releases_its_waiting_slot(monkeypatch):
+    monkeypatch.setattr(openai.ChatCompletion, "create", lambda **kwargs: iter(
+        [{"choices": [{"delta": {"content": "scene"}}]}, {"choices": [{"delta": {"content": ".add(cube)"}}]}]))
+    pool = LLMClientPool(max_workers=2, max_waiting=1)
+    for _ in range(3):
+        assert "".join(pool.stream("generate", MESSAGES)) == "scene.add(cube)"
+
+
+def test_openai_gets_a_session_per_thread():
+    LLMClientPool(max_workers=2)
+    # openai 0.28 calls a non-Session requestssession once per thread and closes it after
+    # MAX_SESSION_LIFETIME_SECS, so a shared session would be closed under other threads
+    assert callable(openai.requestssession)
+    first, second = openai.requestssession(), openai.requestssession()
+    assert first is not second
+    assert first.get_adapter("https://api.openai.com") is not second.get_adapter("https://api.openai.com")
+
+
+# === Async /generate-js jobs ===
+def test_async_generate_job_frees_the_request(main_module, client, monkeypatch):
+    upstream = Future()
+    monkeypatch.setattr(main_module.openai, "api_key", "sk-test")
+    monkeypatch.setattr(main_module, "match_code_template", lambda prompt, context=None: None)
+    monkeypatch.setattr(main_module.LLM_POOL, "submit", lambda endpoint, messages, **kwargs: upstream)
+
+    response = client.post("/generate-js", json={"prompt": "an octahedron orbiting a moon", "async": True})
+    assert response.status_code == 202
+    status_url = f"/generate-js/jobs/{response.get_json()['job_id']}"
+    assert client.get(status_url).status_code == 202
+
+    upstream.set_result(completion())
+    response = client.get(status_url)
+    assert response.status_code == 200
+    assert response.get_json() == {"status": "done", "code": "scene.add(cube);"}
+    assert client.get("/generate-js/jobs/unknown").status_code == 404
+
+
+def test_failed_async_job_returns_the_fallback(main_module, client, monkeypatch):
+    upstream = Future()
+    monkeypatch.setattr(main_module.openai, "api_key", "sk-test")
+    monkeypatch.setattr(main_module, "match_code_template", lambda prompt, context=None: None)
+    monkeypatch.setattr(main_module.LLM_POOL, "submit", lambda endpoint, messages, **kwargs: upstream)
+
+    job_id = client.post("/generate-js", json={"prompt": "a dodecahedron swarm", "async": True}).get_json()["job_id"]
+    upstream.set_exception(LLMBusyError("rate budget exhausted"))
+    body = client.get(f"/generate-js/jobs/{job_id}").get_json()
+    assert body["status"] == "done" and body["fallback"] and body["code"]
+
+
+def test_background_chat_takes_no_waiting_slot(upstream):
+    pool = LLMClientPool(max_workers=4, max_waiting=1)
+    upstream.release.set()
+    with pool.waiting("generate"):  # a request thread holds the only slot
+        assert pool.chat("memory", MESSAGES, background=True).choices[0].message.content
+        with pytest.raises(LLMBusyError):
+            pool.chat("memory", MESSAGES)
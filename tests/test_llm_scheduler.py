@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from llm_client import LLMBusyError
+from llm_scheduler import MicroBatcher
+
+
+def run_leader(batcher, item):
+    results = []
+    leader = threading.Thread(target=lambda: results.append(batcher.submit(item)))
+    leader.start()
+    while batcher._pending is None:
+        time.sleep(0.001)
+    return leader, results
+
+
+def test_items_in_one_window_share_a_batch():
+    batcher = MicroBatcher(lambda items: [item.upper() for item in items], window=0.2)
+    leader, results = run_leader(batcher, "a")
+    assert batcher.submit("b") == "B"
+    leader.join(5)
+    assert results == ["A"]
+    assert batcher.stats() == {"batches": 1, "items": 2}
+
+
+def test_failed_item_only_fails_its_caller():
+    batcher = MicroBatcher(lambda items: [ValueError(item) if item == "bad" else item for item in items], window=0.2)
+    leader, results = run_leader(batcher, "good")
+    with pytest.raises(ValueError):
+        batcher.submit("bad")
+    leader.join(5)
+    assert results == ["good"]
+
+
+def test_waiting_callers_are_bounded():
+    release = threading.Event()
+
+    def slow(items):
+        release.wait(5)
+        return items
+    batcher = MicroBatcher(slow, window=0.2)
+    leader, _ = run_leader(batcher, "a")
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        batcher.submit("b", timeout=0.3)
+    assert time.monotonic() - started < 1
+    release.set()
+    leader.join(5)
+
+
+def test_refused_wait_slot_keeps_the_item_out_of_the_batch():
+    run = []
+    batcher = MicroBatcher(lambda items: run.append(items) or items, window=0.2)
+    held = []
+
+    @contextmanager
+    def no_slot():
+        raise LLMBusyError("Too many request threads waiting on LLM calls for explain")
+        yield
+
+    @contextmanager
+    def slot():
+        held.append(True)
+        yield
+        held.pop()
+    leader, _ = run_leader(batcher, "a")
+    with pytest.raises(LLMBusyError):
+        batcher.submit("b", wait=no_slot)
+    assert batcher.submit("c", wait=slot) == "c"
+    leader.join(5)
+    assert run == [["a", "c"]] and held == []
+
+
+# === /explain-code fallback when the batched answer cannot be split ===
+def test_unsplittable_batch_is_explained_concurrently(main_module, monkeypatch):
+    monkeypatch.setattr(main_module.LLM_POOL, "chat", lambda endpoint, messages, **kwargs: SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="no headings here"))]))
+    calls = []
+
+    def submit(endpoint, messages, **kwargs):
+        calls.append(Future())
+        if len(calls) == 2:
+            calls[-1].set_exception(ConnectionError("upstream reset"))
+        return calls[-1]
+    monkeypatch.setattr(main_module.LLM_POOL, "submit", submit)
+
+    done = []
+    worker = threading.Thread(target=lambda: done.append(main_module.explain_code_batch(["a()", "b()", "c()"])))
+    worker.start()
+    while len(calls) < 3:
+        time.sleep(0.001)  # every call is started before any answer arrives
+    for call in calls:
+        if not call.done():
+            call.set_result(SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=" ok "))]))
+    worker.join(5)
+    first, second, third = done[0]
+    assert first == third == "ok" and isinstance(second, ConnectionError)
@@ -0,0 +1,25 @@
+import pytest
+
+from llm_stream import FenceStripper, extract_code
+
+
+def streamed(text, size):
+    stripper = FenceStripper()
+    out = "".join(stripper.feed(text[i:i + size]) for i in range(0, len(text), size)) + stripper.finish()
+    assert out == stripper.result
+    return out, stripper.tail
+
+
+@pytest.mark.parametrize("text,code,tail", [
+    ("```javascript\nscene.add(cube);\n```\n- cached the geometry", "scene.add(cube);", "\n- cached the geometry"),
+    ("Here you go:\n```js\nconst a = 1;\nconst b = `${a}`;\n```", "const a = 1;\nconst b = `${a}`;", ""),
+    ("```const x=1```", "const x=1", ""),
+    ("```javascript const x = 1``` and that is all", "const x = 1", " and that is all"),
+    ("```const y = 2", "const y = 2", ""),
+    ("```javascript", "", ""),
+    ("scene.add(cube);", "scene.add(cube);", ""),
+])
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_fences_are_stripped_in_any_chunking(text, code, tail, size):
+    assert streamed(text, size) == (code, tail)
+    assert extract_code(text) == code
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import product_db
+from catalog import Catalog
+from catalog_store import iter_products
+
+FREE_TEXT = "a small board for home weather station with wifi"
+QUERIES = [
+    (100, "iot", {}),
+    (500, "microcontroller", {}),
+    (500, "microcontroller", {"wireless": "yes"}),
+    (1000, "learning", {}),
+    (1000, "robotics", {"ram": "4gb"}),
+    (200, FREE_TEXT, {}),
+]
+
+
+def ids(products):
+    return [p["id"] for p in products]
+
+
+@pytest.fixture(scope="module")
+def imported(main_module):
+    with main_module.app.app_context():
+        product_db.import_products("products.json")
+    return main_module
+
+
+@pytest.mark.parametrize("budget,use_case,specs", QUERIES)
+def test_sql_filter_matches_catalog(imported, budget, use_case, specs):
+    catalog = Catalog(iter_products("products.json"))
+    with imported.app.app_context():
+        assert ids(product_db.filter_products(budget, use_case, specs)) == ids(catalog.filter(budget, use_case, specs))
+
+
+@pytest.mark.parametrize("budget,use_case,specs", QUERIES)
+def test_recommend_same_on_both_backends(imported, client, monkeypatch, budget, use_case, specs):
+    results = {}
+    for backend in ("memory", "sql"):
+        monkeypatch.setattr(imported, "CATALOG_BACKEND", backend)
+        plain = client.post("/recommend", json={"budget": budget, "use_case": use_case, "preferred_specs": specs})
+        paged = client.post("/recommend", json={"budget": budget, "use_case": use_case, "preferred_specs": specs,
+                                                "limit": 2})
+        assert plain.status_code == paged.status_code == 200
+        results[backend] = (ids(plain.json["recommendations"]), ids(paged.json["recommendations"]))
+    assert results["sql"] == results["memory"]
+
+
+def test_sql_backend_needs_no_local_catalog(imported, client, monkeypatch):
+    monkeypatch.setattr(imported, "CATALOG_BACKEND", "sql")
+    monkeypatch.setattr(imported.CATALOG_STORE, "current", Catalog([]))
+    assert client.post("/recommend", json={"budget": 200, "use_case": FREE_TEXT}).json["recommendations"]
+    assert client.post("/recommend", json={"budget": 1000, "use_case": "robotics"}).json["recommendations"]
+
+
+def test_batch_same_on_both_backends(imported, client, monkeypatch):
+    queries = [{"budget": b, "use_case": u, "preferred_specs": s} for b, u, s in QUERIES]
+    queries.append({"budget": "cheap", "use_case": "iot"})
+    results = {}
+    for backend in ("memory", "sql"):
+        monkeypatch.setattr(imported, "CATALOG_BACKEND", backend)
+        response = client.post("/recommend/batch", json={"queries": queries})
+        assert response.status_code == 200
+        results[backend] = response.json["results"]
+    assert results["sql"] == results["memory"]
+    assert any(r.get("recommendations") for r in results["sql"])
+
+
+def test_new_import_replaces_the_table_index(imported, tmp_path, monkeypatch):
+    monkeypatch.setattr(product_db, "INDEX_CHECK_INTERVAL", 0)
+    products = list(iter_products("products.json"))
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps([{**products[0], "category": "telescopes"}]))
+    with imported.app.app_context():
+        try:
+            product_db.import_products(str(path))
+            assert product_db.table_index().categories == {"telescopes"}
+            assert ids(product_db.filter_products(10 ** 6, "telescopes")) == [products[0]["id"]]
+        finally:
+            product_db.import_products("products.json")
+        assert "telescopes" not in product_db.table_index().categories
@@ -0,0 +1,62 @@
+import pytest
+
+from prompt_cache import PromptCache, context_key, prompt_clauses, swapped_across_relation
+
+CTX = context_key({"selectedBoard": "esp32"}, "gpt-4o-mini", "1")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PromptCache(str(tmp_path / "prompt_cache.sqlite3"))
+
+
+def test_reordered_prompt_is_not_an_exact_hit(cache):
+    cache.put("move cube to sphere", CTX, "cube.position.copy(sphere.position);")
+    assert cache.get("move sphere to cube", CTX) is None
+    cache.put("move sphere to cube", CTX, "sphere.position.copy(cube.position);")
+    assert cache.get("move cube to sphere", CTX) == "cube.position.copy(sphere.position);"
+    assert cache.get("move sphere to cube", CTX) == "sphere.position.copy(cube.position);"
+    assert cache.stats()["entries"] == 2
+
+
+def test_stopwords_and_plurals_still_hit(cache):
+    cache.put("add a red cube", CTX, "red cube")
+    assert cache.get("please add the red cubes", CTX) == "red cube"
+    assert cache.hits == 1
+
+
+def test_near_duplicate_in_the_same_order_hits(cache):
+    cache.put("add red spinning cube glowing softly above floor grid", CTX, "glowing cube")
+    assert cache.get("add red spinning cube glowing softly above floor grid quickly slowly", CTX) is None  # 9/11
+    assert cache.get("add red spinning cube glowing softly above floor grid slowly", CTX) == "glowing cube"
+    assert cache.near_hits == 1
+
+
+def test_swapped_adjectives_are_a_near_hit(cache):
+    cache.put("add a spinning red cube", CTX, "spinning red cube")
+    assert cache.get("add a red spinning cube", CTX) == "spinning red cube"
+    assert (cache.hits, cache.near_hits) == (0, 1)
+
+
+def test_objects_swapped_across_a_relation_miss(cache):
+    cache.put("place the lamp on the table", CTX, "lamp on table")
+    assert cache.get("place the table on the lamp", CTX) is None
+    assert cache.get("place lamp on table", CTX) == "lamp on table"
+
+
+def test_near_duplicate_in_another_order_misses(cache):
+    cache.put("attach camera to car behind player model slowly", CTX, "camera follows car")
+    assert cache.get("attach car to camera behind player model slowly", CTX) is None
+
+
+def test_context_separates_entries(cache):
+    cache.put("add a red cube", CTX, "red cube")
+    assert cache.get("add a red cube", context_key({"selectedBoard": "arduino"}, "gpt-4o-mini", "1")) is None
+
+
+def test_only_order_across_relations_counts():
+    assert not swapped_across_relation(prompt_clauses("add red spinning cube near sphere"),
+                                       prompt_clauses("add a spinning big red cube"))
+    assert not swapped_across_relation(prompt_clauses("put cube above the floor"),
+                                       prompt_clauses("put cube slowly on the left above floor"))
+    assert swapped_across_relation(prompt_clauses("move cube to sphere"), prompt_clauses("move sphere to cube"))
@@ -0,0 +1,23 @@
+def test_invalid_queries_get_their_own_errors(client):
+    queries = [
+        {"budget": 500, "use_case": "microcontroller"},
+        {"budget": 500, "use_case": "microcontroller", "preferred_specs": ["wireless"]},
+        {"budget": "cheap", "use_case": "robotics"},
+        {"use_case": "robotics"},
+        "robotics",
+        {"budget": 500, "use_case": "microcontroller", "preferred_specs": {"wireless": "yes"}},
+    ]
+    response = client.post("/recommend/batch", json={"queries": queries})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [sorted(r) for r in results] == [["recommendations"], ["error"], ["error"], ["error"], ["error"],
+                                            ["recommendations"]]
+    assert results[1]["error"] == "'preferred_specs' must be an object"
+    assert results[0]["recommendations"]
+
+
+def test_batch_matches_single_queries(client):
+    query = {"budget": 1000, "use_case": "robotics", "preferred_specs": {"ram": "4gb"}}
+    single = client.post("/recommend", json=query).get_json()["recommendations"]
+    batch = client.post("/recommend/batch", json={"queries": [query]}).get_json()["results"][0]
+    assert batch == {"recommendations": single}
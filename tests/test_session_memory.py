@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from llm_scheduler import BATCH
+from session_memory import SessionMemory, text_tokens
+
+CODE = "const orbit = new THREE.Object3D();\nscene.add(orbit);"
+
+
+def new_session():
+    return SimpleNamespace(turns=[], summary=None, summarized=0)
+
+
+def prompt(i):
+    return f"add a glowing planet number {i} that orbits the sun with speed {i}"
+
+
+def test_prompt_size_stays_bounded():
+    memory = SessionMemory(lambda summary, turns, tokens: "planets orbit the sun", recent_tokens=200,
+                           summary_tokens=50, recall_tokens=80, fold_after=4)
+    session = new_session()
+    sizes = []
+    for i in range(60):
+        sizes.append(sum(text_tokens(m["content"]) for m in memory.context_messages(session, prompt(i))))
+        memory.record(session, prompt(i), CODE)
+        fold = memory.pending_fold(session)
+        if fold is not None:
+            assert memory.apply_fold(session, fold, memory.fold(fold[2], fold[3]))
+    assert session.summary == "planets orbit the sun"
+    assert max(sizes[30:]) <= memory.max_context_tokens + 20  # message headers
+    assert max(sizes[30:]) == max(sizes[15:30])
+
+
+def test_record_leaves_the_fold_to_the_caller():
+    memory = SessionMemory(recent_tokens=100, fold_after=4)
+    session = new_session()
+    for i in range(10):
+        memory.record(session, prompt(i), CODE)
+    assert session.summarized == 0 and session.summary is None
+    summarized, start, summary, backlog = memory.pending_fold(session)
+    assert (summarized, summary) == (0, None)
+    assert backlog == session.turns[:start] and len(backlog) >= 4
+
+
+def test_apply_fold_skips_a_session_folded_meanwhile():
+    memory = SessionMemory(recent_tokens=100, fold_after=4)
+    session = new_session()
+    for i in range(10):
+        memory.record(session, prompt(i), CODE)
+    first, second = memory.pending_fold(session), memory.pending_fold(session)
+    assert memory.apply_fold(session, first, "first")
+    assert not memory.apply_fold(session, second, "second")
+    assert session.summary == "first" and session.summarized == first[1]
+
+
+def test_overflow_drops_only_summarized_turns():
+    memory = SessionMemory(recent_tokens=100, fold_after=100, max_turns=6)
+    session = new_session()
+    for i in range(5):
+        memory.record(session, prompt(i), CODE)
+    assert len(session.turns) == 10  # nothing summarized yet, so nothing is dropped
+    memory.fold_after = 2
+    fold = memory.pending_fold(session)
+    assert memory.apply_fold(session, fold, "summary")
+    dropped = min(10 - 6, fold[1])
+    assert len(session.turns) == 10 - dropped
+    assert session.summarized == fold[1] - dropped
+    assert session.turns[-1] == ["a", CODE]
+
+
+def test_failed_summarizer_falls_back_to_an_extractive_summary():
+    def fail(summary, turns, tokens):
+        raise RuntimeError("upstream down")
+    memory = SessionMemory(fail, summary_tokens=100)
+    summary = memory.fold("- User asked: make a cube", [["u", "add a red sphere"], ["a", CODE]])
+    assert summary.splitlines() == ["- User asked: make a cube", "- User asked: add a red sphere"]
+
+
+# === /generate-js with a session ===
+@pytest.fixture
+def session_client(main_module, client, monkeypatch):
+    main = main_module
+    with main.app.app_context():
+        name = f"memory-{uuid.uuid4().hex[:12]}"
+        user = main.User(username=name, email=f"{name}@example.com", password="x")
+        main.db.session.add(user)
+        main.db.session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(user.id))}"}
+    session_id = client.post("/ai/sessions", json={}, headers=headers).get_json()["id"]
+
+    monkeypatch.setattr(main.openai, "api_key", "sk-test")
+    monkeypatch.setattr(main, "match_code_template", lambda prompt, context=None: None)
+    monkeypatch.setattr(main.LLM_POOL, "chat", lambda endpoint, *args, **kwargs: SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=f"```javascript\n{CODE}\n```"))]))
+    monkeypatch.setattr(main.LLM_POOL, "stream", lambda endpoint, messages, **kwargs: iter([CODE]))
+
+    def generate(text, stream=False):
+        response = client.post("/generate-js", json={"prompt": text, "session_id": session_id, "stream": stream},
+                               headers=headers)
+        response.get_data()  # a streamed body runs as it is read
+        return response
+
+    def stored():
+        with main.app.app_context():
+            return main.db.session.get(main.AISession, session_id)
+
+    return SimpleNamespace(generate=generate, stored=stored, session_id=session_id)
+
+
+def events(response):
+    return [(block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.get_data(as_text=True).strip().split("\n\n")]
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_fold_runs_after_the_response(main_module, session_client, monkeypatch, stream):
+    release, folded = threading.Event(), threading.Event()
+
+    def slow_summarizer(summary, turns, tokens):
+        release.wait(5)
+        return "the user builds a solar system"
+
+    memory = SessionMemory(slow_summarizer, recent_tokens=60, fold_after=2)
+    monkeypatch.setattr(main_module, "SESSION_MEMORY", memory)
+    original = memory.apply_fold
+    monkeypatch.setattr(memory, "apply_fold", lambda *args: (original(*args), folded.set())[0])
+
+    for i in range(4):
+        response = session_client.generate(prompt(i), stream=stream)
+        assert response.status_code == 200
+    assert not folded.is_set()  # every response was sent while the summarizer was still blocked
+    release.set()
+    assert folded.wait(5)
+    deadline = time.monotonic() + 5
+    while session_client.session_id in main_module._folding and time.monotonic() < deadline:
+        time.sleep(0.01)  # the fold thread commits after apply_fold
+    session = session_client.stored()
+    assert session.summary == "the user builds a solar system" and session.summarized > 0
+    assert len(session.turns) == 8
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_fallback_answers_are_not_remembered(main_module, session_client, monkeypatch, stream):
+    monkeypatch.setattr(main_module.openai, "api_key", None)
+    response = session_client.generate("add a spinning cube", stream=stream)
+    assert response.status_code == 200
+    assert session_client.stored().turns == []
+
+
+def test_failed_stream_is_not_remembered(main_module, session_client, monkeypatch):
+    def broken(endpoint, messages, **kwargs):
+        yield "const half"
+        raise ConnectionError("upstream reset")
+    monkeypatch.setattr(main_module.LLM_POOL, "stream", broken)
+    done = [data for name, data in events(session_client.generate("add a spinning cube", stream=True))
+            if name == "done"]
+    assert len(done) == 1 and done[0]["fallback"]
+    assert session_client.stored().turns == []
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failing_save_still_sends_one_answer(main_module, session_client, monkeypatch, stream):
+    calls = []
+
+    def remember_turn(session_id, prompt, code):
+        calls.append(code)
+        raise RuntimeError("database is locked")
+    monkeypatch.setattr(main_module, "remember_turn", remember_turn)
+
+    response = session_client.generate("add a spinning cube", stream=stream)
+    assert response.status_code == 200
+    assert calls == [CODE]
+    if stream:
+        assert [(name, data) for name, data in events(response) if name == "done"] == [("done", {"code": CODE})]
+    else:
+        assert response.get_json() == {"code": CODE}
+
+
+def test_folds_run_at_batch_priority_off_the_waiting_cap(main_module, monkeypatch):
+    assert main_module.LLM_POOL.priorities["memory"] == BATCH
+    calls = []
+    monkeypatch.setattr(main_module.openai, "api_key", "sk-test")
+    monkeypatch.setattr(main_module.LLM_POOL, "chat", lambda endpoint, messages, **kwargs: calls.append(
+        (endpoint, kwargs["background"])) or SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="summary"))]))
+    assert main_module.summarize_session(None, [["u", "add a sun"]], 50) == "summary"
+    assert calls == [("memory", True)]
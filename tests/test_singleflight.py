@@ -0,0 +1,87 @@
+import threading
+import time
+from concurrent.futures import TimeoutError
+from contextlib import contextmanager
+
+import pytest
+
+from llm_client import LLMBusyError, LLMClientPool
+from singleflight import SingleFlight
+
+
+def start_leader(flights, key, release, **kwargs):
+    running = threading.Event()
+
+    def fn():
+        running.set()
+        release.wait(5)
+        return "shared"
+    leader = threading.Thread(target=flights.do, args=(key, fn), kwargs=kwargs)
+    leader.start()
+    assert running.wait(5)
+    return leader
+
+
+def test_followers_share_the_result():
+    flights, release = SingleFlight(), threading.Event()
+    leader = start_leader(flights, "k", release)
+    results = []
+    follower = threading.Thread(target=lambda: results.append(flights.do("k", lambda: "own")))
+    follower.start()
+    while flights.stats()["shared"] < 1:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == ["shared"]
+    assert flights.stats()["executed"] == 1
+
+
+def test_followers_give_up_after_the_timeout():
+    flights, release = SingleFlight(), threading.Event()
+    leader = start_leader(flights, "k", release)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        flights.do("k", lambda: "own", timeout=0.1)
+    assert time.monotonic() - started < 1
+    assert flights.stats()["timed_out"] == 1
+    release.set()
+    leader.join(5)
+
+
+def test_followers_hold_a_pool_waiting_slot():
+    pool = LLMClientPool(max_workers=2, max_waiting=1)
+    flights, release = SingleFlight(), threading.Event()
+    leader = start_leader(flights, "k", release)
+    holding = threading.Event()
+
+    @contextmanager
+    def hold():
+        with pool.waiting("explain"):
+            holding.set()
+            yield
+    follower = threading.Thread(target=flights.do, args=("k", lambda: "own"), kwargs={"wait": hold})
+    follower.start()
+    assert holding.wait(5)
+
+    started = time.monotonic()
+    with pytest.raises(LLMBusyError):  # the only slot is taken by the waiting follower
+        flights.do("k", lambda: "own", wait=lambda: pool.waiting("explain"))
+    assert time.monotonic() - started < 0.1
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    with pool.waiting("explain"):  # released again
+        pass
+    assert pool.stats()["explain"]["waiters_rejected"] == 1
+
+
+def test_busy_shared_call_answers_503(main_module, client, monkeypatch):
+    monkeypatch.setattr(main_module.openai, "api_key", "sk-test")
+
+    def busy(key, fn, timeout=None, wait=None):
+        assert timeout == main_module.LLM_POOL.wait_timeout("optimize") and wait is not None
+        raise LLMBusyError("Too many request threads waiting on LLM calls for optimize")
+    monkeypatch.setattr(main_module.LLM_FLIGHTS, "do", busy)
+    response = client.post("/optimize-code", json={"code": "scene.add(cube);"})
+    assert response.status_code == 503
@@ -0,0 +1,26 @@
+import json
+
+
+def product_ids(count, offset=0):
+    with open("products.json", encoding="utf-8") as f:
+        return [p["id"] for p in json.load(f)][offset:offset + count]
+
+
+def test_cached_summary_is_served_without_an_api_key(main_module, client, monkeypatch):
+    ids = product_ids(2)
+    monkeypatch.setattr(main_module.openai, "api_key", "sk-test")
+    monkeypatch.setattr(main_module, "request_product_summary", lambda products: "Both boards suit beginners.")
+    assert client.post("/summarize", json={"product_ids": ids}).status_code == 200
+
+    monkeypatch.setattr(main_module.openai, "api_key", None)
+    response = client.post("/summarize", json={"product_ids": ids})
+    assert response.status_code == 200
+    assert response.get_json() == {"summary": "Both boards suit beginners."}
+    assert response.headers["X-Summary-Cache"] == "hit"
+
+
+def test_cache_miss_without_an_api_key_is_unavailable(main_module, client, monkeypatch):
+    monkeypatch.setattr(main_module.openai, "api_key", None)
+    response = client.post("/summarize", json={"product_ids": product_ids(3, offset=2)})
+    assert response.status_code == 503
+    assert client.post("/summarize", json={"product_ids": ["no-such-product"]}).status_code == 404
@@ -0,0 +1,42 @@
+import pytest
+
+# Prompts the original substring match answered locally, before the router's coverage gate
+NAMED_PROMPTS = [
+    ("add collision detection between spheres", "collision"),
+    ("add gravity to the falling boxes so they bounce realistically", "gravity"),
+    ("make every mesh in my level draggable with the mouse", "draggable"),
+    ("spawn particles when the player jumps over a wall", "particles"),
+    ("set up studio lighting for a product turntable", "lighting"),
+    ("add gravity and collision to the balls", "gravity"),
+]
+
+
+@pytest.mark.parametrize("prompt,name", NAMED_PROMPTS)
+def test_prompt_naming_an_ai_template_is_answered_locally(main_module, prompt, name):
+    assert main_module.match_code_template(prompt) == main_module.TEMPLATE_PACK.get(f"ai/{name}")
+
+
+def test_covered_prompt_still_matches_the_router(main_module):
+    code = main_module.match_code_template("add a red cube")
+    assert code is not None and "ff0000" in code
+
+
+@pytest.mark.parametrize("prompt", [
+    "build a cube shaped tower defense game with enemy waves and a score board",
+    "write a websocket chat client for the lobby",
+])
+def test_loosely_related_prompt_goes_to_the_llm(main_module, prompt):
+    assert main_module.match_code_template(prompt) is None
+
+
+@pytest.mark.parametrize("prompt", [
+    "add syntax highlighting to the code editor panel",
+    "show a tooltip when the cursor hovers over the antigravity button",
+])
+def test_template_names_only_match_whole_words(main_module, prompt):
+    assert main_module.match_code_template(prompt) is None
+
+
+def test_named_template_outranks_a_better_covered_one(main_module):
+    match = main_module.TEMPLATE_ROUTER.route("add a red cube with lighting", languages=("javascript",))[0]
+    assert match.key == "ai/lighting" and match.named